@@ -0,0 +1,2 @@
+# Настройки пакета app — те же, что в корневом config.py (его читает и payments.py)
+from config import Settings, settings  # noqa: F401
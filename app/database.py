@@ -41,5 +41,7 @@ async def init_db():
 
 
 async def close_db():
-    """Закрытие соединения с БД"""
+    """Закрытие соединения с БД (сначала дописываем буфер MessageWriter)"""
+    from .services.message_writer import message_writer  # writer сам импортирует get_db отсюда
+    await message_writer.close()
     await engine.dispose()
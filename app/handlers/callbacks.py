@@ -3,6 +3,7 @@ from telegram import Update
 from telegram.ext import ContextTypes
 from ..services.user_service import UserService
 from ..services.state_service import state_service, UserState
+from ..services.broadcast import BroadcastProgress
 from ..utils.keyboards import Keyboards
 
 logger = logging.getLogger(__name__)
@@ -173,3 +174,28 @@ async def show_admin_users(update: Update, context: ContextTypes.DEFAULT_TYPE):
         parse_mode='Markdown',
         reply_markup=Keyboards.admin_menu()
     )
+
+
+async def start_broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Начать рассылку (админ); незавершённая рассылка продолжается с места остановки"""
+    from ..config import settings
+    from .messages import run_broadcast
+    query = update.callback_query
+    user = update.effective_user
+    
+    progress = await BroadcastProgress.load_async(settings.broadcast_checkpoint)
+    if progress is not None and not progress.finished:
+        await query.edit_message_text(
+            f"📤 Продолжаю прерванную рассылку: осталось {len(progress.pending)} получателей",
+            reply_markup=Keyboards.admin_menu()
+        )
+        context.application.create_task(run_broadcast(context.bot, user.id, progress))
+        return
+    
+    await state_service.set_state(user.id, UserState.WAITING_BROADCAST)
+    
+    await query.edit_message_text(
+        "📤 **Рассылка**\n\n"
+        "Отправьте текст сообщения — он будет разослан всем пользователям.",
+        parse_mode='Markdown'
+    )
@@ -3,8 +3,8 @@ from telegram import Update
 from telegram.ext import ContextTypes
 from ..services.user_service import UserService
 from ..services.state_service import state_service, UserState
-from ..models.message import Message
-from ..database import get_db
+from ..services.message_writer import message_writer
+from ..services.broadcast import broadcaster, BroadcastProgress
 
 logger = logging.getLogger(__name__)
 
@@ -27,6 +27,8 @@ async def handle_text_message(update: Update, context: ContextTypes.DEFAULT_TYPE
         await handle_email_input(update, context)
     elif current_state == UserState.WAITING_MESSAGE:
         await handle_support_message(update, context)
+    elif current_state == UserState.WAITING_BROADCAST:
+        await handle_broadcast_message(update, context)
     else:
         await handle_default_message(update, context)
 
@@ -41,9 +43,7 @@ async def handle_name_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     
     # Сохраняем имя в настройках пользователя
-    settings = await UserService.get_user_settings(user.id)
-    settings['display_name'] = name
-    await UserService.update_user_settings(user.id, settings)
+    await UserService.update_user_settings(user.id, {'display_name': name})
     
     # Переводим в следующее состояние
     await state_service.set_state(user.id, UserState.WAITING_EMAIL)
@@ -65,9 +65,7 @@ async def handle_email_input(update: Update, context: ContextTypes.DEFAULT_TYPE)
         return
     
     # Сохраняем email
-    settings = await UserService.get_user_settings(user.id)
-    settings['email'] = email
-    await UserService.update_user_settings(user.id, settings)
+    await UserService.update_user_settings(user.id, {'email': email})
     
     # Завершаем процесс регистрации
     await state_service.set_state(user.id, UserState.IDLE)
@@ -83,20 +81,19 @@ async def handle_support_message(update: Update, context: ContextTypes.DEFAULT_T
     user = update.effective_user
     message_text = update.message.text
     
-    # Отправляем сообщение админам
+    # Отправляем сообщение админам (параллельно, в пределах лимитов Telegram)
     from ..config import settings
-    for admin_id in settings.admin_ids:
-        try:
-            await context.bot.send_message(
-                admin_id,
-                f"📩 **Новое сообщение в поддержку**\n"
-                f"От: {user.first_name} (@{user.username})\n"
-                f"ID: {user.id}\n\n"
-                f"Сообщение:\n{message_text}",
-                parse_mode='Markdown'
-            )
-        except Exception as e:
-            logger.error(f"Failed to send message to admin {admin_id}: {e}")
+    progress = await broadcaster.send_many(
+        context.bot,
+        settings.admin_ids,
+        f"📩 **Новое сообщение в поддержку**\n"
+        f"От: {user.first_name} (@{user.username})\n"
+        f"ID: {user.id}\n\n"
+        f"Сообщение:\n{message_text}",
+        parse_mode='Markdown'
+    )
+    if progress.failed:
+        logger.error(f"Support message from {user.id} not delivered to {progress.failed} admins")
     
     # Сбрасываем состояние
     await state_service.set_state(user.id, UserState.IDLE)
@@ -107,6 +104,31 @@ async def handle_support_message(update: Update, context: ContextTypes.DEFAULT_T
     )
 
 
+async def handle_broadcast_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Рассылка текста админа всем пользователям (в фоне, с сохранением прогресса)"""
+    user = update.effective_user
+    await state_service.set_state(user.id, UserState.IDLE)
+    
+    if not await UserService.is_admin(user.id):
+        await update.message.reply_text("❌ Недостаточно прав доступа")
+        return
+    
+    recipients = await UserService.get_broadcast_recipients()
+    progress = BroadcastProgress(recipients, update.message.text)
+    await update.message.reply_text(f"📤 Рассылка запущена: {len(recipients)} получателей")
+    context.application.create_task(run_broadcast(context.bot, user.id, progress))
+
+
+async def run_broadcast(bot, admin_id: int, progress: BroadcastProgress):
+    """Выполнить рассылку и отчитаться админу"""
+    from ..config import settings
+    try:
+        await broadcaster.run(bot, progress, checkpoint=settings.broadcast_checkpoint)
+    except Exception as e:
+        logger.error(f"Broadcast interrupted: {e}")
+    await bot.send_message(admin_id, f"📤 **Рассылка завершена**\n\n{progress.summary()}", parse_mode='Markdown')
+
+
 async def handle_default_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработка обычных сообщений"""
     await update.message.reply_text(
@@ -116,17 +138,12 @@ async def handle_default_message(update: Update, context: ContextTypes.DEFAULT_T
 
 
 async def save_message(message):
-    """Сохранение сообщения в БД"""
-    try:
-        async with get_db() as session:
-            msg = Message(
-                telegram_message_id=message.message_id,
-                user_id=message.from_user.id,
-                text=message.text,
-                message_type="text",
-                chat_id=message.chat_id
-            )
-            session.add(msg)
-            await session.commit()
-    except Exception as e:
-        logger.error(f"Failed to save message: {e}")
+    """Сохранение сообщения в БД (в фоне, пачками — ответ пользователю не ждёт INSERT)"""
+    if not message_writer.add(
+        telegram_message_id=message.message_id,
+        user_id=message.from_user.id,
+        text=message.text,
+        message_type="text",
+        chat_id=message.chat_id
+    ):
+        logger.error("Failed to save message: write buffer is full")
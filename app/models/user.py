@@ -19,6 +19,11 @@ class User(Base):
     is_admin = Column(Boolean, default=False)
     is_blocked = Column(Boolean, default=False)
     
+    # Квоты вопросов (ведёт metering.py: списания досверяются пакетами, начисления — сразу)
+    questions_used = Column(Integer, default=0, server_default="0")
+    questions_quota = Column(Integer, default=0, server_default="0")  # купленные пакеты, без бесплатных
+    unlimited_until = Column(DateTime, nullable=True)
+    
     # Временные метки
     created_at = Column(DateTime, default=func.now())
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
@@ -0,0 +1,205 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Dict, Iterable, List, Optional
+
+from telegram.error import BadRequest, Forbidden, RetryAfter, TelegramError
+
+logger = logging.getLogger(__name__)
+
+# Лимиты Telegram: ~30 сообщений/с на бота, не чаще 1 сообщения/с в один чат
+GLOBAL_RATE = 25.0
+PER_CHAT_INTERVAL = 1.0
+
+
+class TokenBucket:
+    """Token bucket: в среднем rate операций в секунду, всплеск до capacity"""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float):
+        """Остановить выдачу токенов (Telegram ответил 429 с retry_after)"""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0.0
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class BroadcastProgress:
+    """Прогресс рассылки: кому уже отправлено, счётчики; сохраняется в JSON для продолжения"""
+
+    def __init__(self, chat_ids: Iterable[int], text: str, done: Iterable[int] = (),
+                 sent: int = 0, failed: int = 0, retried: int = 0):
+        self.chat_ids: List[int] = list(chat_ids)
+        self.text = text
+        self.done = set(done)
+        self.sent = sent
+        self.failed = failed
+        self.retried = retried
+        self.started = time.monotonic()
+        self.sent_at_start = sent
+
+    @property
+    def pending(self) -> List[int]:
+        return [cid for cid in self.chat_ids if cid not in self.done]
+
+    @property
+    def finished(self) -> bool:
+        return len(self.done) >= len(self.chat_ids)
+
+    @property
+    def rate(self) -> float:
+        """Сообщений в секунду в текущем запуске"""
+        elapsed = time.monotonic() - self.started
+        return (self.sent - self.sent_at_start) / elapsed if elapsed > 0 else 0.0
+
+    def summary(self) -> str:
+        return (f"✅ Отправлено: {self.sent}\n❌ Ошибок: {self.failed}\n🔁 Повторов: {self.retried}\n"
+                f"⏱ Скорость: {self.rate:.1f} сообщ./с\n📋 Осталось: {len(self.chat_ids) - len(self.done)}")
+
+    def snapshot(self) -> dict:
+        return {"chat_ids": list(self.chat_ids), "text": self.text, "done": sorted(self.done),
+                "sent": self.sent, "failed": self.failed, "retried": self.retried}
+
+    @staticmethod
+    def write(path: str, data: dict):
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp, path)
+
+    def save(self, path: str):
+        self.write(path, self.snapshot())
+
+    async def save_async(self, path: str):
+        """Снимок — в цикле событий (рассылка продолжает менять done), запись файла — в потоке"""
+        await asyncio.to_thread(self.write, path, self.snapshot())
+
+    @classmethod
+    def load(cls, path: str) -> Optional["BroadcastProgress"]:
+        try:
+            with open(path, encoding="utf-8") as f:
+                return cls(**json.load(f))
+        except FileNotFoundError:
+            return None
+        except (ValueError, TypeError) as e:
+            logger.error(f"Broken broadcast checkpoint {path}: {e}")
+            return None
+
+    @classmethod
+    async def load_async(cls, path: str) -> Optional["BroadcastProgress"]:
+        return await asyncio.to_thread(cls.load, path)
+
+
+class Broadcaster:
+    """Массовая отправка: общий лимит на бота, лимит на чат, ограниченная параллельность,
+    повтор после 429 (RetryAfter) и сетевых ошибок"""
+
+    def __init__(self, rate: float = GLOBAL_RATE, per_chat_interval: float = PER_CHAT_INTERVAL,
+                 concurrency: int = 20, max_retries: int = 3, checkpoint_every: int = 100):
+        self.bucket = TokenBucket(rate)
+        self.per_chat_interval = per_chat_interval
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.checkpoint_every = checkpoint_every
+        self._chat_next: Dict[int, float] = {}  # chat_id -> когда можно писать снова
+
+    async def _chat_slot(self, chat_id: int):
+        now = time.monotonic()
+        ready = self._chat_next.get(chat_id, 0.0)
+        self._chat_next[chat_id] = max(now, ready) + self.per_chat_interval
+        if ready > now:
+            await asyncio.sleep(ready - now)
+        if len(self._chat_next) > 10000:
+            self._chat_next = {k: v for k, v in self._chat_next.items() if v > now}
+
+    async def send(self, bot, chat_id: int, text: str, progress: Optional[BroadcastProgress] = None,
+                   **kwargs) -> bool:
+        """Отправить одно сообщение с учётом лимитов; False — не доставлено"""
+        for attempt in range(self.max_retries + 1):
+            await self._chat_slot(chat_id)
+            await self.bucket.acquire()
+            try:
+                await bot.send_message(chat_id, text, **kwargs)
+                return True
+            except RetryAfter as e:
+                delay = e.retry_after
+                delay = delay.total_seconds() if hasattr(delay, "total_seconds") else float(delay)
+                logger.warning(f"Flood limit, pausing sends for {delay:.0f}s")
+                self.bucket.pause(delay)
+            except (Forbidden, BadRequest) as e:
+                # бот заблокирован / чат не найден — повтор не поможет
+                logger.info(f"Message to {chat_id} not delivered: {e}")
+                return False
+            except TelegramError as e:
+                logger.warning(f"Send to {chat_id} failed (attempt {attempt + 1}): {e}")
+                await asyncio.sleep(min(2 ** attempt, 30))
+            if progress is not None:
+                progress.retried += 1
+        return False
+
+    async def run(self, bot, progress: BroadcastProgress, checkpoint: Optional[str] = None,
+                  **kwargs) -> BroadcastProgress:
+        """Разослать progress.text всем, кому ещё не отправлено; прогресс пишется в checkpoint"""
+        queue: asyncio.Queue = asyncio.Queue()
+        for chat_id in progress.pending:
+            queue.put_nowait(chat_id)
+        progress.started = time.monotonic()
+        progress.sent_at_start = progress.sent
+        handled = 0
+        saving = asyncio.Lock()  # один снимок за раз: файл .tmp общий
+
+        async def worker():
+            nonlocal handled
+            while True:
+                try:
+                    chat_id = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                if await self.send(bot, chat_id, progress.text, progress, **kwargs):
+                    progress.sent += 1
+                else:
+                    progress.failed += 1
+                progress.done.add(chat_id)
+                handled += 1
+                if checkpoint and handled % self.checkpoint_every == 0 and not saving.locked():
+                    async with saving:
+                        await progress.save_async(checkpoint)
+
+        try:
+            await asyncio.gather(*(worker() for _ in range(min(self.concurrency, queue.qsize()) or 1)))
+        finally:
+            if checkpoint:
+                async with saving:
+                    await progress.save_async(checkpoint)
+        logger.info(f"Broadcast finished: sent={progress.sent} failed={progress.failed} "
+                    f"retried={progress.retried} rate={progress.rate:.1f}/s")
+        return progress
+
+    async def send_many(self, bot, chat_ids: Iterable[int], text: str, **kwargs) -> BroadcastProgress:
+        """Одно сообщение нескольким получателям (например, админам) параллельно"""
+        return await self.run(bot, BroadcastProgress(chat_ids, text), **kwargs)
+
+
+# Общий экземпляр: лимиты бота одни на все рассылки процесса
+broadcaster = Broadcaster()
@@ -0,0 +1,90 @@
+import asyncio
+import logging
+from typing import Callable, List, Optional
+
+from sqlalchemy import insert
+
+logger = logging.getLogger(__name__)
+
+
+class MessageWriter:
+    """Фоновая пакетная запись сообщений в БД (write-behind).
+    По умолчанию — get_db и модель Message приложения (импортируются при первой записи)"""
+
+    def __init__(self, batch_size: int = 200, flush_interval: float = 0.5, max_pending: int = 10000,
+                 session_factory: Optional[Callable] = None, table=None):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.session_factory = session_factory
+        self.table = table
+        self.dropped = 0
+        self.written = 0
+        self._rows: List[dict] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._lock: Optional[asyncio.Lock] = None
+        self._closing = False
+
+    def add(self, **row) -> bool:
+        """Поставить строку в очередь на запись; False — буфер переполнен, строка отброшена"""
+        if len(self._rows) >= self.max_pending:
+            self.dropped += 1
+            return False
+        self._rows.append(row)
+        self._ensure_started()
+        if len(self._rows) >= self.batch_size:
+            self._wakeup.set()
+        return True
+
+    def _ensure_started(self):
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._lock = asyncio.Lock()
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        """Сбрасываем буфер каждые flush_interval секунд или при наборе batch_size строк"""
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self):
+        """Записать всё накопленное пачками по batch_size"""
+        if self._lock is None:
+            return
+        if self.session_factory is None or self.table is None:
+            from ..database import get_db
+            from ..models.message import Message
+            self.session_factory = self.session_factory or get_db
+            self.table = Message if self.table is None else self.table
+        async with self._lock:
+            while self._rows:
+                batch = self._rows[:self.batch_size]
+                del self._rows[:self.batch_size]
+                try:
+                    async with self.session_factory() as session:
+                        await session.execute(insert(self.table), batch)
+                    self.written += len(batch)
+                except Exception as e:
+                    self.dropped += len(batch)
+                    logger.error(f"Failed to save {len(batch)} messages: {e}")
+
+    async def close(self):
+        """Остановить фоновую запись, дописав буфер (вызывать при остановке приложения)"""
+        self._closing = True
+        if self._task is not None:
+            # не отменяем задачу: она может быть посреди INSERT, пачка потерялась бы
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        await self.flush()
+        self._closing = False
+
+
+# Глобальный объект
+message_writer = MessageWriter()
@@ -1,30 +1,55 @@
 import logging
-from importlib import import_module
-
-logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
-logger = logging.getLogger("serve")
-
-app = None
-errors = []
-for mod in ["bot", "main.bot", "src.bot", "app.bot"]:
-    try:
-        m = import_module(mod)
-        app = getattr(m, "app")
-        logger.info("serve.py: import %s:app - OK", mod)
-        break
-    except Exception as e:
-        errors.append(f"{mod}: {e}")
-
-if app is None:
-    logger.error("serve.py: failed to import bot:app. Tried: %s", "; ".join(errors))
-    from fastapi import FastAPI
-    from fastapi.responses import JSONResponse
-    app = FastAPI(title="fallback-serve")
-
-    @app.get("/health/live")
-    async def health_live():
-        return JSONResponse({"status": "ok"})
-
-    @app.get("/health/ready")
-    async def health_ready():
-        return JSONResponse({"status": "starting", "import_bot_app": False, "errors": errors})
+from enum import Enum
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import select, update
+
+from ttl_cache import TTLCache
+from ..database import get_db
+from ..models.user import User
+
+logger = logging.getLogger(__name__)
+
+
+class UserState(str, Enum):
+    """Шаг диалога пользователя (значение хранится в users.current_state)"""
+    IDLE = "idle"
+    IN_MENU = "in_menu"
+    WAITING_NAME = "waiting_name"
+    WAITING_EMAIL = "waiting_email"
+    WAITING_MESSAGE = "waiting_message"
+    WAITING_BROADCAST = "waiting_broadcast"
+
+
+class StateService:
+    """Состояние диалога: шаг — в БД (его читает любой воркер, без кэша: следующее сообщение
+    может прийти в другой процесс), данные шага — в памяти процесса, недолго"""
+
+    def __init__(self, data_ttl: float = 3600):
+        self._data: TTLCache[dict] = TTLCache(maxsize=10000, ttl=data_ttl)
+
+    async def get_state(self, telegram_id: int) -> Tuple[UserState, Dict]:
+        """Текущий шаг и его данные; неизвестное значение в БД — IDLE"""
+        async with get_db() as session:
+            raw = (await session.execute(select(User.current_state)
+                                         .where(User.telegram_id == telegram_id))).scalar_one_or_none()
+        try:
+            state = UserState(raw or UserState.IDLE)
+        except ValueError:
+            logger.warning(f"Unknown state {raw!r} of user {telegram_id}, using idle")
+            state = UserState.IDLE
+        return state, dict(self._data.get(telegram_id) or {})
+
+    async def set_state(self, telegram_id: int, state: UserState, data: Optional[dict] = None):
+        """Перевести пользователя на шаг state (данные прошлого шага сбрасываются)"""
+        async with get_db() as session:
+            await session.execute(update(User).where(User.telegram_id == telegram_id)
+                                  .values(current_state=state.value))
+        if data:
+            self._data.set(telegram_id, dict(data))
+        else:
+            self._data.pop(telegram_id)
+
+
+# Глобальный объект
+state_service = StateService()
@@ -1,23 +1,139 @@
+import json
 import logging
+from typing import List, Optional
 
-logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
-logger = logging.getLogger("serve")
+from sqlalchemy import select, update
+from sqlalchemy.exc import IntegrityError
 
-try:
-    from bot import app as bot_app  # type: ignore
-    app = bot_app
-    logger.info("serve.py: import bot:app - OK")
-except Exception as e:
-    logger.exception("serve.py: failed to import bot:app, enabling fallback: %s", e)
-    from fastapi import FastAPI
-    from fastapi.responses import JSONResponse
+from ttl_cache import TTLCache
+from ..config import settings
+from ..database import get_db
+from ..models.user import User
+from ..utils.cache import SingleFlight
 
-    app = FastAPI(title="fallback-serve")
+logger = logging.getLogger(__name__)
 
-    @app.get("/health/live")
-    async def health_live():
-        return JSONResponse({"status": "ok"})
+_NOT_FOUND = object()
+NOT_FOUND_TTL = 5.0  # отсутствие кэшируем ненадолго: пользователя мог только что создать другой воркер
 
-    @app.get("/health/ready")
-    async def health_ready():
-        return JSONResponse({"status": "starting", "import_bot_app": False})
+
+class UserService:
+    """Работа с пользователями: кэш строк User и настроек в памяти процесса,
+    одновременные запросы одного telegram_id склеиваются в один SELECT,
+    запись идёт в БД и сразу обновляет кэш. Кэш — только для чтения: создание и изменение
+    настроек сверяются с БД (её же меняют другие воркеры)"""
+
+    _users = TTLCache(maxsize=10000, ttl=300)
+    _settings = TTLCache(maxsize=10000, ttl=300)
+    _inflight = SingleFlight()
+    _admin_ids: Optional[frozenset] = None
+
+    @classmethod
+    async def get_user(cls, telegram_id: int) -> Optional[User]:
+        """Получить пользователя (из кэша, при промахе — из БД)"""
+        user = cls._users.get(telegram_id)
+        if user is None:
+            user = await cls._inflight.run(("user", telegram_id), lambda: cls._load_user(telegram_id))
+        return None if user is _NOT_FOUND else user
+
+    @classmethod
+    async def _load_user(cls, telegram_id: int):
+        async with get_db() as session:
+            result = await session.execute(select(User).where(User.telegram_id == telegram_id))
+            user = result.scalar_one_or_none()
+        # отсутствие тоже кэшируем (коротко): is_admin для незарегистрированных не ходит в БД
+        if user is None:
+            cls._users.set(telegram_id, _NOT_FOUND, NOT_FOUND_TTL)
+            return _NOT_FOUND
+        cls._users.set(telegram_id, user)
+        return user
+
+    @classmethod
+    async def get_or_create_user(cls, telegram_id: int, username: str = None, first_name: str = None,
+                                 last_name: str = None, language_code: str = None) -> User:
+        """Получить или создать пользователя; профиль обновляется только если изменился"""
+        user = await cls.get_user(telegram_id)
+        profile = {"username": username, "first_name": first_name, "last_name": last_name,
+                   "language_code": language_code or "ru"}
+        if user is None:
+            return await cls._inflight.run(("create", telegram_id), lambda: cls._create_user(telegram_id, profile))
+        changed = {k: v for k, v in profile.items() if getattr(user, k) != v}
+        if changed:
+            async with get_db() as session:
+                await session.execute(update(User).where(User.telegram_id == telegram_id).values(**changed))
+            for k, v in changed.items():
+                setattr(user, k, v)
+            cls._users.set(telegram_id, user)
+        return user
+
+    @classmethod
+    async def _create_user(cls, telegram_id: int, profile: dict) -> User:
+        try:
+            async with get_db() as session:
+                user = User(telegram_id=telegram_id, **profile)
+                session.add(user)
+        except IntegrityError:
+            # параллельно создал другой воркер — берём его строку
+            cls._users.pop(telegram_id)
+            user = await cls._load_user(telegram_id)
+            if user is _NOT_FOUND:
+                raise
+            return user
+        cls._users.set(telegram_id, user)
+        logger.info(f"Created user {telegram_id}")
+        return user
+
+    @classmethod
+    async def is_admin(cls, telegram_id: int) -> bool:
+        """Проверка прав администратора (ADMIN_USER_IDS или флаг в БД)"""
+        if cls._admin_ids is None:
+            cls._admin_ids = frozenset(settings.admin_ids)
+        if telegram_id in cls._admin_ids:
+            return True
+        user = await cls.get_user(telegram_id)
+        return bool(user and user.is_admin)
+
+    @classmethod
+    async def get_user_settings(cls, telegram_id: int) -> dict:
+        """Настройки пользователя для чтения (копия; изменения — через update_user_settings)"""
+        data = cls._settings.get(telegram_id)
+        if data is None:
+            user = await cls.get_user(telegram_id)
+            try:
+                data = json.loads(user.settings or "{}") if user else {}
+            except ValueError:
+                data = {}
+            cls._settings.set(telegram_id, data)
+        return dict(data)
+
+    @classmethod
+    async def update_user_settings(cls, telegram_id: int, changes: dict):
+        """Изменить часть настроек: в одной транзакции читаем строку из БД (FOR UPDATE),
+        дописываем changes и сохраняем — ключи, изменённые другим воркером, не теряются"""
+        async with get_db() as session:
+            current = (await session.execute(select(User.settings).where(User.telegram_id == telegram_id)
+                                             .with_for_update())).scalar_one_or_none()
+            try:
+                data = json.loads(current or "{}")
+            except ValueError:
+                data = {}
+            data.update(changes)
+            raw = json.dumps(data, ensure_ascii=False)
+            await session.execute(update(User).where(User.telegram_id == telegram_id).values(settings=raw))
+        cls._settings.set(telegram_id, data)
+        user = cls._users.get(telegram_id)
+        if user is not None and user is not _NOT_FOUND:
+            user.settings = raw
+
+    @staticmethod
+    async def get_broadcast_recipients() -> List[int]:
+        """telegram_id всех незаблокированных пользователей (для рассылки)"""
+        async with get_db() as session:
+            result = await session.execute(select(User.telegram_id).where(User.is_blocked.is_(False)))
+            return list(result.scalars())
+
+    @classmethod
+    def invalidate(cls, telegram_id: int):
+        """Сбросить кэш пользователя (после изменений в обход сервиса)"""
+        cls._users.pop(telegram_id)
+        cls._settings.pop(telegram_id)
@@ -1,10 +1,13 @@
+from functools import lru_cache
+
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup, KeyboardButton
 
 
 class Keyboards:
-    """Класс для создания клавиатур"""
+    """Класс для создания клавиатур (объекты неизменяемые — строятся один раз и кэшируются)"""
     
     @staticmethod
+    @lru_cache(maxsize=None)
     def main_menu() -> InlineKeyboardMarkup:
         """Главное меню"""
         keyboard = [
@@ -20,6 +23,7 @@ class Keyboards:
         return InlineKeyboardMarkup(keyboard)
     
     @staticmethod
+    @lru_cache(maxsize=None)
     def settings_menu() -> InlineKeyboardMarkup:
         """Меню настроек"""
         keyboard = [
@@ -32,6 +36,7 @@ class Keyboards:
         return InlineKeyboardMarkup(keyboard)
     
     @staticmethod
+    @lru_cache(maxsize=None)
     def admin_menu() -> InlineKeyboardMarkup:
         """Админ меню"""
         keyboard = [
@@ -48,6 +53,7 @@ class Keyboards:
         return InlineKeyboardMarkup(keyboard)
     
     @staticmethod
+    @lru_cache(maxsize=128)
     def confirm_action(action: str) -> InlineKeyboardMarkup:
         """Подтверждение действия"""
         keyboard = [
@@ -59,6 +65,7 @@ class Keyboards:
         return InlineKeyboardMarkup(keyboard)
     
     @staticmethod
+    @lru_cache(maxsize=None)
     def contact_keyboard() -> ReplyKeyboardMarkup:
         """Клавиатура для отправки контакта"""
         keyboard = [
@@ -0,0 +1,75 @@
+# bench/broadcast_bench.py — рассылка через локальный Bot API: цикл с await против Broadcaster
+# Проверяет скорость, соблюдение лимита (сообщ./с не выше --rate) и обработку 429.
+# python -m bench.broadcast_bench --users 300 --latency 0.05 --flood-every 100
+
+import argparse
+import asyncio
+import time
+
+from aiohttp import web
+from telegram import Bot
+from telegram.request import HTTPXRequest
+
+from app.services.broadcast import Broadcaster, BroadcastProgress
+
+
+async def _serve(app: web.Application, port: int) -> web.AppRunner:
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+    return runner
+
+
+def _bot(port: int) -> Bot:
+    return Bot("123:bench", base_url=f"http://127.0.0.1:{port}/bot",
+               request=HTTPXRequest(connection_pool_size=64))
+
+
+async def sequential(bot: Bot, chat_ids) -> tuple:
+    sent = failed = 0
+    started = time.perf_counter()
+    for chat_id in chat_ids:
+        try:
+            await bot.send_message(chat_id, "bench")
+            sent += 1
+        except Exception:
+            failed += 1
+    return sent, failed, time.perf_counter() - started
+
+
+async def main():
+    from bench.fake_bot_api import make_app
+
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--users", type=int, default=300)
+    ap.add_argument("--rate", type=float, default=25.0)
+    ap.add_argument("--concurrency", type=int, default=20)
+    ap.add_argument("--latency", type=float, default=0.05)
+    ap.add_argument("--flood-every", type=int, default=100)
+    ap.add_argument("--port", type=int, default=8183)
+    args = ap.parse_args()
+
+    chat_ids = list(range(1, args.users + 1))
+    api = make_app(args.flood_every, 1, args.latency)
+    runner = await _serve(api, args.port)
+    bot = _bot(args.port)
+    await bot.initialize()
+    try:
+        sent, failed, elapsed = await sequential(bot, chat_ids)
+        print(f"{'sequential':<12} sent={sent:<5} failed={failed:<4} {elapsed:6.2f}s {sent / elapsed:7.1f} msg/s")
+
+        api["calls"].clear()
+        engine = Broadcaster(rate=args.rate, concurrency=args.concurrency)
+        started = time.perf_counter()
+        progress = await engine.run(bot, BroadcastProgress(chat_ids, "bench"))
+        elapsed = time.perf_counter() - started
+        print(f"{'broadcaster':<12} sent={progress.sent:<5} failed={progress.failed:<4} {elapsed:6.2f}s "
+              f"{progress.sent / elapsed:7.1f} msg/s  retried={progress.retried} 429={api['calls']['flood']} "
+              f"(limit {args.rate:.0f}/s)")
+    finally:
+        await bot.shutdown()
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,103 @@
+# bench/checkout_bench.py — задержка checkout (create_order + capture_order) на локальном mock PayPal
+# Прежняя схема (новая сессия и OAuth-запрос на каждый вызов) против PayPalClient с пулом и кэшем токена.
+# Mock отвечает по HTTP, поэтому TLS-рукопожатие в цифрах не видно — в проде разница больше.
+# python -m bench.checkout_bench --orders 200 --latency 0.03
+
+import argparse
+import asyncio
+import base64
+import os
+import statistics
+import time
+
+import aiohttp
+from aiohttp import web
+
+os.environ.setdefault("TELEGRAM_TOKEN", "bench")
+os.environ.setdefault("WEBHOOK_URL", "http://localhost")
+os.environ.setdefault("SECRET_KEY", "bench")
+
+from payments import PayPalClient  # noqa: E402
+
+
+class LegacyClient:
+    """Как было до пула: ClientSession и OAuth-запрос на каждый вызов"""
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url
+
+    async def _token(self) -> str:
+        auth = base64.b64encode(b"id:secret").decode()
+        async with aiohttp.ClientSession() as session:
+            async with session.post(f"{self.base_url}/v1/oauth2/token", headers={"Authorization": f"Basic {auth}"},
+                                    data={"grant_type": "client_credentials"}) as resp:
+                return (await resp.json())["access_token"]
+
+    async def _post(self, path: str, **kwargs) -> dict:
+        token = await self._token()
+        async with aiohttp.ClientSession() as session:
+            async with session.post(f"{self.base_url}{path}", headers={"Authorization": f"Bearer {token}"},
+                                    **kwargs) as resp:
+                return await resp.json()
+
+    async def create_order(self, value: str, plan: str):
+        return await self._post("/v2/checkout/orders", json={"intent": "CAPTURE"})
+
+    async def capture_order(self, order_id: str):
+        return await self._post(f"/v2/checkout/orders/{order_id}/capture")
+
+    async def close(self):
+        pass
+
+
+async def checkout(client) -> float:
+    started = time.perf_counter()
+    order = await client.create_order("10.00", "pro")
+    await client.capture_order(order["id"])
+    return time.perf_counter() - started
+
+
+async def run(name: str, client, orders: int, concurrency: int, calls):
+    calls.clear()
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with sem:
+            return await checkout(client)
+
+    started = time.perf_counter()
+    lat = sorted(await asyncio.gather(*(one() for _ in range(orders))))
+    elapsed = time.perf_counter() - started
+    await client.close()
+    p50 = statistics.median(lat) * 1000
+    p99 = lat[int(len(lat) * 0.99) - 1] * 1000
+    print(f"{name:<10} p50={p50:7.1f}ms p99={p99:7.1f}ms {orders / elapsed:7.1f} checkout/s "
+          f"token_calls={calls['token']} failures_retried={calls['fail']}")
+
+
+async def main():
+    from bench.fake_paypal import make_app
+
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--orders", type=int, default=200)
+    ap.add_argument("--concurrency", type=int, default=10)
+    ap.add_argument("--latency", type=float, default=0.03)
+    ap.add_argument("--fail-every", type=int, default=0)
+    ap.add_argument("--port", type=int, default=8184)
+    args = ap.parse_args()
+
+    api = make_app(args.latency, fail_every=args.fail_every)
+    runner = web.AppRunner(api)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", args.port).start()
+    base = f"http://127.0.0.1:{args.port}"
+    try:
+        if not args.fail_every:  # прежний клиент ошибки не повторяет
+            await run("legacy", LegacyClient(base), args.orders, args.concurrency, api["calls"])
+        await run("pooled", PayPalClient(base, "id", "secret"), args.orders, args.concurrency, api["calls"])
+    finally:
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
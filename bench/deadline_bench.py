@@ -0,0 +1,77 @@
+# bench/deadline_bench.py — время до ответа, когда основная модель «зависла»
+# mock OpenAI: gpt-4o отвечает за --slow сек., gpt-4o-mini — за --fast. Без надзора пользователь
+# ждёт gpt-4o целиком; с Supervisor — дедлайн, отмена запроса, ответ запасной модели.
+# Заодно считает sendChatAction(typing), которые увидел бы пользователь за ожидание.
+# python -m bench.deadline_bench --slow 8 --fast 0.5 --deadline 2 --users 20
+
+import argparse
+import asyncio
+import logging
+import statistics
+import time
+
+from aiohttp import web
+
+from bench.fake_openai import make_app
+import supervisor
+from llm_engine import LLMEngine
+from supervisor import ChatAction, Supervisor
+
+
+async def _serve(app: web.Application, port: int) -> web.AppRunner:
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+    return runner
+
+
+async def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--port", type=int, default=8191)
+    ap.add_argument("--slow", type=float, default=8.0, help="сек. ответа gpt-4o")
+    ap.add_argument("--fast", type=float, default=0.5, help="сек. ответа gpt-4o-mini")
+    ap.add_argument("--deadline", type=float, default=2.0)
+    ap.add_argument("--users", type=int, default=20)
+    args = ap.parse_args()
+    logging.getLogger("supervisor").setLevel(logging.ERROR)  # предупреждения о дедлайне — по одному на запрос
+
+    runner = await _serve(make_app(model_latency={"gpt-4o": args.slow, "gpt-4o-mini": args.fast}), args.port)
+    engine = LLMEngine(api_key="bench", base_url=f"http://127.0.0.1:{args.port}/v1", timeout=60)
+    msgs = [{"role": "user", "content": "Как выбрать ноутбук?"}]
+    sv = Supervisor(fallback_model="gpt-4o-mini", fallback_deadline=args.deadline * 2)
+    actions = 0
+
+    async def typing():
+        nonlocal actions
+        actions += 1
+
+    async def plain():
+        return await engine.complete(msgs, model="gpt-4o")
+
+    async def supervised():
+        async with ChatAction(typing, interval=1.0):
+            return await sv.complete(lambda m: engine.complete(msgs, model=m), "gpt-4o", args.deadline)
+
+    try:
+        for name, fn in (("no deadline", plain), ("supervised", supervised)):
+            actions = 0
+            waits = []
+
+            async def one():
+                started = time.monotonic()
+                ans = await fn()
+                assert ans, "empty answer"
+                waits.append(time.monotonic() - started)
+
+            await asyncio.gather(*(one() for _ in range(args.users)))
+            print(f"{name:<12} p50 {statistics.median(waits):5.2f}s  max {max(waits):5.2f}s  "
+                  f"typing actions/user {actions / args.users:.1f}")
+        print(f"deadlines hit (requests cancelled): {supervisor.deadline_total.value:.0f}, "
+              f"fallback answers: {supervisor.fallback_total.value:.0f}")
+    finally:
+        await engine.aclose()
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
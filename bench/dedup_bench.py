@@ -0,0 +1,77 @@
+# bench/dedup_bench.py — отсев повторных доставок: поток апдейтов с повторами и перестановками,
+# как при медленном вебхуке (Telegram шлёт update_id повторно, до max_connections параллельно).
+# Проверяет, что каждый id обработан ровно один раз, и меряет claim/с.
+# Несколько «воркеров» со своим окном и общим Redis — fakeredis (pip install fakeredis).
+# Отдельно — проход окна по кругу: подряд идущих id больше размера окна, все должны пройти.
+# python -m bench.dedup_bench --updates 100000 --retry 0.2
+
+import argparse
+import asyncio
+import random
+import time
+
+import dedup
+
+
+def deliveries(n: int, retry: float, skew: int, seed: int = 1):
+    rnd = random.Random(seed)
+    stream = []
+    for uid in range(10_000, 10_000 + n):
+        stream.append(uid)
+        while rnd.random() < retry:
+            stream.append(uid)  # повторная доставка, иногда не одна
+    # перестановки в пределах skew (параллельные соединения Telegram)
+    keyed = [(i + rnd.uniform(0, skew), uid) for i, uid in enumerate(stream)]
+    return [uid for _, uid in sorted(keyed)]
+
+
+def check_wrap(size: int = 8, laps: int = 3) -> bool:
+    """size*laps подряд идущих id через окно size: каждый новый, каждый повтор отсечён."""
+    window = dedup.UpdateWindow(size)
+    fresh = all(window.add(uid) for uid in range(size * laps))
+    repeated = not any(window.add(uid) for uid in range(size * (laps - 1), size * laps))
+    return fresh and repeated
+
+
+async def run(name: str, workers, stream):
+    processed = []
+    started = time.perf_counter()
+    for i, uid in enumerate(stream):
+        if await workers[i % len(workers)].claim(uid):
+            processed.append(uid)
+    elapsed = time.perf_counter() - started
+    once = len(processed) == len(set(processed)) == len(set(stream))
+    print(f"{name:<18} {len(stream) / elapsed:9.0f} claims/s  processed={len(processed)} "
+          f"unique={len(set(stream))} exactly-once={once}")
+
+
+async def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--updates", type=int, default=100000, help="больше окна (65536) — окно проходит круг")
+    ap.add_argument("--retry", type=float, default=0.2, help="вероятность повторной доставки")
+    ap.add_argument("--skew", type=int, default=40, help="разброс порядка (max_connections)")
+    args = ap.parse_args()
+
+    for size in (8, 1 << 16):
+        ok = check_wrap(size)
+        print(f"window {size} wraps: {'ok' if ok else 'FAIL: new ids dropped after a full lap'}")
+        if not ok:
+            raise SystemExit(1)
+
+    stream = deliveries(args.updates, args.retry, args.skew)
+    before = dedup.duplicates_total.value
+    await run("window", [dedup.UpdateDedup()], stream)
+    print(f"{'':<18} retries absorbed: {dedup.duplicates_total.value - before:.0f} "
+          f"(stale: {dedup.stale_total.value:.0f})")
+    try:
+        from fakeredis import FakeAsyncRedis
+    except ImportError:
+        print("fakeredis не установлен — пропускаю общий Redis")
+        return
+    server = FakeAsyncRedis(decode_responses=True)
+    await run("4 workers+redis", [dedup.UpdateDedup(client=server) for _ in range(4)], stream)
+    await run("4 workers, local", [dedup.UpdateDedup() for _ in range(4)], stream)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
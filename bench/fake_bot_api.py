@@ -0,0 +1,115 @@
+# bench/fake_bot_api.py — локальный Bot API: отвечает ok на любые методы
+# Ответы пользователю (sendMessage/editMessageText/...) пишутся в app["sent"]; app["listeners"] —
+# колбэки (метод, параметры) на каждый вызов, по ним нагрузочный тест меряет время до ответа.
+# getFile + /file/bot<token>/<path> отдают одно и то же голосовое (2 с OGG/Opus, если есть ffmpeg).
+# python -m bench.fake_bot_api --port 8182 [--flood-every 500 --retry-after 1]
+
+import argparse
+import asyncio
+import itertools
+import os
+import subprocess
+import tempfile
+import time
+from collections import Counter, deque
+from typing import Callable, Deque, List
+
+from aiohttp import web
+
+from voice import ffmpeg_exe
+
+_message_ids = itertools.count(1)
+
+
+RECORDED = frozenset(("sendmessage", "editmessagetext", "sendphoto", "sendvoice", "sendaudio",
+                      "senddocument", "answercallbackquery"))
+
+
+def sample_voice(seconds: float = 2.0) -> bytes:
+    """Тон в OGG/Opus, как голосовое Telegram; без ffmpeg — только заголовок OggS (для stub без перекодирования)."""
+    exe = ffmpeg_exe()
+    if exe:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "voice.ogg")
+            subprocess.run([exe, "-hide_banner", "-loglevel", "error", "-y", "-f", "lavfi",
+                            "-i", f"sine=frequency=440:duration={seconds}", "-c:a", "libopus", "-b:a", "16k", path],
+                           check=True, capture_output=True)
+            with open(path, "rb") as f:
+                return f.read()
+    return b"OggS" + bytes(4096)
+
+
+def make_app(flood_every: int = 0, retry_after: int = 1, latency: float = 0.0,
+             record: int = 100_000, voice: bytes = b"") -> web.Application:
+    """flood_every > 0 — каждый N-й sendMessage получает 429 с retry_after (как при флуд-лимите);
+    latency — задержка ответа, как у настоящего api.telegram.org; record — сколько последних
+    ответов пользователю хранить в app["sent"]"""
+    calls: Counter = Counter()
+    sent: Deque[dict] = deque(maxlen=record)
+    listeners: List[Callable[[str, dict], None]] = []
+
+    async def call_method(request: web.Request) -> web.Response:
+        method = request.match_info["method"].lower()
+        calls[method] += 1
+        if request.content_type == "application/json":
+            params = await request.json()
+        else:
+            params = dict(await request.post()) if request.can_read_body else {}
+        if latency:
+            await asyncio.sleep(latency)
+        if method in RECORDED:
+            sent.append({"ts": time.time(), "method": method, "chat_id": params.get("chat_id"),
+                         "text": params.get("text")})
+        for listener in listeners:
+            listener(method, params)
+        if flood_every and method == "sendmessage" and calls[method] % flood_every == 0:
+            calls["flood"] += 1
+            return web.json_response({"ok": False, "error_code": 429,
+                                      "description": f"Too Many Requests: retry after {retry_after}",
+                                      "parameters": {"retry_after": retry_after}}, status=429)
+        if method in ("sendmessage", "editmessagetext"):
+            chat_id = int(params.get("chat_id", 0) or 0)
+            result = {
+                "message_id": int(params.get("message_id", 0) or next(_message_ids)),
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "text": params.get("text", ""),
+            }
+        elif method == "getfile":
+            file_id = str(params.get("file_id", ""))
+            result = {"file_id": file_id, "file_unique_id": "u" + file_id[-16:], "file_size": len(voice_data),
+                      "file_path": f"voice/{file_id}.oga"}
+        elif method == "getme":
+            result = {"id": 1, "is_bot": True, "first_name": "bench", "username": "bench_bot"}
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+    async def download(request: web.Request) -> web.Response:
+        calls["download"] += 1
+        if latency:
+            await asyncio.sleep(latency)
+        return web.Response(body=voice_data, content_type="audio/ogg")
+
+    voice_data = voice or sample_voice()
+    app = web.Application()
+    app["calls"] = calls
+    app["sent"] = sent
+    app["listeners"] = listeners
+    app.router.add_post("/bot{token}/{method}", call_method)
+    app.router.add_get("/file/bot{token}/{path:.+}", download)
+    return app
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--port", type=int, default=8182)
+    ap.add_argument("--flood-every", type=int, default=0)
+    ap.add_argument("--retry-after", type=int, default=1)
+    ap.add_argument("--latency", type=float, default=0.0)
+    args = ap.parse_args()
+    web.run_app(make_app(args.flood_every, args.retry_after, args.latency), port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+# bench/fake_openai.py — локальный mock OpenAI Chat Completions
+# Задержка — число или распределение: "1.5", "uniform:0.5:2", "normal:1:0.3",
+# "lognormal:1:0.6" (медиана, sigma — длинный хвост, как у настоящего API), "exp:1" (среднее).
+# python -m bench.fake_openai --port 8181 --latency lognormal:1:0.6 --model-latency gpt-4o=30 --error-rate 0.01
+
+import argparse
+import asyncio
+import json
+import math
+import random
+import time
+from typing import Callable, Dict, Optional, Union
+
+from aiohttp import web
+
+
+Latency = Union[float, str, Callable[[], float]]
+
+
+def latency_sampler(spec: Latency, rng: Optional[random.Random] = None) -> Callable[[], float]:
+    if callable(spec):
+        return spec
+    if isinstance(spec, (int, float)):
+        return lambda: float(spec)
+    rng = rng or random.Random()
+    kind, _, rest = spec.partition(":")
+    args = [float(x) for x in rest.split(":") if x]
+    if not rest:
+        value = float(kind)
+        return lambda: value
+    if kind == "uniform":
+        return lambda: rng.uniform(args[0], args[1])
+    if kind == "normal":
+        return lambda: max(0.0, rng.gauss(args[0], args[1]))
+    if kind == "lognormal":
+        mu = math.log(args[0])
+        return lambda: rng.lognormvariate(mu, args[1])
+    if kind == "exp":
+        return lambda: rng.expovariate(1 / args[0])
+    raise ValueError(f"unknown latency distribution: {spec}")
+
+
+def make_app(latency: Latency = 1.0, reply: str = "Тестовый ответ модели.",
+             model_latency: Optional[Dict[str, Latency]] = None, error_rate: float = 0.0,
+             seed: Optional[int] = None) -> web.Application:
+    """error_rate — доля ответов 500 (как сбой на стороне OpenAI); seed — воспроизводимые задержки"""
+    rng = random.Random(seed)
+    default = latency_sampler(latency, rng)
+    per_model = {name: latency_sampler(spec, rng) for name, spec in (model_latency or {}).items()}
+
+    def delay_for(model: Optional[str]) -> float:
+        return per_model.get(model, default)()
+
+    async def chat_completions(request: web.Request) -> web.Response:
+        body = await request.json()
+        if error_rate and rng.random() < error_rate:
+            await asyncio.sleep(delay_for(body.get("model")) / 10)
+            return web.json_response({"error": {"message": "The server had an error", "type": "server_error"}},
+                                     status=500)
+        if body.get("stream"):
+            return await _stream(request, body)
+        await asyncio.sleep(delay_for(body.get("model")))
+        return web.json_response({
+            "id": "chatcmpl-bench",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "gpt-4o-mini"),
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": reply}}],
+            "usage": {"prompt_tokens": 10, "completion_tokens": 10, "total_tokens": 20},
+        })
+
+    async def _stream(request: web.Request, body: dict) -> web.StreamResponse:
+        # ответ кусками по словам; суммарно — та же задержка latency
+        resp = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await resp.prepare(request)
+        words = reply.split(" ")
+        delay = delay_for(body.get("model"))
+        for i, word in enumerate(words):
+            await asyncio.sleep(delay / len(words))
+            chunk = {
+                "id": "chatcmpl-bench", "object": "chat.completion.chunk", "created": int(time.time()),
+                "model": body.get("model", "gpt-4o-mini"),
+                "choices": [{"index": 0, "finish_reason": None,
+                             "delta": {"content": word if i == 0 else " " + word}}],
+            }
+            await resp.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode())
+        await resp.write(b"data: [DONE]\n\n")
+        await resp.write_eof()
+        return resp
+
+    app = web.Application()
+    app.router.add_post("/v1/chat/completions", chat_completions)
+    return app
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--port", type=int, default=8181)
+    ap.add_argument("--latency", default="1.0", help="сек. или распределение: lognormal:1:0.6")
+    ap.add_argument("--model-latency", default="", help="задержка по модели: gpt-4o=30,gpt-4o-mini=uniform:0.5:2")
+    ap.add_argument("--error-rate", type=float, default=0.0)
+    ap.add_argument("--seed", type=int, default=None)
+    args = ap.parse_args()
+    web.run_app(make_app(args.latency, model_latency=parse_model_latency(args.model_latency),
+                         error_rate=args.error_rate, seed=args.seed), port=args.port)
+
+
+def parse_model_latency(value: str) -> Dict[str, str]:
+    """"gpt-4o=30,gpt-4o-mini=uniform:0.5:2" -> {модель: задержка}"""
+    out = {}
+    for part in filter(None, value.split(",")):
+        name, _, spec = part.partition("=")
+        out[name.strip()] = spec.strip()
+    return out
+
+
+if __name__ == "__main__":
+    main()
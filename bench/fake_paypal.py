@@ -0,0 +1,103 @@
+# bench/fake_paypal.py — локальный PayPal REST API: OAuth-токен, ордера (создание, capture, статус),
+# проверка подписи вебхуков
+# python -m bench.fake_paypal --port 8184 --latency 0.05
+
+import argparse
+import asyncio
+import itertools
+from collections import Counter
+
+from aiohttp import web
+
+_order_ids = itertools.count(1)
+
+
+def make_app(latency: float = 0.0, expires_in: int = 32400, fail_every: int = 0) -> web.Application:
+    """latency — задержка каждого ответа; fail_every > 0 — каждый N-й запрос к API отвечает 503"""
+    calls: Counter = Counter()
+    seen_request_ids: dict = {}
+    orders: dict = {}
+
+    async def _delay():
+        if latency:
+            await asyncio.sleep(latency)
+
+    async def token(request: web.Request) -> web.Response:
+        calls["token"] += 1
+        await _delay()
+        return web.json_response({"access_token": f"tok-{calls['token']}", "token_type": "Bearer",
+                                  "expires_in": expires_in})
+
+    async def _api(request: web.Request, name: str, make) -> web.Response:
+        calls[name] += 1
+        await _delay()
+        if fail_every and sum(calls.values()) % fail_every == 0:
+            calls["fail"] += 1
+            return web.json_response({"name": "SERVICE_UNAVAILABLE"}, status=503)
+        if not request.headers.get("Authorization", "").startswith("Bearer tok-"):
+            return web.json_response({"error": "invalid_token"}, status=401)
+        rid = request.headers.get("PayPal-Request-Id")
+        if rid and rid in seen_request_ids:
+            calls["replayed"] += 1
+            return web.json_response(seen_request_ids[rid], status=200)
+        body = make()
+        if rid:
+            seen_request_ids[rid] = body
+        return web.json_response(body, status=201)
+
+    async def create_order(request: web.Request) -> web.Response:
+        unit = ((await request.json()).get("purchase_units") or [{}])[0]
+
+        def make():
+            order_id = f"ORDER{next(_order_ids)}"
+            orders[order_id] = {"id": order_id, "status": "CREATED", "purchase_units": [unit],
+                                "links": [{"rel": "approve", "href": f"https://paypal.test/approve/{order_id}"}]}
+            return orders[order_id]
+        return await _api(request, "create_order", make)
+
+    async def capture_order(request: web.Request) -> web.Response:
+        order_id = request.match_info["order_id"]
+        order = orders.setdefault(order_id, {"id": order_id, "purchase_units": [{}]})
+        if order.get("status") == "COMPLETED" and request.headers.get("PayPal-Request-Id") not in seen_request_ids:
+            calls["capture_order"] += 1
+            return web.json_response({"name": "UNPROCESSABLE_ENTITY",
+                                      "details": [{"issue": "ORDER_ALREADY_CAPTURED"}]}, status=422)
+
+        def make():
+            order["status"] = "COMPLETED"
+            return order
+        return await _api(request, "capture_order", make)
+
+    async def get_order(request: web.Request) -> web.Response:
+        order = orders.get(request.match_info["order_id"])
+        calls["get_order"] += 1
+        if order is None:
+            return web.json_response({"name": "RESOURCE_NOT_FOUND"}, status=404)
+        return web.json_response(order)
+
+    async def verify_webhook(request: web.Request) -> web.Response:
+        calls["verify_webhook"] += 1
+        await _delay()
+        return web.json_response({"verification_status": "SUCCESS"})
+
+    app = web.Application()
+    app["calls"] = calls
+    app.router.add_post("/v1/oauth2/token", token)
+    app.router.add_post("/v2/checkout/orders", create_order)
+    app.router.add_post("/v2/checkout/orders/{order_id}/capture", capture_order)
+    app.router.add_get("/v2/checkout/orders/{order_id}", get_order)
+    app.router.add_post("/v1/notifications/verify-webhook-signature", verify_webhook)
+    return app
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--port", type=int, default=8184)
+    ap.add_argument("--latency", type=float, default=0.0)
+    ap.add_argument("--fail-every", type=int, default=0)
+    args = ap.parse_args()
+    web.run_app(make_app(args.latency, fail_every=args.fail_every), port=args.port)
+
+
+if __name__ == "__main__":
+    main()
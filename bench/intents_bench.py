@@ -0,0 +1,91 @@
+# bench/intents_bench.py — маршрутизация on_text: прежние последовательные regex против IntentRouter
+# Корпус — типичные сообщения (RU/EN/HE, вопросы, просьбы о сторис/рассказах/био, длинные тексты).
+# Заодно проверяет, что намерение совпадает с прежней логикой на всём корпусе.
+# python -m bench.intents_bench --repeat 200
+
+import argparse
+import random
+import re
+import time
+
+from intents import IntentRouter
+
+# ---- прежняя логика из bot.py ----
+STORY_TRIG = re.compile(r'^\s*(напиши|сделай|сгенерируй)\b.*\b(сторис|story|инста-?сторис)\b', re.IGNORECASE | re.S)
+NARR_TRIG = re.compile(r'^\s*(напиши|сделай|сгенерируй)\b.*\b(рассказ|эссе|сочинение|повесть|short\s+story|essay)\b', re.IGNORECASE | re.S)
+COPY_TRIG = re.compile(r'(пост\s+приветств|приветстви[ея]\b|описани[ея]\b|био\b|bio\b)', re.IGNORECASE)
+
+
+def extract_topic_after_keyword(txt, keywords):
+    pattern = re.compile(r'(' + '|'.join(map(re.escape, keywords)) + r')\b', re.IGNORECASE)
+    m = pattern.search(txt)
+    tail = txt[m.end():] if m else txt
+    tail = re.sub(r'^\s*(про|о|about)\b', '', tail, flags=re.IGNORECASE).strip()
+    return tail if tail else txt.strip()
+
+
+def legacy_route(text):
+    if STORY_TRIG.match(text):
+        return "story", extract_topic_after_keyword(text, ["сторис", "story", "инста-сторис", "инста сторис"])
+    if NARR_TRIG.match(text):
+        return "narrative", extract_topic_after_keyword(text, ["рассказ", "эссе", "сочинение", "повесть", "short story", "essay"])
+    if COPY_TRIG.search(text):
+        m = re.search(r'меня зовут\s+([A-Za-zА-Яа-яЁё\-]+)', text, re.IGNORECASE)
+        return "copy", m.group(1) if m else None
+    return "default", ""
+
+
+CORPUS = [
+    "Как приготовить борщ без свёклы?",
+    "Почему небо голубое?",
+    "Объясни, что такое инфляция, простыми словами",
+    "What is the difference between TCP and UDP?",
+    "How do I center a div in CSS?",
+    "מה מזג האוויר מחר בתל אביב?",
+    "איך לכתוב קורות חיים טובים?",
+    "Напиши сторис про утренний кофе в Тель-Авиве",
+    "сделай инста-сторис о поездке на море",
+    "Напиши рассказ про кота, который жил на маяке",
+    "Сгенерируй эссе о будущем искусственного интеллекта",
+    "напиши short story about a lighthouse keeper",
+    "Напиши пост приветствие, меня зовут Анна, я дизайнер интерьеров",
+    "Нужно описание для моего профиля, меня зовут Игорь",
+    "write a bio for my instagram, I'm a yoga teacher",
+    "Привет! Расскажи, какие книги почитать летом?",
+    "Дай план тренировок на неделю для начинающего",
+    "Можешь перевести на английский: я опаздываю на встречу",
+    "Переведи на иврит: спасибо за помощь",
+    "Сколько будет 17 * 23?",
+    ("Слушай, у меня длинный вопрос. Я переезжаю в другую страну, и мне нужно понять, как лучше "
+     "организовать документы, какие справки взять, как быть с медицинской страховкой, банком и "
+     "школой для ребёнка. Подскажи, пожалуйста, с чего начать и в каком порядке всё делать."),
+    ("I have been thinking about switching careers from accounting to software development. "
+     "What skills should I learn first, how long does it usually take, and is it realistic at 35?"),
+    "напиши мне письмо начальнику с просьбой об отпуске",
+    "сделай список покупок на неделю для семьи из трёх человек",
+]
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--repeat", type=int, default=200)
+    args = ap.parse_args()
+
+    router = IntentRouter()
+    mismatches = [t for t in CORPUS if legacy_route(t)[0] != router.route(t).intent.name]
+    print(f"intent mismatches vs legacy: {len(mismatches)}/{len(CORPUS)}")
+    for t in mismatches:
+        print("  ", legacy_route(t)[0], router.route(t).intent.name, t[:60])
+
+    msgs = CORPUS * args.repeat
+    random.Random(1).shuffle(msgs)
+    for name, fn in (("legacy", legacy_route), ("router", router.route)):
+        started = time.perf_counter()
+        for t in msgs:
+            fn(t)
+        elapsed = time.perf_counter() - started
+        print(f"{name:<8} {len(msgs) / elapsed:10.0f} msg/s  {elapsed / len(msgs) * 1e6:6.2f} us/msg")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+# bench/keyboards_bench.py — /menu: прежняя сборка клавиатуры на каждый вызов против keyboards.py
+# Замер — сборка разметки + тело запроса sendMessage (как его формирует сессия aiogram).
+# Заодно проверяет, что поля формы совпадают с обычной AiohttpSession.
+# python -m bench.keyboards_bench --n 20000
+
+import argparse
+import os
+import time
+
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123:abc")
+
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.methods import SendMessage
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+
+import keyboards
+
+
+# ---- прежняя логика из bot.py ----
+def legacy_inline_menu(ui_lang: str = "ru"):
+    t = {
+        "help": {"ru": "Помощь", "en": "Help", "he": "עזרה"},
+        "pay": {"ru": "Оплатить", "en": "Pay", "he": "תשלום"},
+        "refs": {"ru": "Рефералы", "en": "Referrals", "he": "הפניות"},
+        "profile": {"ru": "Профиль", "en": "Profile", "he": "פרופיל"},
+        "lang": {"ru": "Сменить язык", "en": "Change language", "he": "שנה שפה"},
+        "mode": {"ru": "Режим ответа", "en": "Reply mode", "he": "מצב תגובה"},
+        "tts": {"ru": "Озвучить (TTS)", "en": "Speak (TTS)", "he": "המרה לדיבור"},
+        "asr": {"ru": "Показать расшифровку", "en": "Show transcript", "he": "הצג תמליל"},
+        "close": {"ru": "Скрыть", "en": "Close", "he": "סגור"},
+    }
+    def _(k): return t[k].get(ui_lang, t[k]["ru"])
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text=_("help"), callback_data="help"),
+         InlineKeyboardButton(text=_("pay"), callback_data="pay")],
+        [InlineKeyboardButton(text=_("refs"), callback_data="refs"),
+         InlineKeyboardButton(text=_("profile"), callback_data="profile")],
+        [InlineKeyboardButton(text=_("lang"), callback_data="lang"),
+         InlineKeyboardButton(text=_("mode"), callback_data="mode")],
+        [InlineKeyboardButton(text=_("tts"), callback_data="tts"),
+         InlineKeyboardButton(text=_("asr"), callback_data="asr")],
+        [InlineKeyboardButton(text=_("close"), callback_data="close_menu")],
+    ])
+
+
+def fields(form) -> dict:
+    return {opts["name"]: value for opts, _, value in form._fields}
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--n", type=int, default=20000)
+    args = ap.parse_args()
+
+    bot = Bot(token=os.environ["TELEGRAM_BOT_TOKEN"])
+    plain, prebuilt = AiohttpSession(), keyboards.PrebuiltMarkupSession()
+    langs = ("ru", "en", "he")
+
+    for lang in langs:
+        a = fields(plain.build_form_data(bot, SendMessage(chat_id=1, text="Меню действий:",
+                                                          reply_markup=legacy_inline_menu(lang))))
+        b = fields(prebuilt.build_form_data(bot, SendMessage(chat_id=1, text="Меню действий:",
+                                                             reply_markup=keyboards.inline_menu(lang))))
+        print(f"{lang}: form fields match: {a == b}")
+
+    for name, session, build in (("legacy", plain, legacy_inline_menu),
+                                 ("cached", prebuilt, keyboards.inline_menu)):
+        started = time.perf_counter()
+        for i in range(args.n):
+            method = SendMessage(chat_id=i, text="Меню действий:", reply_markup=build(langs[i % 3]))
+            session.build_form_data(bot, method)
+        elapsed = time.perf_counter() - started
+        print(f"{name:<8} {args.n / elapsed:10.0f} menus/s  {elapsed / args.n * 1e6:7.1f} us/menu")
+
+
+if __name__ == "__main__":
+    main()
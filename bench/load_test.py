@@ -0,0 +1,300 @@
+# bench/load_test.py — нагрузочный тест bot:app под uvicorn, полностью офлайн (для CI)
+# Поднимает mock OpenAI (задержка — распределение) и mock Bot API, запускает uvicorn bot:app
+# отдельным процессом и гоняет --users пользователей по замкнутому циклу: апдейт из смеси
+# (bench/updates.py) -> ответ бота пользователю -> следующий апдейт.
+# Меряется: апдейтов/с, ack вебхука и время до ответа пользователю (p50/p95/p99, по типам),
+# пиковый RSS процесса бота. Ответ — первый sendMessage/editMessageText/... в чат,
+# для кнопок — answerCallbackQuery с их id.
+# --max-p99/--min-rps/--max-rss-mb — пороги для CI (код выхода 1), --json — отчёт в файл.
+# python -m bench.load_test --users 50 --updates 2000 --latency lognormal:0.8:0.5 --json load.json
+
+import argparse
+import asyncio
+import json
+import os
+import resource
+import socket
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+import aiohttp
+from aiohttp import web
+
+from bench.fake_bot_api import make_app as make_bot_api
+from bench.fake_openai import make_app as make_openai, parse_model_latency
+from bench.updates import KINDS, UpdateGenerator, kind_of, parse_mix
+
+SECRET = "bench-secret"
+WEBHOOK_PATH = "/telegram/railway123"
+
+
+def percentile(values, q: float) -> float:
+    values = sorted(values)
+    idx = min(len(values) - 1, max(0, int(round(q * (len(values) - 1)))))
+    return values[idx]
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def _serve(app: web.Application, port: int) -> web.AppRunner:
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+    return runner
+
+
+async def _wait_ready(session: aiohttp.ClientSession, url: str, proc: subprocess.Popen, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"bot:app завершился с кодом {proc.returncode}")
+        try:
+            async with session.get(url + "/healthz") as resp:
+                if resp.status == 200:
+                    return
+        except aiohttp.ClientError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError("bot:app не поднялся")
+
+
+def peak_rss_mb(pid: int) -> Optional[float]:
+    """VmHWM из /proc (Linux); None — нет /proc, см. rusage после выхода процесса."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+class Replies:
+    """Ждёт первого ответа бота на апдейт: по chat_id или по id callback_query."""
+
+    REPLY_METHODS = frozenset(("sendmessage", "editmessagetext", "sendphoto", "sendvoice", "sendaudio",
+                               "senddocument"))
+
+    def __init__(self):
+        self.waiters: Dict[str, asyncio.Future] = {}
+
+    def expect(self, key: str) -> asyncio.Future:
+        fut = self.waiters[key] = asyncio.get_running_loop().create_future()
+        return fut
+
+    def forget(self, key: str):
+        self.waiters.pop(key, None)
+
+    def __call__(self, method: str, params: dict):
+        if method == "answercallbackquery":
+            key = f"cb:{params.get('callback_query_id')}"
+        elif method in self.REPLY_METHODS:
+            key = f"chat:{params.get('chat_id')}"
+        else:
+            return
+        fut = self.waiters.pop(key, None)
+        if fut is not None and not fut.done():
+            fut.set_result(time.perf_counter())
+
+
+class Stats:
+    def __init__(self):
+        self.ack: List[float] = []
+        self.reply: Dict[str, List[float]] = defaultdict(list)
+        self.status: Dict[int, int] = defaultdict(int)
+        self.timeouts = 0
+        self.silent = 0  # обработано (ack в режиме sync), но пользователю ничего не ушло
+
+    def summary(self, q=(0.5, 0.95, 0.99)) -> Dict[str, object]:
+        def pct(values):
+            return {f"p{int(x * 100)}": round(percentile(values, x), 4) for x in q} if values else None
+        everything = [v for values in self.reply.values() for v in values]
+        return {
+            "ack": pct(self.ack),
+            "reply": pct(everything),
+            "reply_by_kind": {kind: dict(pct(v), n=len(v)) for kind, v in sorted(self.reply.items())},
+            "status": dict(self.status),
+            "timeouts": self.timeouts,
+            "silent": self.silent,
+        }
+
+
+async def user_loop(session: aiohttp.ClientSession, url: str, user_id: int, gen: UpdateGenerator,
+                    replies: Replies, stats: Optional[Stats], budget: List[int], reply_timeout: float,
+                    think: float, sync_mode: bool):
+    while budget[0] > 0:
+        budget[0] -= 1
+        update = gen.next(user_id)
+        kind = kind_of(update)
+        key = f"cb:{update['callback_query']['id']}" if kind == "callback" else f"chat:{user_id}"
+        fut = replies.expect(key)
+        started = time.perf_counter()
+        try:
+            async with session.post(url + WEBHOOK_PATH, json=update,
+                                    headers={"X-Telegram-Bot-Api-Secret-Token": SECRET}) as resp:
+                await resp.read()
+                status = resp.status
+        except aiohttp.ClientError:
+            status = 0
+        acked = time.perf_counter()
+        try:
+            if status != 200 or (sync_mode and not fut.done()):
+                # sync: к ack обработка закончена — не ответил сейчас, уже не ответит
+                done_at = fut.result() if fut.done() else None
+            else:
+                done_at = await asyncio.wait_for(fut, reply_timeout)
+        except asyncio.TimeoutError:
+            done_at = None
+            if stats is not None:
+                stats.timeouts += 1
+        finally:
+            replies.forget(key)
+        if stats is not None:
+            stats.status[status] += 1
+            stats.ack.append(acked - started)
+            if done_at is not None:
+                stats.reply[kind].append(done_at - started)
+            elif status == 200 and sync_mode:
+                stats.silent += 1
+        if think:
+            await asyncio.sleep(think)
+
+
+async def drive(session, url, users: int, updates: int, gen, replies, stats, args) -> float:
+    budget = [updates]
+    sync_mode = os.environ.get("UPDATE_MODE", "sync") != "queue"
+    started = time.perf_counter()
+    await asyncio.gather(*(user_loop(session, url, 100_000 + i, gen, replies, stats, budget,
+                                     args.reply_timeout, args.think, sync_mode) for i in range(users)))
+    return time.perf_counter() - started
+
+
+async def main_async(args) -> int:
+    port = args.port or _free_port()
+    openai_port, bot_api_port = _free_port(), _free_port()
+    openai_runner = await _serve(make_openai(args.latency, model_latency=parse_model_latency(args.model_latency),
+                                             error_rate=args.error_rate, seed=args.seed), openai_port)
+    bot_api = make_bot_api(latency=args.bot_api_latency)
+    replies = Replies()
+    bot_api["listeners"].append(replies)
+    bot_api_runner = await _serve(bot_api, bot_api_port)
+    env = dict(os.environ,
+               TELEGRAM_BOT_TOKEN="123456:BENCH",
+               TELEGRAM_API_BASE=f"http://127.0.0.1:{bot_api_port}",
+               OPENAI_API_KEY="sk-bench",
+               OPENAI_BASE_URL=f"http://127.0.0.1:{openai_port}/v1",
+               WEBHOOK_SECRET=SECRET,
+               METERING=os.environ.get("METERING", "0"),  # иначе после PLAN_FREE_QUESTS — отказы
+               LOG_LEVEL=os.environ.get("LOG_LEVEL", "WARNING"),
+               LOG_FILE=os.environ.get("LOG_FILE", ""),
+               BASE_URL="")
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "bot:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning", "--no-access-log"],
+        env=env,
+    )
+    url = f"http://127.0.0.1:{port}"
+    gen = UpdateGenerator(parse_mix(args.mix) if args.mix else None, seed=args.seed)
+    stats = Stats()
+    rss = None
+    try:
+        timeout = aiohttp.ClientTimeout(total=None)
+        connector = aiohttp.TCPConnector(limit=0)
+        async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+            await _wait_ready(session, url, proc)
+            if args.warmup:
+                await drive(session, url, min(args.users, args.warmup), args.warmup, gen, replies, None, args)
+            wall = await drive(session, url, args.users, args.updates, gen, replies, stats, args)
+        rss = peak_rss_mb(proc.pid)
+    finally:
+        proc.terminate()  # бот дорабатывает очередь (UPDATE_MODE=queue) — mock-серверы должны отвечать
+        await asyncio.to_thread(proc.wait, 60)
+        await openai_runner.cleanup()
+        await bot_api_runner.cleanup()
+    if rss is None:
+        rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / (1024 * 1024 if sys.platform == "darwin"
+                                                                         else 1024)
+
+    done = sum(stats.status.values())
+    report = {
+        "users": args.users, "updates": done, "seconds": round(wall, 3),
+        "updates_per_s": round(done / wall, 1), "peak_rss_mb": round(rss, 1),
+        "latency": args.latency, "mix": args.mix or "default",
+        "update_mode": os.environ.get("UPDATE_MODE", "sync"),
+        **stats.summary(),
+        "bot_api_calls": dict(bot_api["calls"]),
+    }
+    _print(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    failed = []
+    reply_p99 = report["reply"]["p99"] if report["reply"] else float("inf")
+    if args.max_p99 and reply_p99 > args.max_p99:
+        failed.append(f"reply p99 {reply_p99:.3f}s > {args.max_p99}s")
+    if args.min_rps and report["updates_per_s"] < args.min_rps:
+        failed.append(f"{report['updates_per_s']} updates/s < {args.min_rps}")
+    if args.max_rss_mb and rss > args.max_rss_mb:
+        failed.append(f"peak RSS {rss:.0f} MB > {args.max_rss_mb} MB")
+    if args.max_errors is not None:
+        errors = done - stats.status.get(200, 0) + stats.timeouts
+        if errors > args.max_errors:
+            failed.append(f"{errors} errors/timeouts > {args.max_errors}")
+    for reason in failed:
+        print(f"FAIL: {reason}")
+    return 1 if failed else 0
+
+
+def _print(report: dict):
+    print(f"users={report['users']} updates={report['updates']} mode={report['update_mode']} "
+          f"openai latency={report['latency']} mix={report['mix']}")
+    print(f"throughput {report['updates_per_s']:.1f} updates/s over {report['seconds']:.1f}s, "
+          f"peak RSS {report['peak_rss_mb']:.1f} MB")
+    print(f"{'':>14} {'n':>6} {'p50,s':>8} {'p95,s':>8} {'p99,s':>8}")
+    if report["ack"]:
+        print(f"{'ack':>14} {report['updates']:>6} {report['ack']['p50']:>8.3f} {report['ack']['p95']:>8.3f} "
+              f"{report['ack']['p99']:>8.3f}")
+    for kind in KINDS:
+        row = report["reply_by_kind"].get(kind)
+        if row:
+            print(f"{'reply ' + kind:>14} {row['n']:>6} {row['p50']:>8.3f} {row['p95']:>8.3f} {row['p99']:>8.3f}")
+    if report["reply"]:
+        n = sum(row["n"] for row in report["reply_by_kind"].values())
+        print(f"{'reply all':>14} {n:>6} {report['reply']['p50']:>8.3f} {report['reply']['p95']:>8.3f} "
+              f"{report['reply']['p99']:>8.3f}")
+    print(f"http status {report['status']}, timeouts {report['timeouts']}, no reply {report['silent']}")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--users", type=int, default=20, help="одновременных пользователей (чатов)")
+    ap.add_argument("--updates", type=int, default=500)
+    ap.add_argument("--warmup", type=int, default=20, help="апдейтов до замера")
+    ap.add_argument("--mix", default="", help="доли типов: text=70,voice=10,photo=5,callback=15")
+    ap.add_argument("--latency", default="lognormal:0.3:0.5", help="mock OpenAI: сек. или распределение")
+    ap.add_argument("--model-latency", default="", help="по модели: gpt-4o=lognormal:2:0.5")
+    ap.add_argument("--error-rate", type=float, default=0.0, help="доля 500 от mock OpenAI")
+    ap.add_argument("--bot-api-latency", type=float, default=0.0)
+    ap.add_argument("--think", type=float, default=0.0, help="пауза пользователя между апдейтами, сек.")
+    ap.add_argument("--reply-timeout", type=float, default=60.0)
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--port", type=int, default=0, help="порт bot:app; 0 — свободный")
+    ap.add_argument("--json", default="", help="записать отчёт в файл")
+    ap.add_argument("--max-p99", type=float, default=0.0, help="порог p99 ответа, сек.")
+    ap.add_argument("--min-rps", type=float, default=0.0)
+    ap.add_argument("--max-rss-mb", type=float, default=0.0)
+    ap.add_argument("--max-errors", type=int, default=None, help="не-200 + таймауты")
+    sys.exit(asyncio.run(main_async(ap.parse_args())))
+
+
+if __name__ == "__main__":
+    main()
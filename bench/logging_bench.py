@@ -0,0 +1,112 @@
+# bench/logging_bench.py — задержка обработчика из-за логов: выключены / прежние синхронные
+# хендлеры (RotatingFileHandler + StreamHandler в event loop) / очередь logger_config (+ сэмплирование).
+# «Обработчик» — 5 вызовов logger.info с аргументами и один warning, как апдейт с DEBUG_SANITIZE;
+# между апдейтами — пауза --interval (бот не пишет логи непрерывно). Меряется время в вызовах логгера.
+# Вывод — во временные файлы; --stall-every/--stall имитируют подвисания записи
+# (stdout-pipe, который не успевают читать, медленный диск): flush раз в N записей спит stall сек.
+# python -m bench.logging_bench --updates 5000 --stall-every 500 --stall 0.01
+
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import tempfile
+import time
+from logging.handlers import RotatingFileHandler
+
+import logger_config
+
+TEXT = "**Привет!** Вот ответ на ваш вопрос про ноутбуки: " * 4
+
+
+class StallingStream:
+    def __init__(self, path: str, every: int, stall: float):
+        self.f = open(path, "w")
+        self.every, self.stall, self.n = every, stall, 0
+
+    def write(self, s: str):
+        self.f.write(s)
+
+    def flush(self):
+        self.f.flush()
+        self.n += 1
+        if self.every and self.n % self.every == 0:
+            time.sleep(self.stall)
+
+    def close(self):
+        self.f.close()
+
+
+def handler(log: logging.Logger, i: int):
+    log.info("update %d: chat %d text=%r", i, i % 100, TEXT[:80])
+    log.info("sanitize: %r -> %r", TEXT[:200], TEXT[:200].replace("*", ""))
+    log.info("llm: model=%s tokens=%d", "gpt-4o-mini", 120)
+    log.info("reply sent: chat %d", i % 100)
+    log.info("history: chat %d window=%d", i % 100, 8)
+    if i % 50 == 0:
+        log.warning("slow update %d", i)
+
+
+async def run(log: logging.Logger, updates: int, interval: float):
+    waits = []
+    for i in range(updates):
+        started = time.perf_counter()
+        handler(log, i)
+        waits.append(time.perf_counter() - started)
+        await asyncio.sleep(interval)
+    waits.sort()
+    return statistics.median(waits), waits[int(len(waits) * 0.99)], max(waits)
+
+
+def legacy_logger(tmp: str, stream) -> logging.Logger:
+    # прежний setup_logger: хендлеры прямо на логгере, запись в потоке вызова
+    log = logging.getLogger("bench.legacy")
+    log.setLevel(logging.INFO)
+    formatter = logging.Formatter(logger_config.LOG_FORMAT)
+    file_handler = RotatingFileHandler(os.path.join(tmp, "legacy.log"), maxBytes=logger_config.MAX_BYTES,
+                                       backupCount=logger_config.BACKUP_COUNT)
+    file_handler.setFormatter(formatter)
+    file_handler.setLevel(logging.WARNING)
+    stream_handler = logging.StreamHandler(stream)
+    stream_handler.setFormatter(formatter)
+    stream_handler.setLevel(logging.INFO)
+    log.addHandler(file_handler)
+    log.addHandler(stream_handler)
+    log.propagate = False
+    return log
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--updates", type=int, default=5000)
+    ap.add_argument("--interval", type=float, default=0.0005, help="сек. между апдейтами")
+    ap.add_argument("--stall-every", type=int, default=0, help="подвисание раз в N записей stdout; 0 — нет")
+    ap.add_argument("--stall", type=float, default=0.01)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        off = logging.getLogger("bench.off")
+        off.setLevel(logging.ERROR)
+        def out(name):
+            return StallingStream(os.path.join(tmp, name + ".out"), args.stall_every, args.stall)
+
+        cases = [("off", lambda: off), ("sync handlers", lambda: legacy_logger(tmp, out("legacy")))]
+        for name, rate in (("queue json", 1.0), ("queue json 1:10", 0.1)):
+            def make(name=name, rate=rate):
+                logger_config.shutdown_logging()
+                return logger_config.setup_logger(f"bench.{name}", level="INFO", stream=out(name.replace(":", "_")),
+                                                  log_file=os.path.join(tmp, name.replace(":", "_") + ".log"),
+                                                  json_format=True, sample_rate=rate)
+            cases.append((name, make))
+        for name, make in cases:
+            p50, p99, worst = asyncio.run(run(make(), args.updates, args.interval))
+            print(f"{name:<16} logging per update: p50 {p50 * 1e6:7.1f} us  p99 {p99 * 1e6:7.1f} us  "
+                  f"max {worst * 1e3:6.2f} ms")
+        logger_config.shutdown_logging()
+        print(f"dropped (queue full): {logger_config.dropped_total.value:.0f}, "
+              f"sampled out: {logger_config.sampled_out_total.value:.0f}")
+
+
+if __name__ == "__main__":
+    main()
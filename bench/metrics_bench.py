@@ -0,0 +1,91 @@
+# bench/metrics_bench.py — цена инструментирования на апдейт и стоимость /metrics
+# На апдейт бот делает примерно: updates_total.labels(type).inc(), timed(feed_update),
+# timed(sanitize_output), timed(send_clean), telegram_api_seconds.labels(method).observe().
+# Меряется этот набор против пустого вызова, затем render() и сборка снимков --workers воркеров.
+# python -m bench.metrics_bench --updates 200000 --workers 8
+
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+import metrics
+
+updates = metrics.counter("bench_updates_total", labels=("type",))
+feed = metrics.histogram("bench_feed_seconds", labels=("type",))
+sanitize = metrics.histogram("bench_sanitize_seconds", buckets=metrics.FAST_BUCKETS)
+send = metrics.histogram("bench_send_seconds")
+api = metrics.histogram("bench_api_seconds", labels=("method",))
+
+
+def plain_sanitize(text: str) -> str:
+    return text
+
+
+async def plain_send(text: str):
+    return plain_sanitize(text)
+
+
+async def plain_feed(data: dict):
+    return await plain_send("ok")
+
+
+timed_sanitize = metrics.timed(sanitize)(plain_sanitize)
+
+
+@metrics.timed(send)
+async def timed_send(text: str):
+    return timed_sanitize(text)
+
+
+@metrics.timed(feed, label=lambda data: "message")
+async def timed_feed(data: dict):
+    updates.labels("message").inc()
+    started = time.perf_counter()
+    res = await timed_send("ok")
+    api.labels("SendMessage").observe(time.perf_counter() - started)
+    return res
+
+
+async def per_update(fn, n: int) -> float:
+    data = {"update_id": 1, "message": {}}
+    started = time.perf_counter()
+    for _ in range(n):
+        await fn(data)
+    return (time.perf_counter() - started) / n
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--updates", type=int, default=200_000)
+    ap.add_argument("--workers", type=int, default=8)
+    args = ap.parse_args()
+
+    base = asyncio.run(per_update(plain_feed, args.updates))
+    inst = asyncio.run(per_update(timed_feed, args.updates))
+    print(f"per update: bare {base * 1e6:.2f} us, instrumented {inst * 1e6:.2f} us "
+          f"(+{(inst - base) * 1e6:.2f} us)")
+
+    runs = 200
+    started = time.perf_counter()
+    for _ in range(runs):
+        text = metrics.render()
+    print(f"render, this process: {(time.perf_counter() - started) / runs * 1e3:.2f} ms, "
+          f"{sum(1 for line in text.splitlines() if not line.startswith('#'))} samples")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        snap = metrics.collect()
+        for pid in range(1, args.workers):  # «чужие» воркеры; свой снимок пишет collect()
+            with open(os.path.join(tmp, f"{pid}.json"), "w") as f:
+                json.dump(snap, f)
+        collector = metrics.MultiProcessCollector(tmp)
+        started = time.perf_counter()
+        for _ in range(runs):
+            text = metrics.render(collector.collect())
+        print(f"render, {args.workers} workers merged: {(time.perf_counter() - started) / runs * 1e3:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
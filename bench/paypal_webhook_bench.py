@@ -0,0 +1,87 @@
+# bench/paypal_webhook_bench.py — всплеск вебхуков PayPal (промо): задержка ack, дубли, начисления
+# Ордера создаются на локальном mock PayPal, затем на /paypal/webhook приходят CHECKOUT.ORDER.APPROVED,
+# часть — повторно (PayPal доставляет at-least-once). Начислений должно быть ровно по одному на ордер.
+# Плюс --forged поддельных PAYMENT.CAPTURE.COMPLETED на несуществующие ордера: начислений по ним быть не должно.
+# python -m bench.paypal_webhook_bench --orders 500 --dup 0.3 --latency 0.05
+
+import argparse
+import asyncio
+import random
+import statistics
+import time
+from collections import Counter
+
+import httpx
+from aiohttp import web
+from fastapi import FastAPI
+
+from payments import PayPalClient
+from paypal_webhooks import IdempotencyStore, PaymentPipeline, make_router
+
+
+async def main():
+    from bench.fake_paypal import make_app
+
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--orders", type=int, default=500)
+    ap.add_argument("--dup", type=float, default=0.3, help="доля повторных доставок")
+    ap.add_argument("--latency", type=float, default=0.05)
+    ap.add_argument("--workers", type=int, default=8)
+    ap.add_argument("--forged", type=int, default=20, help="поддельные события оплаты")
+    ap.add_argument("--port", type=int, default=8185)
+    args = ap.parse_args()
+
+    api = make_app(args.latency)
+    runner = web.AppRunner(api)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", args.port).start()
+
+    credited: Counter = Counter()
+
+    async def credit(user_id: int, plan: str, order_id: str):
+        credited[order_id] += 1
+
+    client = PayPalClient(f"http://127.0.0.1:{args.port}", "id", "secret", return_base="http://localhost")
+    pipeline = PaymentPipeline(client, credit, IdempotencyStore(), webhook_id="WH-bench", workers=args.workers)
+    app = FastAPI()
+    app.include_router(make_router(pipeline))
+    pipeline.start()
+    try:
+        orders = await asyncio.gather(*(client.create_order("10.00", "pro", user_id=i)
+                                        for i in range(args.orders)))
+        events = [{"id": f"WH-{o['id']}", "event_type": "CHECKOUT.ORDER.APPROVED", "resource": o} for o in orders]
+        events += random.sample(events, int(len(events) * args.dup))
+        events += [{"id": f"WH-forged-{i}", "event_type": "PAYMENT.CAPTURE.COMPLETED",
+                    "resource": {"id": f"CAP-forged-{i}", "custom_id": f"{i}:unlim",
+                                 "supplementary_data": {"related_ids": {"order_id": f"FORGED{i}"}}}}
+                   for i in range(args.forged)]
+        random.shuffle(events)
+
+        lat = []
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as http:
+            async def deliver(ev):
+                t0 = time.perf_counter()
+                resp = await http.post("/paypal/webhook", json=ev)
+                lat.append(time.perf_counter() - t0)
+                assert resp.status_code == 200, resp.text
+
+            started = time.perf_counter()
+            await asyncio.gather(*(deliver(ev) for ev in events))
+            acked = time.perf_counter() - started
+            await pipeline.queue._queue.join()
+            done = time.perf_counter() - started
+
+        lat.sort()
+        print(f"deliveries={len(events)} ack p50={statistics.median(lat) * 1000:.1f}ms "
+              f"p99={lat[int(len(lat) * 0.99) - 1] * 1000:.1f}ms all acked in {acked:.2f}s")
+        print(f"credited {len(credited)}/{len(orders)} orders in {done:.2f}s, "
+              f"double credits: {sum(1 for n in credited.values() if n > 1)}, "
+              f"forged credited: {sum(1 for o in credited if o.startswith('FORGED'))}, "
+              f"captures: {api['calls']['capture_order']}, signature checks: {api['calls']['verify_webhook']}")
+    finally:
+        await pipeline.stop()
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,67 @@
+# bench/sanitizer_bench.py — новый sanitize_output против прежней цепочки regex
+# Сначала сверяет обе реализации на golden-корпусе, затем меряет 1 KB / 4 KB / 64 KB.
+# python -m bench.sanitizer_bench
+
+import json
+import os
+import sys
+import timeit
+
+from sanitizer import StreamSanitizer, sanitize_output, sanitize_output_regex
+
+GOLDEN = os.path.join(os.path.dirname(__file__), "data", "sanitizer_golden.json")
+
+
+def check_golden() -> int:
+    with open(GOLDEN, encoding="utf-8") as f:
+        cases = json.load(f)
+    failed = 0
+    for case in cases:
+        src, expected = case["input"], case["expected"]
+        stream = StreamSanitizer()
+        for i in range(0, len(src), 7):
+            stream.feed(src[i:i + 7])
+        got = {
+            "regex": sanitize_output_regex(src),
+            "single-pass": sanitize_output(src),
+            "stream": stream.finish() if src else src,
+        }
+        for name, out in got.items():
+            if out != expected:
+                failed += 1
+                print(f"MISMATCH [{name}] {src[:60]!r}: {out[:60]!r} != {expected[:60]!r}")
+    print(f"golden: {len(cases)} cases, {failed} mismatches")
+    return failed
+
+
+PARAGRAPH = ("Хороший ноутбук для работы — это баланс между производительностью, автономностью и весом. "
+             "Обратите внимание на процессор последних поколений, 16 ГБ памяти и SSD от 512 ГБ.\n\n")
+# типичный ответ модели: в основном абзацы, немного заголовков и списков
+ANSWER = ("Конечно, вот подробный ответ.\n\n### Что важно\n\n" + PARAGRAPH * 3
+          + "- **Процессор:** Intel Core Ultra или Ryzen 7\n- **Память:** 16–32 ГБ\n\n" + PARAGRAPH * 2)
+
+
+def make_input(size: int, kind: str = "answer") -> str:
+    if kind == "answer":
+        sample = ANSWER
+    else:
+        with open(GOLDEN, encoding="utf-8") as f:
+            sample = "\n\n".join(c["input"] for c in json.load(f))
+    return (sample * (size // len(sample) + 1))[:size]
+
+
+def main():
+    if check_golden():
+        sys.exit(1)
+    print(f"{'input':>8} {'size':>6} {'regex, us':>11} {'new, us':>11} {'speedup':>8}")
+    for kind in ("answer", "golden"):
+        for size in (1024, 4096, 65536):
+            text = make_input(size, kind)
+            number = max(5, 200_000 // size)
+            old = min(timeit.repeat(lambda: sanitize_output_regex(text), number=number, repeat=5)) / number
+            new = min(timeit.repeat(lambda: sanitize_output(text), number=number, repeat=5)) / number
+            print(f"{kind:>8} {size // 1024:>4}KB {old * 1e6:>11.1f} {new * 1e6:>11.1f} {old / new:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
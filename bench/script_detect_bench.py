@@ -0,0 +1,41 @@
+# bench/script_detect_bench.py — detect_script_lang: прежние 3 генератора против translate-таблицы
+# python -m bench.script_detect_bench
+
+import timeit
+from typing import Optional
+
+from script_detect import detect_script_lang
+
+
+def detect_script_lang_legacy(text: str) -> Optional[str]:
+    heb = sum('\u0590' <= ch <= '\u05FF' for ch in text)     # Hebrew
+    cyr = sum('А' <= ch <= 'я' or ch in "ёЁ" for ch in text)  # Cyrillic
+    lat = sum('A' <= ch <= 'z' for ch in text)                # Latin
+    if heb > cyr and heb > lat and heb > 0: return "he"
+    if cyr > lat and cyr > heb and cyr > 0: return "ru"
+    if lat > cyr and lat > heb and lat > 0: return "en"
+    return None
+
+
+SAMPLES = {
+    "ru": "Подскажи, как выбрать ноутбук для работы с видео и фото? Бюджет около 100k. ",
+    "en": "Could you help me choose a laptop for video editing and photo work? Budget 1k. ",
+    "he": "אפשר עזרה בבחירת מחשב נייד לעריכת וידאו ותמונות? התקציב בערך 4000 ש״ח. ",
+    "mix": "Вот текст из статьи: The quick brown fox — שלום עולם — и ещё немного русского. ",
+}
+
+
+def main():
+    print(f"{'text':>5} {'size':>7} {'legacy, us':>11} {'table, us':>10} {'speedup':>8}")
+    for name, sample in SAMPLES.items():
+        for size in (80, 4096, 65536):
+            text = (sample * (size // len(sample) + 1))[:size]
+            assert detect_script_lang(text) == detect_script_lang_legacy(text)
+            number = max(10, 400_000 // size)
+            old = min(timeit.repeat(lambda: detect_script_lang_legacy(text), number=number, repeat=5)) / number
+            new = min(timeit.repeat(lambda: detect_script_lang(text), number=number, repeat=5)) / number
+            print(f"{name:>5} {size:>7} {old * 1e6:>11.1f} {new * 1e6:>10.1f} {old / new:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
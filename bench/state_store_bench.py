@@ -0,0 +1,91 @@
+# bench/state_store_bench.py — UserStateStore: промахи (склеенный MGET), попадания, write-behind
+# Backend: memory, fakeredis (requirements-dev.txt) и настоящий Redis, если доступен REDIS_URL.
+# На каждом backend сначала проверка двух воркеров: ui_lang, сменённый одним, не затирается
+# записью lang_hist/voice_meta другого из его устаревшей локальной копии (иначе — выход с ошибкой).
+# python -m bench.state_store_bench --users 5000
+
+import argparse
+import asyncio
+import os
+import time
+
+from state_store import MemoryBackend, RedisBackend, UserStateStore
+
+
+async def _backends(redis_url: str):
+    yield "memory", MemoryBackend()
+    try:
+        from fakeredis import FakeAsyncRedis
+        yield "fakeredis", RedisBackend(FakeAsyncRedis(decode_responses=True))
+    except ImportError:
+        print("fakeredis не установлен — пропускаю")
+    try:
+        import redis.asyncio as aioredis
+        client = aioredis.from_url(redis_url, decode_responses=True)
+        await client.ping()
+        yield "redis", RedisBackend(client)
+    except Exception as e:
+        print(f"redis {redis_url} недоступен ({type(e).__name__}) — пропускаю")
+
+
+async def check_two_workers(backend) -> bool:
+    a = UserStateStore(backend, prefix="bench:race:")
+    b = UserStateStore(backend, prefix="bench:race:")
+    ra, rb = await a.get(1), await b.get(1)  # обе локальные копии — до изменений
+    ra.ui_lang = "he"
+    a.mark_dirty(1, ra, "ui_lang")
+    await a.flush()
+    rb.lang_hist.append("en")
+    b.mark_dirty(1, rb, "lang_hist")
+    rb.voice_meta["last_ts"] = 1.0
+    b.mark_dirty(1, rb, "voice_meta")
+    await b.flush()
+    fresh = await UserStateStore(backend, prefix="bench:race:").get(1)
+    return fresh.ui_lang == "he" and list(fresh.lang_hist) == ["en"] and fresh.voice_meta.get("last_ts") == 1.0
+
+
+async def run(backend, users: int):
+    store = UserStateStore(backend, local_size=users * 2, flush_interval=0.05, prefix="bench:")
+    uids = list(range(1, users + 1))
+
+    t0 = time.perf_counter()
+    for uid in uids:
+        rec = await store.get(uid)
+        rec.ui_lang = "en"
+        store.mark_dirty(uid, rec, "ui_lang")
+    await store.flush()
+    writes = time.perf_counter() - t0
+
+    cold = UserStateStore(backend, local_size=users * 2, prefix="bench:")
+    t0 = time.perf_counter()
+    recs = await cold.get_many(uids)
+    misses = time.perf_counter() - t0
+    assert all(r.ui_lang == "en" for r in recs.values())
+
+    t0 = time.perf_counter()
+    for uid in uids:
+        await cold.get(uid)
+    hits = time.perf_counter() - t0
+    await backend.close()
+    return writes, misses, hits
+
+
+async def main_async(args):
+    print(f"{'backend':>10} {'write, us/op':>13} {'cold read, us/op':>17} {'hit, us/op':>11}")
+    async for name, backend in _backends(args.redis_url):
+        if not await check_two_workers(backend):
+            raise SystemExit(f"{name}: a field written by one worker was overwritten by another")
+        w, m, h = await run(backend, args.users)
+        n = args.users
+        print(f"{name:>10} {w / n * 1e6:>13.1f} {m / n * 1e6:>17.1f} {h / n * 1e6:>11.2f}")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--users", type=int, default=5000)
+    ap.add_argument("--redis-url", default=os.environ.get("REDIS_URL", "redis://localhost:6379/0"))
+    asyncio.run(main_async(ap.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
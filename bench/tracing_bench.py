@@ -0,0 +1,86 @@
+# bench/tracing_bench.py — цена трассировки на апдейт и профайлера на CPU-работу
+# Апдейт — как в боте: root + ~10 span (parse, validate, route, llm, sanitize, send, tg.*),
+# внутри — sanitize_output на типичном ответе. Сравнивается TRACE_SAMPLE_RATE 0 / 0.01 / 1
+# и те же апдейты под включённым профайлером (interval 5 мс), где каждый --stall-every апдейт
+# чистит огромный ответ (CPU-подвисание event loop) — профайлер должен показать именно его.
+# Стек снимается, когда поток loop отпускает GIL: короткие шаги видны как selectors:select,
+# длинные участки CPU (то, что и даёт всплески p99) — своим стеком.
+# python -m bench.tracing_bench --updates 20000
+
+import argparse
+import asyncio
+import time
+
+import tracing
+from sanitizer import sanitize_output
+
+TEXT = "**Ответ.** Вот что стоит учесть при выборе ноутбука:\n- процессор\n- память\n- экран\n" * 6
+SPANS = ("receive", "parse", "dedup", "validate", "lang", "route", "history", "llm", "sanitize", "send")
+
+
+async def update(text: str = TEXT):
+    with tracing.root("webhook"):
+        for name in SPANS:
+            with tracing.span(name):
+                if name == "sanitize":
+                    sanitize_output(text)
+        await asyncio.sleep(0)
+
+
+async def bare():
+    sanitize_output(TEXT)
+    await asyncio.sleep(0)
+
+
+async def run(n: int, fn=update) -> float:
+    await fn()  # прогрев
+    started = time.perf_counter()
+    for _ in range(n):
+        await fn()
+    return (time.perf_counter() - started) / n
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--updates", type=int, default=20000)
+    ap.add_argument("--stall-every", type=int, default=500, help="апдейт с огромным ответом раз в N")
+    ap.add_argument("--show-stacks", type=int, default=3, help="вывести N самых частых стеков")
+    args = ap.parse_args()
+
+    tracing.tracer.configure(slow_seconds=3600)
+    base = asyncio.run(run(args.updates, bare))
+    print(f"no spans        {base * 1e6:7.1f} us/update")
+    for rate in (0.0, 0.01, 1.0):
+        tracing.tracer.configure(sample_rate=rate)
+        per = asyncio.run(run(args.updates))
+        print(f"sample rate {rate:<5} {per * 1e6:7.1f} us/update  (+{(per - base) * 1e6:5.1f} us)")
+
+    tracing.tracer.configure(sample_rate=0.0)
+
+    huge = TEXT * 300
+    i = 0
+
+    async def stalling():
+        nonlocal i
+        i += 1
+        await update(huge if i % args.stall_every == 0 else TEXT)
+
+    async def profiled(on: bool):
+        if on:
+            tracing.profiler.start(seconds=3600, interval=0.005)
+        per = await run(args.updates, stalling)
+        if on:
+            tracing.profiler.stop()
+        return per
+
+    base = asyncio.run(profiled(False))
+    per = asyncio.run(profiled(True))
+    print(f"with stalls: profiler off {base * 1e6:7.1f} us/update, on {per * 1e6:7.1f} us/update, "
+          f"{tracing.profiler.samples} samples, {len(tracing.profiler.stacks)} distinct stacks")
+    for line in tracing.profiler.collapsed().splitlines()[:args.show_stacks]:
+        stack, n = line.rsplit(" ", 1)
+        print(f"  {n:>5}  ...;{';'.join(stack.split(';')[-3:])}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+# bench/updates.py — генератор апдейтов Telegram для нагрузочных тестов
+# Смесь как в проде: текст RU/EN/HE (вопросы, намерения, «меню», команды), голосовые, фото,
+# нажатия кнопок меню. Доли — mix, например "text=70,voice=10,photo=5,callback=15".
+# Каждый апдейт — новый update_id; callback_query.id уникален (по нему видно ответ бота).
+
+import itertools
+import random
+import time
+from typing import Dict, Optional
+
+TEXTS = {
+    "ru": [
+        "Как выбрать ноутбук для работы?",
+        "Расскажи сказку про кота и луну",
+        "Напиши историю о путешествии на Марс",
+        "Почему небо голубое?",
+        "Сравни Python и Go для бэкенда",
+        "меню",
+        "/start",
+        "Переведи на английский: доброе утро",
+    ],
+    "en": [
+        "How do I pick a laptop for programming?",
+        "Tell me a story about a brave little robot",
+        "Why is the sky blue?",
+        "Write a short poem about the sea",
+        "menu",
+        "What is the difference between TCP and UDP?",
+    ],
+    "he": [
+        "איך לבחור מחשב נייד לעבודה?",
+        "ספר לי סיפור על חתול",
+        "למה השמיים כחולים?",
+        "מה ההבדל בין קפה לתה?",
+    ],
+}
+LANG_WEIGHTS = {"ru": 60, "en": 30, "he": 10}
+CALLBACKS = ["help", "profile", "lang", "mode", "tts", "asr", "refs", "pay", "close_menu"]
+DEFAULT_MIX = {"text": 70, "voice": 10, "photo": 5, "callback": 15}
+KINDS = ("text", "voice", "photo", "callback")
+# сообщения после нажатия кнопки (help, pay, ...) уходят в «чат меню», а не в чат вопросов:
+# иначе в режиме queue второе сообщение на кнопку засчиталось бы ответом на следующий апдейт
+MENU_CHAT_OFFSET = 1_000_000_000
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "bench", "username": "bench_bot"}  # как getMe fake_bot_api
+
+
+def parse_mix(value: str) -> Dict[str, int]:
+    """"text=70,voice=10" -> {"text": 70, "voice": 10}"""
+    mix = {}
+    for part in filter(None, value.split(",")):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in KINDS:
+            raise ValueError(f"unknown update kind: {name} (expected one of {', '.join(KINDS)})")
+        mix[name] = int(weight)
+    return mix
+
+
+class UpdateGenerator:
+    def __init__(self, mix: Optional[Dict[str, int]] = None, seed: int = 1, first_update_id: int = 1):
+        mix = mix or DEFAULT_MIX
+        self.kinds = [k for k in mix if mix[k] > 0]
+        self.weights = [mix[k] for k in self.kinds]
+        self.rng = random.Random(seed)
+        self._update_ids = itertools.count(first_update_id)
+        self._message_ids = itertools.count(1)
+        self._files = itertools.count(1)
+
+    def lang_for(self, user_id: int) -> str:
+        # язык — свойство пользователя, а не апдейта (как у живых чатов)
+        langs = list(LANG_WEIGHTS)
+        return random.Random(user_id).choices(langs, [LANG_WEIGHTS[x] for x in langs])[0]
+
+    def next(self, user_id: int, kind: Optional[str] = None) -> dict:
+        """Апдейт пользователя user_id (личный чат: chat_id == user_id)."""
+        kind = kind or self.rng.choices(self.kinds, self.weights)[0]
+        lang = self.lang_for(user_id)
+        update_id = next(self._update_ids)
+        if kind == "callback":
+            return {"update_id": update_id, "callback_query": {
+                "id": str(update_id),
+                "from": self._user(user_id, lang),
+                "chat_instance": str(user_id),
+                "message": dict(self._message(user_id, lang, text="Меню", chat_id=user_id + MENU_CHAT_OFFSET),
+                                **{"from": BOT_USER}),
+                "data": self.rng.choice(CALLBACKS),
+            }}
+        msg = self._message(user_id, lang)
+        if kind == "text":
+            msg["text"] = self.rng.choice(TEXTS[lang])
+            if msg["text"].startswith("/"):
+                msg["entities"] = [{"type": "bot_command", "offset": 0, "length": len(msg["text"])}]
+        elif kind == "voice":
+            n = next(self._files)
+            msg["voice"] = {"file_id": f"voice-{n}", "file_unique_id": f"uv{n}",
+                            "duration": self.rng.randint(1, 30), "mime_type": "audio/ogg", "file_size": 24000}
+        elif kind == "photo":
+            n = next(self._files)
+            msg["photo"] = [{"file_id": f"photo-{n}-{w}", "file_unique_id": f"up{n}{w}",
+                             "width": w, "height": w * 3 // 4, "file_size": w * 60} for w in (90, 320, 1280)]
+            if self.rng.random() < 0.5:
+                msg["caption"] = self.rng.choice(TEXTS[lang])
+        else:
+            raise ValueError(f"unknown update kind: {kind}")
+        return {"update_id": update_id, "message": msg}
+
+    def _user(self, user_id: int, lang: str) -> dict:
+        return {"id": user_id, "is_bot": False, "first_name": f"Bench{user_id}", "language_code": lang}
+
+    def _message(self, user_id: int, lang: str, text: Optional[str] = None, chat_id: Optional[int] = None) -> dict:
+        msg = {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id or user_id, "type": "private"},
+            "from": self._user(user_id, lang),
+        }
+        if text is not None:
+            msg["text"] = text
+        return msg
+
+
+def kind_of(update: dict) -> str:
+    if "callback_query" in update:
+        return "callback"
+    msg = update.get("message") or {}
+    for kind in ("voice", "photo"):
+        if kind in msg:
+            return kind
+    return "text"
@@ -0,0 +1,141 @@
+# bench/webhook_latency.py — задержка вебхука bot:app при 1/10/100 одновременных чатах
+# Поднимает mock OpenAI + mock Bot API, запускает uvicorn bot:app и шлёт апдейты.
+# python -m bench.webhook_latency --latency 1.0 --rounds 3
+
+import argparse
+import asyncio
+import itertools
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import aiohttp
+from aiohttp import web
+
+from bench.fake_bot_api import make_app as make_bot_api
+from bench.fake_openai import make_app as make_openai
+
+SECRET = "bench-secret"
+WEBHOOK_PATH = "/telegram/railway123"
+_update_ids = itertools.count(1)
+
+
+def make_update(chat_id: int, text: str = "Как выбрать ноутбук для работы?") -> dict:
+    uid = next(_update_ids)
+    return {
+        "update_id": uid,
+        "message": {
+            "message_id": uid,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "Bench"},
+            "text": text,
+        },
+    }
+
+
+def percentile(values, q: float) -> float:
+    values = sorted(values)
+    idx = min(len(values) - 1, max(0, int(round(q * (len(values) - 1)))))
+    return values[idx]
+
+
+async def _serve(app: web.Application, port: int) -> web.AppRunner:
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+    return runner
+
+
+async def _wait_ready(session: aiohttp.ClientSession, url: str, timeout: float = 20.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            async with session.get(url + "/healthz") as resp:
+                if resp.status == 200:
+                    return
+        except aiohttp.ClientError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError("bot:app не поднялся")
+
+
+async def _wait_sent(calls, expected: int, timeout: float = 120.0):
+    # в режиме UPDATE_MODE=queue ответ вебхука приходит раньше, чем ответ пользователю
+    deadline = time.monotonic() + timeout
+    while calls["sendmessage"] < expected and time.monotonic() < deadline:
+        await asyncio.sleep(0.05)
+
+
+async def run_level(session: aiohttp.ClientSession, url: str, chats: int, rounds: int, calls):
+    latencies = []
+    expected = calls["sendmessage"] + chats * rounds
+
+    async def one(chat_id: int):
+        t0 = time.perf_counter()
+        async with session.post(url + WEBHOOK_PATH, json=make_update(chat_id),
+                                headers={"X-Telegram-Bot-Api-Secret-Token": SECRET}) as resp:
+            await resp.read()
+        latencies.append(time.perf_counter() - t0)
+
+    t0 = time.perf_counter()
+    for _ in range(rounds):
+        await asyncio.gather(*(one(1000 + i) for i in range(chats)))
+    await _wait_sent(calls, expected)
+    wall = time.perf_counter() - t0
+    return latencies, wall
+
+
+async def main_async(args):
+    openai_runner = await _serve(make_openai(args.latency), args.openai_port)
+    bot_api = make_bot_api()
+    bot_api_runner = await _serve(bot_api, args.bot_api_port)
+    env = dict(os.environ,
+               TELEGRAM_BOT_TOKEN="123456:BENCH",
+               TELEGRAM_API_BASE=f"http://127.0.0.1:{args.bot_api_port}",
+               OPENAI_API_KEY="sk-bench",
+               OPENAI_BASE_URL=f"http://127.0.0.1:{args.openai_port}/v1",
+               WEBHOOK_SECRET=SECRET,
+               METERING=os.environ.get("METERING", "0"),  # иначе после PLAN_FREE_QUESTS раундов — отказы
+               RESPONSE_CACHE=os.environ.get("RESPONSE_CACHE", "0"),  # иначе все запросы, кроме первого, — из кэша
+               BASE_URL="")
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "bot:app", "--host", "127.0.0.1", "--port", str(args.port),
+         "--log-level", "warning"],
+        env=env,
+    )
+    url = f"http://127.0.0.1:{args.port}"
+    try:
+        timeout = aiohttp.ClientTimeout(total=None)
+        connector = aiohttp.TCPConnector(limit=0)
+        async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+            await _wait_ready(session, url)
+            print(f"mock latency={args.latency:.2f}s rounds={args.rounds} "
+                  f"UPDATE_MODE={os.environ.get('UPDATE_MODE', 'sync')}")
+            print(f"{'chats':>6} {'p50,s':>8} {'p99,s':>8} {'upd/s':>8}")
+            for chats in args.levels:
+                lat, wall = await run_level(session, url, chats, args.rounds, bot_api["calls"])
+                print(f"{chats:>6} {statistics.median(lat):>8.3f} {percentile(lat, 0.99):>8.3f} "
+                      f"{len(lat) / wall:>8.1f}")
+    finally:
+        proc.terminate()
+        proc.wait(timeout=60)
+        await openai_runner.cleanup()
+        await bot_api_runner.cleanup()
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--latency", type=float, default=1.0, help="задержка mock OpenAI, сек.")
+    ap.add_argument("--rounds", type=int, default=3)
+    ap.add_argument("--levels", type=int, nargs="+", default=[1, 10, 100])
+    ap.add_argument("--port", type=int, default=8180)
+    ap.add_argument("--openai-port", type=int, default=8181)
+    ap.add_argument("--bot-api-port", type=int, default=8182)
+    asyncio.run(main_async(ap.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
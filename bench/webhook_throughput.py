@@ -0,0 +1,109 @@
+# bench/webhook_throughput.py — запросов/с вебхука: прежний разбор (request.json + Update.model_validate
+# на каждый апдейт) против webhook_filter (orjson, фильтр типов, валидация только принятых).
+# ASGI в процессе (httpx.ASGITransport) — меряется стоимость самого эндпоинта, без сети и обработчиков.
+# python -m bench.webhook_throughput --n 5000 --ignored 0.2
+
+import argparse
+import asyncio
+import json
+import random
+import time
+
+import httpx
+from aiogram.types import Update
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, Response
+
+from webhook_filter import ACCEPT, IGNORE, UpdateFilter
+
+SECRET = "bench-secret"
+PATH = "/telegram/railway123"
+
+
+def make_update(i: int, kind: str) -> dict:
+    user = {"id": 1000 + i % 50, "is_bot": False, "first_name": "Bench", "language_code": "ru"}
+    chat = {"id": 1000 + i % 50, "type": "private", "first_name": "Bench"}
+    msg = {"message_id": i, "date": 1700000000, "chat": chat, "from": user,
+           "text": "Как выбрать ноутбук для работы и учёбы? " * 3,
+           "entities": [{"type": "bold", "offset": 0, "length": 3}]}
+    if kind == "callback_query":
+        return {"update_id": i, "callback_query": {"id": str(i), "from": user, "chat_instance": "1",
+                                                   "data": "help", "message": msg}}
+    if kind == "channel_post":
+        return {"update_id": i, "channel_post": dict(msg, chat={"id": -100, "type": "channel", "title": "c"})}
+    return {"update_id": i, kind: msg}
+
+
+def legacy_app() -> FastAPI:
+    app = FastAPI()
+
+    @app.post(PATH)
+    async def tg_webhook(request: Request):
+        if request.headers.get("X-Telegram-Bot-Api-Secret-Token") != SECRET:
+            raise HTTPException(status_code=403, detail="Invalid secret")
+        data = await request.json()
+        Update.model_validate(data)
+        return JSONResponse({"ok": True})
+
+    return app
+
+
+def fast_app() -> FastAPI:
+    app = FastAPI()
+    flt = UpdateFilter({"message", "callback_query"}, 1 << 20)
+
+    @app.post(PATH)
+    async def tg_webhook(request: Request):
+        if request.headers.get("X-Telegram-Bot-Api-Secret-Token") != SECRET:
+            raise HTTPException(status_code=403, detail="Invalid secret")
+        if flt.too_large(request.headers.get("content-length")):
+            return JSONResponse({"ok": False}, status_code=413)
+        verdict, data = flt.parse(await request.body())
+        if verdict == ACCEPT:
+            Update.model_validate(data)  # в боте — в задаче планировщика
+        elif verdict != IGNORE:
+            return JSONResponse({"ok": False}, status_code=400)
+        return Response(b'{"ok":true}', media_type="application/json")
+
+    return app
+
+
+async def run(app: FastAPI, bodies, concurrency: int) -> float:
+    transport = httpx.ASGITransport(app=app)
+    headers = {"X-Telegram-Bot-Api-Secret-Token": SECRET, "Content-Type": "application/json"}
+    it = iter(bodies)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def worker():
+            for body in it:
+                resp = await client.post(PATH, content=body, headers=headers)
+                assert resp.status_code == 200, resp.status_code
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return time.perf_counter() - started
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--n", type=int, default=5000)
+    ap.add_argument("--ignored", type=float, default=0.2, help="доля edited_message/channel_post")
+    ap.add_argument("--concurrency", type=int, default=16)
+    args = ap.parse_args()
+
+    rnd = random.Random(1)
+    bodies = []
+    for i in range(args.n):
+        if rnd.random() < args.ignored:
+            kind = rnd.choice(("edited_message", "channel_post"))
+        else:
+            kind = "callback_query" if rnd.random() < 0.3 else "message"
+        bodies.append(json.dumps(make_update(i, kind)).encode())
+
+    for name, factory in (("legacy", legacy_app), ("fastpath", fast_app)):
+        asyncio.run(run(factory(), bodies[:200], args.concurrency))  # прогрев
+        elapsed = asyncio.run(run(factory(), bodies, args.concurrency))
+        print(f"{name:<9} {args.n / elapsed:8.0f} req/s  {elapsed / args.n * 1e6:7.1f} us/req")
+
+
+if __name__ == "__main__":
+    main()
@@ -6,22 +6,47 @@
 # 4) Триггеры сторис/рассказ — только по явной просьбе
 
 import os
-import re
 import time
-from collections import deque, defaultdict
-from typing import Deque, Dict, Optional
+import asyncio
+import logging
+from contextvars import ContextVar
+from typing import AsyncIterator, Dict, List, Optional, Sequence
 
 from fastapi import FastAPI, Request, HTTPException
-from fastapi.responses import PlainTextResponse, JSONResponse
+from fastapi.responses import PlainTextResponse, JSONResponse, Response
 
 from aiogram import Bot, Dispatcher, Router, F
 from aiogram.types import (
     Message, Update, CallbackQuery,
-    ReplyKeyboardMarkup, KeyboardButton,
     InlineKeyboardMarkup, InlineKeyboardButton,
     BotCommand, BotCommandScopeDefault
 )
 from aiogram.filters import Command, CommandStart
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+from aiogram.client.telegram import TelegramAPIServer
+
+import metrics
+from logger_config import setup_logger
+from ingest import UpdateQueue
+from scheduler import KeyedScheduler, LaneFull, update_key
+from llm_engine import LLMEngine, parse_model_limits
+from sanitizer import StreamSanitizer, sanitize_output as _sanitize
+from script_detect import detect_script_lang as _detect_script_lang
+from state_store import UserRecord, UserStateStore, make_backend
+from response_cache import ResponseCache
+from payments import PayPalClient
+from paypal_webhooks import PaymentPipeline, make_router as make_paypal_router, make_store
+from plans import load_plans
+from metering import Meter, MeterUnavailable, make_meter_backend
+from history import ASSISTANT, USER, HistoryStore
+from intents import IntentRouter, load_intents
+from supervisor import ChatAction, Supervisor
+from i18n import t
+import keyboards
+from dedup import make_dedup
+import tracing
+from voice import VoiceError, VoicePipeline, make_transcriber
+from webhook_filter import ACCEPT, IGNORE, TOO_LARGE, UpdateFilter, parse_allowed, update_type
 
 # =========================
 # Env
@@ -33,101 +58,316 @@ WEBHOOK_PATH = "/telegram/railway123"
 OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY", "")
 OPENAI_MODEL = os.environ.get("OPENAI_MODEL", "gpt-4o-mini")  # "gpt-4o" для макс. качества
 HARD_STRIP_MARKDOWN = os.environ.get("HARD_STRIP_MARKDOWN", "1") == "1"  # «страховка» глобальной чистки
-DEBUG_SANITIZE = os.environ.get("DEBUG_SANITIZE", "0") == "1"  # лог до/после в консоль
+DEBUG_SANITIZE = os.environ.get("DEBUG_SANITIZE", "0") == "1"  # лог до/после (INFO, logger "bot")
+TELEGRAM_API_BASE = os.environ.get("TELEGRAM_API_BASE", "")  # локальный Bot API (бенчмарки/тесты)
+OPENAI_BASE_URL = os.environ.get("OPENAI_BASE_URL", "")  # локальный mock OpenAI
+OPENAI_TIMEOUT = float(os.environ.get("OPENAI_TIMEOUT", "60"))  # сек. на один запрос
+OPENAI_MAX_CONNECTIONS = int(os.environ.get("OPENAI_MAX_CONNECTIONS", "100"))
+OPENAI_MAX_KEEPALIVE = int(os.environ.get("OPENAI_MAX_KEEPALIVE", "20"))
+OPENAI_MODEL_CONCURRENCY = int(os.environ.get("OPENAI_MODEL_CONCURRENCY", "16"))  # лимит на модель
+OPENAI_MODEL_LIMITS = parse_model_limits(os.environ.get("OPENAI_MODEL_LIMITS", ""))  # "gpt-4o=8,gpt-4o-mini=32"
+OPENAI_FALLBACK_MODEL = os.environ.get("OPENAI_FALLBACK_MODEL", "gpt-4o-mini")  # по дедлайну/ошибке; пусто — нет
+OPENAI_FALLBACK_DEADLINE = float(os.environ.get("OPENAI_FALLBACK_DEADLINE", "20"))  # сек. запасной модели
+TYPING_INTERVAL = float(os.environ.get("TYPING_INTERVAL", "4"))  # сек. между sendChatAction(typing)
+STREAM_REPLIES = os.environ.get("STREAM_REPLIES", "0") == "1"  # ответ GPT правками одного сообщения
+STREAM_EDIT_INTERVAL = float(os.environ.get("STREAM_EDIT_INTERVAL", "1.5"))  # сек. между editMessageText
+REDIS_URL = os.environ.get("REDIS_URL", "redis://localhost:6379/0")
+RESPONSE_CACHE = os.environ.get("RESPONSE_CACHE", "1") == "1"  # кэш ответов GPT на повторные запросы
+RESPONSE_CACHE_TTL = float(os.environ.get("RESPONSE_CACHE_TTL", "21600"))
+RESPONSE_CACHE_SIZE = int(os.environ.get("RESPONSE_CACHE_SIZE", "5000"))
+RESPONSE_CACHE_MAX_TEMP = float(os.environ.get("RESPONSE_CACHE_MAX_TEMP", "0.7"))  # выше — не кэшируем
+RESPONSE_CACHE_PERSIST = os.environ.get("RESPONSE_CACHE_PERSIST", "0") == "1"  # второй уровень в Redis
+STATE_BACKEND = os.environ.get("STATE_BACKEND", "memory")  # memory — один воркер; redis — общий для WORKERS>1
+STATE_LOCAL_TTL = float(os.environ.get("STATE_LOCAL_TTL", "30"))  # сек. жизни локальной копии
+STATE_LOCAL_SIZE = int(os.environ.get("STATE_LOCAL_SIZE", "10000"))
+STATE_FLUSH_MS = int(os.environ.get("STATE_FLUSH_MS", "200"))  # write-behind
+TELEGRAM_ALLOWED_UPDATES = parse_allowed(os.environ.get("TELEGRAM_ALLOWED_UPDATES", "message,callback_query"))
+MAX_TELEGRAM_PAYLOAD_BYTES = int(os.environ.get("MAX_TELEGRAM_PAYLOAD_BYTES", str(1 << 20)))
+UPDATE_MODE = os.environ.get("UPDATE_MODE", "sync")  # sync — ждём обработку; queue — ack сразу, воркеры в фоне
+UPDATE_QUEUE_SIZE = int(os.environ.get("UPDATE_QUEUE_SIZE", "1000"))
+UPDATE_WORKERS = int(os.environ.get("UPDATE_WORKERS", "64"))  # queue: апдейтов в работе — min(это, UPDATE_MAX_INFLIGHT)
+UPDATE_DRAIN_TIMEOUT = float(os.environ.get("UPDATE_DRAIN_TIMEOUT", "25"))  # < GRACEFUL_TIMEOUT gunicorn
+UPDATE_MAX_INFLIGHT = int(os.environ.get("UPDATE_MAX_INFLIGHT", "64"))  # апдейтов в работе на воркер
+UPDATE_MAX_PER_CHAT = int(os.environ.get("UPDATE_MAX_PER_CHAT", "8"))  # на один чат (< UPDATE_WORKERS), лишние — отброс
+UPDATE_DEDUP = os.environ.get("UPDATE_DEDUP", "1") == "1"  # отсев повторных доставок по update_id
+UPDATE_DEDUP_BACKEND = os.environ.get("UPDATE_DEDUP_BACKEND", STATE_BACKEND)  # redis — общий для WORKERS>1
+UPDATE_DEDUP_WINDOW = int(os.environ.get("UPDATE_DEDUP_WINDOW", "65536"))  # последних update_id в окне
+UPDATE_DEDUP_TTL = int(os.environ.get("UPDATE_DEDUP_TTL", "3600"))  # сек. жизни ключа в Redis
+PAYPAL_BASE = os.environ.get("PAYPAL_BASE", "https://api-m.sandbox.paypal.com")
+PAYPAL_CLIENT_ID = os.environ.get("PAYPAL_CLIENT_ID", "")
+PAYPAL_SECRET = os.environ.get("PAYPAL_SECRET", "")
+PAYPAL_WEBHOOK_ID = os.environ.get("PAYPAL_WEBHOOK_ID", "")  # пусто — вебхуки не принимаются (нечем проверить подпись)
+PAYPAL_WORKERS = int(os.environ.get("PAYPAL_WORKERS", "4"))  # capture/начисление в фоне
+PAYPAL_QUEUE_SIZE = int(os.environ.get("PAYPAL_QUEUE_SIZE", "10000"))
+PLANS = load_plans()
+PLAN_FREE_QUESTS = int(os.environ.get("PLAN_FREE_QUESTS", "5"))
+METERING = os.environ.get("METERING", "1") == "1"  # 0 — квоты не проверяются
+METER_BACKEND = os.environ.get("METER_BACKEND", STATE_BACKEND)  # redis — общие счётчики (обязателен при WORKERS>1)
+METER_FAIL_OPEN = os.environ.get("METER_FAIL_OPEN", "0") == "1"  # 1 — при сбое Redis/БД вопросы без учёта
+WORKERS = int(os.environ.get("WORKERS", "1"))  # процессов gunicorn (entrypoint.sh)
+METER_RECONCILE_INTERVAL = float(os.environ.get("METER_RECONCILE_INTERVAL", "10"))  # сек. между сверками с БД
+DATABASE_URL = os.environ.get("DATABASE_URL", "")
+INTENTS_FILE = os.environ.get("INTENTS_FILE", "")  # JSON со своими намерениями вместо встроенных
+OPENAI_MAX_HISTORY = int(os.environ.get("OPENAI_MAX_HISTORY", "8"))  # реплик диалога в запросе; 0 — без истории
+OPENAI_HISTORY_TOKENS = int(os.environ.get("OPENAI_HISTORY_TOKENS", "1500"))  # бюджет токенов на историю
+OPENAI_HISTORY_SUMMARY = os.environ.get("OPENAI_HISTORY_SUMMARY", "1") == "1"  # сворачивать вытесненное
+OPENAI_SUMMARY_MODEL = os.environ.get("OPENAI_SUMMARY_MODEL", "") or OPENAI_FALLBACK_MODEL or "gpt-4o-mini"  # модель свёртки
+VOICE_BACKEND = os.environ.get("VOICE_BACKEND", "openai")  # openai | stub (офлайн) | off — без распознавания
+VOICE_MODEL = os.environ.get("VOICE_MODEL", "whisper-1")  # или gpt-4o-mini-transcribe
+VOICE_CONCURRENCY = int(os.environ.get("VOICE_CONCURRENCY", "4"))  # голосовых в обработке на воркер
+VOICE_MAX_PENDING = int(os.environ.get("VOICE_MAX_PENDING", "16"))  # с ждущими; больше — «занято» (< UPDATE_MAX_INFLIGHT)
+VOICE_TRANSCODE = os.environ.get("VOICE_TRANSCODE", "auto")  # auto — если движок не берёт OGG; always; never
+VOICE_TRANSCODE_WORKERS = int(os.environ.get("VOICE_TRANSCODE_WORKERS", "2"))  # процессов под ffmpeg
+VOICE_MAX_MB = float(os.environ.get("VOICE_MAX_MB", "20"))  # больше не качаем (лимит getFile — 20 МБ)
+VOICE_CACHE_SIZE = int(os.environ.get("VOICE_CACHE_SIZE", "10000"))  # расшифровок по file_unique_id
+VOICE_CACHE_TTL = int(os.environ.get("VOICE_CACHE_TTL", "86400"))
+# общий каталог снимков метрик для WORKERS>1 (entrypoint.sh чистит его перед стартом); пусто — только свой процесс
+METRICS_MULTIPROC_DIR = os.environ.get("METRICS_MULTIPROC_DIR") or os.environ.get("PROMETHEUS_MULTIPROC_DIR", "")
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")  # непусто — /metrics и /stats только с Authorization: Bearer <token>
+TRACE_SAMPLE_RATE = float(os.environ.get("TRACE_SAMPLE_RATE", "0"))  # доля апдейтов с трассой; 0 — выключено
+TRACE_SLOW_SECONDS = float(os.environ.get("TRACE_SLOW_SECONDS", "5"))  # трасса дольше — в лог WARNING
+TRACE_KEEP = int(os.environ.get("TRACE_KEEP", "200"))  # последних трасс для /admin/traces
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN", "")  # /admin/* с Authorization: Bearer <token>; пусто — выключены
+PROFILE_MAX_SECONDS = float(os.environ.get("PROFILE_MAX_SECONDS", "60"))
+
+setup_logger()  # корневой логгер: очередь + фоновый поток (logger_config.py)
+logger = logging.getLogger("bot")
+tracing.tracer.configure(sample_rate=TRACE_SAMPLE_RATE, slow_seconds=TRACE_SLOW_SECONDS, keep=TRACE_KEEP)
+
+# =========================
+# Metrics (/metrics): горячий путь апдейта
+# =========================
+llm_seconds = metrics.histogram("llm_request_seconds", "ask_openai целиком (с попаданиями в кэш)", labels=("model",))
+llm_requests_total = metrics.counter("llm_requests_total", "Вызовы ask_openai по исходу", labels=("model", "outcome"))
+reply_seconds = metrics.histogram("reply_seconds", "Ответ на сообщение через модель, по намерению", labels=("intent",))
+sanitize_seconds = metrics.histogram("sanitize_seconds", "sanitize_output", buckets=metrics.FAST_BUCKETS)
+send_seconds = metrics.histogram("send_clean_seconds", "send_clean: чистка + отправка")
+feed_seconds = metrics.histogram("feed_update_seconds", "Валидация и обработка апдейта aiogram", labels=("type",))
+tg_api_seconds = metrics.histogram("telegram_api_seconds", "Запросы к Bot API", labels=("method",))
+tg_api_errors = metrics.counter("telegram_api_errors_total", "Ошибки Bot API", labels=("method", "error"))
+
+def _model_label(prompt: str, system: Optional[str] = None, temperature: float = 0.7, model: Optional[str] = None,
+                 **kwargs) -> str:
+    return model or OPENAI_MODEL
 
 # =========================
 # OpenAI
 # =========================
-_openai_client = None
-def get_openai_client():
+_openai_client: Optional[LLMEngine] = None
+def get_openai_client() -> Optional[LLMEngine]:
     global _openai_client
     if _openai_client is None:
         try:
-            from openai import OpenAI
-            _openai_client = OpenAI(api_key=OPENAI_API_KEY)
+            _openai_client = LLMEngine(
+                api_key=OPENAI_API_KEY,
+                base_url=OPENAI_BASE_URL or None,
+                timeout=OPENAI_TIMEOUT,
+                max_connections=OPENAI_MAX_CONNECTIONS,
+                max_keepalive=OPENAI_MAX_KEEPALIVE,
+                model_concurrency=OPENAI_MODEL_CONCURRENCY,
+                model_limits=OPENAI_MODEL_LIMITS,
+            )
         except Exception:
             _openai_client = None
     return _openai_client
 
-async def ask_openai(prompt: str, system: Optional[str] = None, temperature: float = 0.7, model: Optional[str] = None) -> str:
-    client = get_openai_client()
-    if not client:
-        return "Пока нет доступа к GPT‑4o. Подключите OPENAI_API_KEY и перезапустите."
+response_cache = ResponseCache(maxsize=RESPONSE_CACHE_SIZE, ttl=RESPONSE_CACHE_TTL,
+                               backend=make_backend("redis", REDIS_URL) if RESPONSE_CACHE_PERSIST else None)
+
+LLM_UNAVAILABLE = "Пока нет доступа к GPT‑4o. Подключите OPENAI_API_KEY и перезапустите."
+LLM_ERROR = "Не смог получить ответ от модели"
+LLM_TIMEOUT = "Модель сейчас отвечает слишком долго. Попробуйте ещё раз чуть позже."
+
+# reply_llm отмечает, что вместо ответа ушёл текст ошибки/таймаута (answer_metered вернёт вопрос)
+_llm_failed: ContextVar[bool] = ContextVar("llm_failed", default=False)
+
+def is_llm_error(text: str) -> bool:
+    return text.startswith((LLM_UNAVAILABLE, LLM_ERROR, LLM_TIMEOUT))
+
+# дедлайн/ошибка основной модели -> кэш -> OPENAI_FALLBACK_MODEL (supervisor.py)
+supervisor = Supervisor(fallback_model=OPENAI_FALLBACK_MODEL or None, fallback_deadline=OPENAI_FALLBACK_DEADLINE,
+                        is_error=lambda ans: ans.startswith(LLM_ERROR))
+
+def _cache_key(prompt: str, system: Optional[str], temperature: float, model: str, cache: bool,
+               context: Sequence[dict] = ()) -> Optional[str]:
+    # творческие ответы (высокая температура) должны отличаться — их не кэшируем
+    if not (cache and RESPONSE_CACHE and temperature <= RESPONSE_CACHE_MAX_TEMP):
+        return None
+    return response_cache.key(model, system, prompt, temperature, context)
+
+def _build_messages(prompt: str, system: Optional[str], context: Sequence[dict]) -> List[dict]:
     msgs = []
     if system:
         msgs.append({"role": "system", "content": system})
+    msgs.extend(context)  # история диалога (history.py)
     msgs.append({"role": "user", "content": prompt})
+    return msgs
+
+@metrics.timed(llm_seconds, label=_model_label)
+async def ask_openai(prompt: str, system: Optional[str] = None, temperature: float = 0.7, model: Optional[str] = None,
+                     cache: bool = True, context: Sequence[dict] = ()) -> str:
+    use_model = model or OPENAI_MODEL
+    client = get_openai_client()
+    if not client:
+        llm_requests_total.labels(use_model, "unavailable").inc()
+        return LLM_UNAVAILABLE
+    msgs = _build_messages(prompt, system, context)
+    key = _cache_key(prompt, system, temperature, use_model, cache, context)
+    if key:
+        cached = await response_cache.get(key)
+        if cached is not None:
+            llm_requests_total.labels(use_model, "cached").inc()
+            return cached
+    try:
+        ans = await client.complete(msgs, model=use_model, temperature=temperature)
+    except Exception as e:
+        llm_requests_total.labels(use_model, "error").inc()
+        return f"{LLM_ERROR} ({type(e).__name__}): {e}"
+    llm_requests_total.labels(use_model, "ok").inc()
+    if key and ans:
+        await response_cache.set(key, ans)
+    return ans
+
+async def ask_openai_stream(prompt: str, system: Optional[str] = None, temperature: float = 0.7,
+                            model: Optional[str] = None, cache: bool = True,
+                            context: Sequence[dict] = ()) -> AsyncIterator[str]:
+    client = get_openai_client()
+    if not client:
+        yield LLM_UNAVAILABLE
+        return
+    msgs = _build_messages(prompt, system, context)
     use_model = model or OPENAI_MODEL
+    key = _cache_key(prompt, system, temperature, use_model, cache, context)
+    if key:
+        cached = await response_cache.get(key)
+        if cached is not None:
+            yield cached
+            return
+    parts: List[str] = []
     try:
-        resp = client.chat.completions.create(model=use_model, messages=msgs, temperature=temperature)
-        return resp.choices[0].message.content.strip()
+        async for delta in client.stream(msgs, model=use_model, temperature=temperature):
+            parts.append(delta)
+            yield delta
     except Exception as e:
-        return f"Не смог получить ответ от модели ({type(e).__name__}): {e}"
+        if not parts:
+            yield f"{LLM_ERROR} ({type(e).__name__}): {e}"
+        return
+    if key and parts:
+        await response_cache.set(key, "".join(parts).strip())
 
 # =========================
 # App/Bot/DP
 # =========================
 app = FastAPI()
-bot = Bot(token=TELEGRAM_BOT_TOKEN, parse_mode=None)  # никакого форматирования Telegram
+_bot_session = (keyboards.PrebuiltMarkupSession(api=TelegramAPIServer.from_base(TELEGRAM_API_BASE))
+                if TELEGRAM_API_BASE else keyboards.PrebuiltMarkupSession())
+bot = Bot(token=TELEGRAM_BOT_TOKEN, parse_mode=None, session=_bot_session)  # никакого форматирования Telegram
+
+@bot.session.middleware
+async def telegram_api_metrics(make_request, tg_bot: Bot, method):
+    name = type(method).__name__
+    started = time.perf_counter()
+    try:
+        with tracing.span(f"tg.{name}"):
+            return await make_request(tg_bot, method)
+    except Exception as e:
+        tg_api_errors.labels(name, type(e).__name__).inc()
+        raise
+    finally:
+        tg_api_seconds.labels(name).observe(time.perf_counter() - started)
+
 dp = Dispatcher()
 router = Router()
 dp.include_router(router)
 
 # =========================
-# UI
+# DB / Metering
 # =========================
-def make_reply_menu_button(ui_lang: str = "ru"):
-    text = {"ru": "Меню", "en": "Menu", "he": "תפריט"}.get(ui_lang, "Меню")
-    return ReplyKeyboardMarkup(
-        resize_keyboard=True,
-        keyboard=[[KeyboardButton(text=text)]],
-        input_field_placeholder={"ru": "Напишите сообщение…", "en": "Type a message…", "he": "הקלד/י הודעה…"}
-            .get(ui_lang, "Напишите сообщение…"),
-        selective=True
-    )
+def make_db_engine():
+    # подключение откроется при первом запросе, не при импорте
+    if not DATABASE_URL:
+        return None
+    try:
+        from sqlalchemy.ext.asyncio import create_async_engine
+        return create_async_engine(DATABASE_URL.replace("postgresql://", "postgresql+asyncpg://"),
+                                   pool_pre_ping=True)
+    except Exception as e:
+        logger.warning("db: engine unavailable (%s)", e)
+        return None
+
+db_engine = make_db_engine()
+meter = Meter(make_meter_backend(METER_BACKEND, REDIS_URL, workers=WORKERS if METERING else 1),
+              free_quota=PLAN_FREE_QUESTS, engine=db_engine, reconcile_interval=METER_RECONCILE_INTERVAL,
+              fail_open=METER_FAIL_OPEN)
+
+async def summarize_history(summary: str, dropped: List[dict]) -> str:
+    # вытесненные из окна реплики -> короткое содержание (дешёвой моделью, без кэша)
+    client = get_openai_client()
+    if not client:
+        return summary
+    lines = "\n".join(f"{m['role']}: {m['content']}" for m in dropped)
+    prompt = (f"Прежнее краткое содержание: {summary or '—'}\nНовые реплики:\n{lines}\n"
+              "Обнови краткое содержание разговора: 2–4 предложения, только факты и договорённости, "
+              "на языке разговора.")
+    return await client.complete([{"role": "user", "content": prompt}], model=OPENAI_SUMMARY_MODEL, temperature=0.2)
+
+history = HistoryStore(max_messages=OPENAI_MAX_HISTORY, budget=OPENAI_HISTORY_TOKENS, engine=db_engine,
+                       summarize=summarize_history if OPENAI_HISTORY_SUMMARY else None)
+
+voice_pipeline = VoicePipeline(
+    bot, make_transcriber(VOICE_BACKEND, get_openai_client, VOICE_MODEL),
+    concurrency=VOICE_CONCURRENCY, max_pending=VOICE_MAX_PENDING, max_bytes=int(VOICE_MAX_MB * 1024 * 1024),
+    transcode_workers=VOICE_TRANSCODE_WORKERS, transcode_mode=VOICE_TRANSCODE,
+    cache_size=VOICE_CACHE_SIZE, cache_ttl=VOICE_CACHE_TTL,
+) if VOICE_BACKEND != "off" else None
 
-def make_inline_menu(ui_lang: str = "ru"):
-    t = {
-        "help": {"ru": "Помощь", "en": "Help", "he": "עזרה"},
-        "pay": {"ru": "Оплатить", "en": "Pay", "he": "תשלום"},
-        "refs": {"ru": "Рефералы", "en": "Referrals", "he": "הפניות"},
-        "profile": {"ru": "Профиль", "en": "Profile", "he": "פרופיל"},
-        "lang": {"ru": "Сменить язык", "en": "Change language", "he": "שנה שפה"},
-        "mode": {"ru": "Режим ответа", "en": "Reply mode", "he": "מצב תגובה"},
-        "tts": {"ru": "Озвучить (TTS)", "en": "Speak (TTS)", "he": "המרה לדיבור"},
-        "asr": {"ru": "Показать расшифровку", "en": "Show transcript", "he": "הצג תמליל"},
-        "close": {"ru": "Скрыть", "en": "Close", "he": "סגור"},
-    }
-    def _(k): return t[k].get(ui_lang, t[k]["ru"])
-    return InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text=_("help"), callback_data="help"),
-         InlineKeyboardButton(text=_("pay"), callback_data="pay")],
-        [InlineKeyboardButton(text=_("refs"), callback_data="refs"),
-         InlineKeyboardButton(text=_("profile"), callback_data="profile")],
-        [InlineKeyboardButton(text=_("lang"), callback_data="lang"),
-         InlineKeyboardButton(text=_("mode"), callback_data="mode")],
-        [InlineKeyboardButton(text=_("tts"), callback_data="tts"),
-         InlineKeyboardButton(text=_("asr"), callback_data="asr")],
-        [InlineKeyboardButton(text=_("close"), callback_data="close_menu")],
-    ])
+# =========================
+# Payments (PayPal)
+# =========================
+async def credit_plan(user_id: int, plan: str, order_id: str):
+    # вызывается воркером платежей ровно один раз на оплаченный ордер
+    logger.info("pay: order %s: user %s plan %s", order_id, user_id, plan)
+    p = PLANS.get(plan)
+    if p is None:
+        logger.error("pay: order %s: unknown plan %s, nothing credited", order_id, plan)
+        return
+    await meter.credit(user_id, questions=p.quota, months=p.months)
+    try:
+        await bot.send_message(user_id, f"Оплата получена, тариф {plan} активирован. Спасибо!")
+    except Exception as e:
+        logger.warning("pay: notify %s failed (%s)", user_id, e)
+
+payments = None
+if PAYPAL_CLIENT_ID and PAYPAL_SECRET:
+    payments = PaymentPipeline(
+        PayPalClient(base_url=PAYPAL_BASE, client_id=PAYPAL_CLIENT_ID, client_secret=PAYPAL_SECRET,
+                     return_base=BASE_URL),
+        credit_plan, make_store(STATE_BACKEND, REDIS_URL),
+        webhook_id=PAYPAL_WEBHOOK_ID, workers=PAYPAL_WORKERS, maxsize=PAYPAL_QUEUE_SIZE,
+    )
+    app.include_router(make_paypal_router(payments))
 
 # =========================
 # Language policy
 # =========================
 UserId = int
-user_ui_lang: Dict[UserId, str] = defaultdict(lambda: "ru")
-user_lang_hist: Dict[UserId, Deque[str]] = defaultdict(lambda: deque(maxlen=3))
+user_state = UserStateStore(make_backend(STATE_BACKEND, REDIS_URL), local_size=STATE_LOCAL_SIZE,
+                            local_ttl=STATE_LOCAL_TTL, flush_interval=STATE_FLUSH_MS / 1000)
+
+async def get_ui_lang(uid: UserId) -> str:
+    return (await user_state.get(uid)).ui_lang
+CONTENT_LANGS = ("he", "ru", "en")  # языки ответа, для которых есть промпты
 
 def detect_script_lang(text: str) -> Optional[str]:
-    heb = sum('\u0590' <= ch <= '\u05FF' for ch in text)     # Hebrew
-    cyr = sum('А' <= ch <= 'я' or ch in "ёЁ" for ch in text)  # Cyrillic
-    lat = sum('A' <= ch <= 'z' for ch in text)                # Latin
-    if heb > cyr and heb > lat and heb > 0: return "he"
-    if cyr > lat and cyr > heb and cyr > 0: return "ru"
-    if lat > cyr and lat > heb and lat > 0: return "en"
-    return None
-
-def choose_content_lang(user_id: int, text: str) -> str:
+    return _detect_script_lang(text, CONTENT_LANGS)
+
+async def choose_content_lang(user_id: int, text: str) -> str:
+    st = await user_state.get(user_id)
+    lang = _choose_content_lang(st, text)
+    user_state.mark_dirty(user_id, st, "lang_hist")
+    return lang
+
+def _choose_content_lang(st: UserRecord, text: str) -> str:
     t = (text or "").strip()
     det = detect_script_lang(t)
     # EN — не переключаемся на коротышах; RU/HE — мгновенно
@@ -138,13 +378,13 @@ def choose_content_lang(user_id: int, text: str) -> str:
     elif det == "en":
         lang = "en"
     else:
-        hist = user_lang_hist[user_id]
+        hist = st.lang_hist
         if len(hist) >= 2:
             for l in ("ru", "en", "he"):
                 if sum(1 for x in hist if x == l) >= 2:
                     return l
-        lang = user_ui_lang[user_id]
-    hist = user_lang_hist[user_id]
+        lang = st.ui_lang
+    hist = st.lang_hist
     hist.append(lang)
     for l in ("ru", "en", "he"):
         if sum(1 for x in hist if x == l) >= 2:
@@ -154,12 +394,8 @@ def choose_content_lang(user_id: int, text: str) -> str:
 # =========================
 # Anti-echo (voice)
 # =========================
-recent_voice_meta: Dict[UserId, Dict[str, float]] = defaultdict(dict)
 def anti_echo_reply(ui_lang: str = "ru"):
-    heads = {"ru": ("Кратко", "Детали", "Чек‑лист"),
-             "en": ("Brief", "Details", "Checklist"),
-             "he": ("תמצית", "פרטים", "צ׳ק‑ליסט")}
-    h = heads.get(ui_lang, heads["ru"])
+    h = (t("voice_brief", ui_lang), t("voice_details", ui_lang), t("voice_checklist", ui_lang))
     return (
         f"{h[0]}: Я услышал(а) ваш голос и понял(а) задачу. Сформулирую ответ без повтора вашей речи.\n\n"
         f"{h[1]}: Опишу подход, предложу варианты и подводные камни. Если нужна расшифровка — нажмите кнопку ниже.\n\n"
@@ -170,149 +406,166 @@ def anti_echo_reply(ui_lang: str = "ru"):
 # =========================
 # Sanitize: убираем Markdown/«звёздочки»/маркеры
 # =========================
-HEADER_PAT = re.compile(r'^\s*#{1,6}\s*')     # ### заголовки
-BLOCKQUOTE_PAT = re.compile(r'^\s*>\s+')      # цитаты >
-DASH_BULLET_PAT = re.compile(r'^\s*[–—]\s+')  # тире‑буллеты в начале строки
-
-META_PATTERNS = [
-    re.compile(r'^\s*конечно[,.! ]', re.IGNORECASE),
-    re.compile(r'^\s*давайте[,.! ]', re.IGNORECASE),
-    re.compile(r'^\s*с удовольствием[,.! ]', re.IGNORECASE),
-    re.compile(r'^\s*вот как (?:можно|мы)\b', re.IGNORECASE),
-    re.compile(r'^\s*предлагаю\b', re.IGNORECASE),
-]
-
-def strip_markdown_line_start(ln: str) -> str:
-    s = ln.strip()
-    if s.startswith("```"):
-        return ""  # убираем code fence блоки
-    ln = BLOCKQUOTE_PAT.sub("", ln)
-    ln = HEADER_PAT.sub("", ln)
-    # убираем маркеры списков в начале строки: -, +, •, ►, ▪, ▫, ●, ○, ◆, ◇
-    ln = re.sub(r'^\s*([\-+\•►▪▫●○◆◇])\s+', '', ln)
-    # убираем тире‑буллеты — и –
-    ln = DASH_BULLET_PAT.sub("", ln)
-    return ln
-
+@metrics.timed(sanitize_seconds)
 def sanitize_output(text: str) -> str:
-    if not text:
-        return text
-    orig = text
-
-    # 1) Построчная чистка
-    lines = [strip_markdown_line_start(ln) for ln in text.splitlines()]
-    text = "\n".join(ln for ln in lines if ln is not None)
-
-    # 2) Жир/курсив Markdown: **..**, __..__, *..*, _.._
-    text = re.sub(r'\*\*(.*?)\*\*', r'\1', text, flags=re.S)
-    text = re.sub(r'__(.*?)__', r'\1', text, flags=re.S)
-    text = re.sub(r'(?<!\S)\*(.+?)\*(?!\S)', r'\1', text, flags=re.S)
-    text = re.sub(r'(?<!\S)_(.+?)_(?!\S)', r'\1', text, flags=re.S)
-
-    # 3) «Страховка»: по желанию — полностью вырезаем # * _ `
-    if HARD_STRIP_MARKDOWN:
-        text = re.sub(r'[#*_`]+', '', text)
-
-    # 4) Убираем стартовые мета‑фразы
-    text = text.strip()
-    ls = text.splitlines()
-    while ls:
-        head = ls[0].strip()
-        if any(p.match(head) for p in META_PATTERNS):
-            ls.pop(0)
-        else:
-            break
-    text = "\n".join(ls).strip()
-
-    # 5) Сжимаем пустые строки и лишние пробелы
-    text = re.sub(r'\n{3,}', '\n\n', text)
-    text = re.sub(r'[ \t]{2,}', ' ', text)
-
-    if DEBUG_SANITIZE:
-        print("SANITIZE_ORIG:", orig[:200].replace("\n", "\\n"))
-        print("SANITIZE_CLEAN:", text[:200].replace("\n", "\\n"))
-    return text
-
+    with tracing.span("sanitize"):
+        clean = _sanitize(text, hard_strip=HARD_STRIP_MARKDOWN)
+    if DEBUG_SANITIZE and text:
+        # через очередь логов (без print в event loop); частоту режет LOG_SAMPLE_RATE
+        logger.info("sanitize: %r -> %r", text[:200], clean[:200])
+    return clean
+
+@metrics.timed(send_seconds)
 async def send_clean(msg_or_chat, text: str, **kwargs):
-    return await msg_or_chat.answer(sanitize_output(text), **kwargs)
+    with tracing.span("send"):
+        return await msg_or_chat.answer(sanitize_output(text), **kwargs)
 
 # =========================
-# System prompts
+# Streaming: первое сообщение сразу, дальше — редкие правки
 # =========================
-def system_prompt_for(lang: str) -> str:
-    if lang == "ru":
-        return "Ты SmartPro 24/7. Отвечай строго на русском. Без Markdown/звёздочек/списков/жира/курсива. Обычный текст. Эмодзи можно."
-    if lang == "he":
-        return "את/ה SmartPro 24/7. ענה אך ורק בעברית. בלי Markdown/כוכביות/רשימות/הדגשות. טקסט פשוט. אמוג׳י מותר."
-    return "You are SmartPro 24/7. Answer strictly in English. No Markdown/asterisks/lists/bold/italics. Plain text. Emojis allowed."
-
-def copy_system_prompt_for(lang: str) -> str:
-    if lang == "ru":
-        return "Ты копирайтер. 1‑е лицо, тёплый тон. Без Markdown/звёздочек/списков/заголовков. 2–4 коротких абзаца."
-    if lang == "he":
-        return "את/ה קופירייטר/ית. גוף ראשון, טון חם. בלי Markdown/כוכביות/רשימות/כותרות. 2–4 פסקאות קצרות."
-    return "Experienced copywriter. First person, warm tone. No Markdown/asterisks/lists/headings. 2–4 short paragraphs."
-
-def build_user_prompt(lang: str, user_text: str) -> str:
-    if lang == "ru":
-        return f"Запрос пользователя: {user_text}\nДай точный, небанальный ответ по теме. Без Markdown/звёздочек/списков."
-    if lang == "he":
-        return f"בקשת המשתמש: {user_text}\nענה/עני תשובה מדויקת וישירה בנושא. בלי Markdown/כוכביות/רשימות."
-    return f"User request: {user_text}\nProvide a precise, non‑generic answer. No Markdown/asterisks/lists."
+TG_MESSAGE_LIMIT = 4096
+first_text_seconds = metrics.histogram("reply_first_text_seconds", "Время до первого видимого текста ответа")
+
+def split_for_telegram(text: str, limit: int = TG_MESSAGE_LIMIT) -> List[str]:
+    parts = []
+    while len(text) > limit:
+        cut = text.rfind("\n", 0, limit)
+        if cut <= 0:
+            cut = text.rfind(" ", 0, limit)
+        if cut <= 0:
+            cut = limit
+        parts.append(text[:cut].rstrip())
+        text = text[cut:].lstrip()
+    parts.append(text)
+    return parts
+
+async def _show_parts(message: Message, sent: List[Message], shown: List[str], parts: List[str]) -> bool:
+    for i, part in enumerate(parts):
+        if not part:
+            continue
+        if i >= len(sent):
+            try:
+                sent.append(await message.answer(part))
+            except TelegramRetryAfter:
+                return False  # как и с правками: вызывающий подождёт и повторит
+            shown.append(part)
+        elif shown[i] != part:
+            try:
+                await sent[i].edit_text(part)
+            except TelegramRetryAfter:
+                return False
+            except TelegramBadRequest:
+                pass  # message is not modified и т.п.
+            shown[i] = part
+    return True
+
+async def send_streamed(message: Message, chunks: AsyncIterator[str], started: float):
+    clean = StreamSanitizer(hard_strip=HARD_STRIP_MARKDOWN)
+    sent: List[Message] = []
+    shown: List[str] = []
+    next_edit = 0.0
+    pending = False
+    async for delta in chunks:
+        # показываем только завершённые строки — недописанная разметка не мигает
+        pending = clean.feed(delta) or pending
+        now = time.monotonic()
+        if not pending or (sent and now < next_edit):
+            continue
+        pending = False
+        visible = clean.text()
+        if not visible:
+            continue
+        if not sent:
+            first_text_seconds.observe(now - started)
+        ok = await _show_parts(message, sent, shown, split_for_telegram(visible))
+        next_edit = time.monotonic() + (STREAM_EDIT_INTERVAL if ok else STREAM_EDIT_INTERVAL * 4)
+    final = clean.finish() or "…"
+    if not sent:
+        first_text_seconds.observe(time.monotonic() - started)
+    while not await _show_parts(message, sent, shown, split_for_telegram(final)):
+        await asyncio.sleep(STREAM_EDIT_INTERVAL)
+    return sent[-1] if sent else None
+
+@metrics.timed(reply_seconds, label=lambda *a, intent="default", **kw: intent)
+async def reply_llm(message: Message, prompt: str, system: Optional[str] = None,
+                    temperature: float = 0.7, model: Optional[str] = None, cache: bool = True,
+                    remember: Optional[str] = None, deadline: float = 25.0, intent: str = "default"):
+    # remember — исходный текст пользователя: ответ идёт с историей чата и сам в неё попадает
+    # deadline — сек. на ответ основной модели, дальше деградация (supervisor); intent — метка reply_seconds
+    started = time.monotonic()
+    use_history = remember is not None and OPENAI_MAX_HISTORY > 0
+    with tracing.span("history"):
+        context = await history.window(message.chat.id) if use_history else ()
+    use_model = model or OPENAI_MODEL
+
+    async def cached(m: str) -> Optional[str]:
+        key = _cache_key(prompt, system, temperature, m, cache, context)
+        return await response_cache.get(key) if key else None
+
+    typing = ChatAction(lambda: bot.send_chat_action(message.chat.id, "typing"), TYPING_INTERVAL)
+    typing.start()
+    try:
+        if STREAM_REPLIES:
+            parts: List[str] = []
+            async def tee(chunks):
+                async for delta in chunks:
+                    typing.stop()  # текст уже виден — статус не нужен
+                    parts.append(delta)
+                    yield delta
+                if not parts:
+                    yield LLM_TIMEOUT
+            chunks = supervisor.stream(
+                lambda m: ask_openai_stream(prompt, system=system, temperature=temperature, model=m, cache=cache,
+                                            context=context),
+                use_model, deadline, cached)
+            with tracing.span("llm.stream"):
+                res = await send_streamed(message, tee(chunks), started)
+            ans = "".join(parts).strip()
+        else:
+            with tracing.span("llm"):
+                ans = await supervisor.complete(
+                    lambda m: ask_openai(prompt, system=system, temperature=temperature, model=m, cache=cache,
+                                         context=context),
+                    use_model, deadline, cached) or LLM_TIMEOUT
+            typing.stop()
+            res = await send_clean(message, ans)
+            first_text_seconds.observe(time.monotonic() - started)
+    finally:
+        typing.stop()
+    failed = not ans or is_llm_error(ans)
+    _llm_failed.set(failed)
+    if use_history and not failed:
+        await history.add(message.chat.id, message.from_user.id, USER, remember, message.message_id)
+        await history.add(message.chat.id, message.from_user.id, ASSISTANT, ans, res.message_id if res else 0)
+    return res
 
 # =========================
-# Triggers (explicit creative only)
+# Intents (intents.py; свои — INTENTS_FILE)
 # =========================
-STORY_TRIG = re.compile(r'^\s*(напиши|сделай|сгенерируй)\b.*\b(сторис|story|инста-?сторис)\b', re.IGNORECASE | re.S)
-NARR_TRIG  = re.compile(r'^\s*(напиши|сделай|сгенерируй)\b.*\b(рассказ|эссе|сочинение|повесть|short\s+story|essay)\b', re.IGNORECASE | re.S)
-COPY_TRIG  = re.compile(r'(пост\s+приветств|приветстви[ея]\b|описани[ея]\b|био\b|bio\b)', re.IGNORECASE)
-
-def extract_topic_after_keyword(txt: str, keywords: list[str]) -> str:
-    pattern = re.compile(r'(' + '|'.join(map(re.escape, keywords)) + r')\b', re.IGNORECASE)
-    m = pattern.search(txt)
-    tail = txt[m.end():] if m else txt
-    tail = re.sub(r'^\s*(про|о|about)\b', '', tail, flags=re.IGNORECASE).strip()
-    return tail if tail else txt.strip()
+intent_router = IntentRouter(load_intents(INTENTS_FILE))
 
 # =========================
 # Commands
 # =========================
 async def set_commands():
-    await bot.set_my_commands(
-        [BotCommand(command="start", description="Приветствие"),
-         BotCommand(command="menu", description="Открыть меню"),
-         BotCommand(command="version", description="Проверить версию")],
-        scope=BotCommandScopeDefault(), language_code="ru",
-    )
-    await bot.set_my_commands(
-        [BotCommand(command="start", description="Greeting"),
-         BotCommand(command="menu", description="Open menu"),
-         BotCommand(command="version", description="Check version")],
-        scope=BotCommandScopeDefault(), language_code="en",
-    )
-    await bot.set_my_commands(
-        [BotCommand(command="start", description="ברכה"),
-         BotCommand(command="menu", description="פתח תפריט"),
-         BotCommand(command="version", description="בדיקת גרסה")],
-        scope=BotCommandScopeDefault(), language_code="he",
-    )
+    for lang in ("ru", "en", "he"):
+        await bot.set_my_commands(
+            [BotCommand(command=cmd, description=t("cmd_" + cmd, lang)) for cmd in ("start", "menu", "version")],
+            scope=BotCommandScopeDefault(), language_code=lang,
+        )
 
 # =========================
 # Handlers
 # =========================
 @router.message(CommandStart())
 async def on_start(message: Message):
-    uid = message.from_user.id
-    kb = make_reply_menu_button(user_ui_lang[uid])
-    text = {"ru": "Привет! Я SmartPro 24/7. Нажмите «Меню», когда нужно открыть действия.",
-            "en": "Hi! I’m SmartPro 24/7. Tap “Menu” when you want actions.",
-            "he": "היי! אני SmartPro 24/7. לחצו \"תפריט\" כדי לפתוח פעולות."}[user_ui_lang[uid]]
-    await send_clean(message, text, reply_markup=kb)
+    ui = await get_ui_lang(message.from_user.id)
+    await send_clean(message, t("start", ui), reply_markup=keyboards.reply_menu(ui))
 
 @router.message(Command("menu"))
 async def on_menu_cmd(message: Message):
-    uid = message.from_user.id
-    await send_clean(message, "Меню действий:", reply_markup=make_inline_menu(user_ui_lang[uid]))
+    ui = await get_ui_lang(message.from_user.id)
+    await send_clean(message, "Меню действий:", reply_markup=keyboards.inline_menu(ui))
 
 @router.message(Command("version"))
 async def on_version_cmd(message: Message):
@@ -321,26 +574,45 @@ async def on_version_cmd(message: Message):
 @router.message(F.text.casefold() == "меню")
 @router.message(F.text.casefold() == "menu")
 async def on_menu_text(message: Message):
-    uid = message.from_user.id
-    await send_clean(message, "Меню действий:", reply_markup=make_inline_menu(user_ui_lang[uid]))
+    ui = await get_ui_lang(message.from_user.id)
+    await send_clean(message, "Меню действий:", reply_markup=keyboards.inline_menu(ui))
 
 # ---------- Inline buttons ----------
 @router.callback_query(F.data == "help")
 async def on_help(cb: CallbackQuery):
-    uid = cb.from_user.id
-    ui = user_ui_lang[uid]
+    ui = await get_ui_lang(cb.from_user.id)
     await cb.answer("Открываю помощь…", show_alert=False)
-    text = {
-        "ru": "Я универсальный помощник. Просто задайте вопрос. Сторис/рассказ — по явной просьбе. Без Markdown/звёздочек/списков.",
-        "en": "Universal assistant. Ask anything. Stories/narratives on explicit request. No markdown/asterisks/lists.",
-        "he": "עוזר אוניברסלי. אפשר לשאול הכל. סטוריז/סיפור רק בבקשה מפורשת. בלי Markdown/כוכביות/רשימות.",
-    }.get(ui, "Я универсальный помощник. Просто задайте вопрос.")
-    await send_clean(cb.message, text)
+    await send_clean(cb.message, t("help", ui))
 
 @router.callback_query(F.data == "pay")
 async def on_pay(cb: CallbackQuery):
-    await cb.answer("Оплата скоро будет доступна", show_alert=False)
-    await send_clean(cb.message, "Оплата появится позже (Stripe Checkout).")
+    if payments is None or not PLANS:
+        await cb.answer("Оплата скоро будет доступна", show_alert=False)
+        await send_clean(cb.message, "Оплата появится позже.")
+        return
+    await cb.answer()
+    await cb.message.answer("Выберите тариф:", reply_markup=keyboards.plans_menu(tuple(PLANS.values())))
+
+@router.callback_query(F.data.startswith("pay:"))
+async def on_pay_plan(cb: CallbackQuery):
+    plan = PLANS.get(cb.data.split(":", 1)[1])
+    if payments is None or plan is None:
+        await cb.answer("Тариф недоступен", show_alert=False)
+        return
+    await cb.answer("Создаю счёт…", show_alert=False)
+    try:
+        order = await payments.client.create_order(plan.price, plan.name, user_id=cb.from_user.id)
+    except Exception as e:
+        logger.warning("pay: create_order failed (%s)", e)
+        await send_clean(cb.message, "Не удалось создать счёт, попробуйте позже.")
+        return
+    link = next((l["href"] for l in order.get("links", ()) if l.get("rel") in ("approve", "payer-action")), None)
+    if not link:
+        await send_clean(cb.message, "Не удалось получить ссылку на оплату.")
+        return
+    # ссылку не пропускаем через send_clean: чистка Markdown может испортить URL
+    await cb.message.answer(f"Тариф {plan.name}: ${plan.price}", reply_markup=InlineKeyboardMarkup(
+        inline_keyboard=[[InlineKeyboardButton(text="Оплатить через PayPal", url=link)]]))
 
 @router.callback_query(F.data == "refs")
 async def on_refs(cb: CallbackQuery):
@@ -356,11 +628,12 @@ async def on_profile(cb: CallbackQuery):
 @router.callback_query(F.data == "lang")
 async def on_change_lang(cb: CallbackQuery):
     uid = cb.from_user.id
-    cur = user_ui_lang[uid]
+    st = await user_state.get(uid)
     cycle = {"ru": "en", "en": "he", "he": "ru"}
-    user_ui_lang[uid] = cycle.get(cur, "en")
-    await cb.answer(f"UI язык: {user_ui_lang[uid].upper()}")
-    await send_clean(cb.message, "Язык интерфейса изменён.", reply_markup=make_reply_menu_button(user_ui_lang[uid]))
+    st.ui_lang = cycle.get(st.ui_lang, "en")
+    user_state.mark_dirty(uid, st, "ui_lang")
+    await cb.answer(f"UI язык: {st.ui_lang.upper()}")
+    await send_clean(cb.message, "Язык интерфейса изменён.", reply_markup=keyboards.reply_menu(st.ui_lang))
 
 @router.callback_query(F.data == "mode")
 async def on_mode(cb: CallbackQuery):
@@ -373,9 +646,30 @@ async def on_tts(cb: CallbackQuery):
     await send_clean(cb.message, "Озвучка (TTS) будет доступна по кнопке, когда подключим движок.")
 
 @router.callback_query(F.data == "asr")
+@router.callback_query(F.data.startswith("asr:"))
 async def on_show_transcript(cb: CallbackQuery):
-    await cb.answer("Показать расшифровку", show_alert=False)
-    await send_clean(cb.message, "Расшифровка будет доступна после подключения ASR (Whisper/gpt‑4o‑mini‑transcribe).")
+    # asr:<file_unique_id> — под ответом на голосовое; просто asr (меню) — последнее голосовое
+    await cb.answer(show_alert=False)  # сразу: распознавание может ещё идти
+    st = await user_state.get(cb.from_user.id)
+    ui = st.ui_lang
+    if voice_pipeline is None:
+        return await send_clean(cb.message, t("asr_unavailable", ui))
+    file_unique_id = cb.data.partition(":")[2] or st.voice_meta.get("last_file")
+    if not file_unique_id:
+        return await send_clean(cb.message, t("asr_no_voice", ui))
+    try:
+        text = await voice_pipeline.wait(file_unique_id)
+        src = cb.message.reply_to_message if cb.message else None
+        if text is None and src is not None and src.voice and src.voice.file_unique_id == file_unique_id:
+            text = await voice_pipeline.transcribe(src.voice.file_id, file_unique_id)  # кэш истёк/другой воркер
+    except VoiceError as e:
+        return await send_clean(cb.message, t(f"voice_{e.reason}", ui))
+    except Exception:
+        logger.exception("voice: transcript for the button failed")
+        return await send_clean(cb.message, t("voice_error", ui))
+    if text is None:
+        return await send_clean(cb.message, t("asr_no_voice", ui))
+    await send_clean(cb.message, f"{t('transcript_title', ui)}:\n{text or '—'}")
 
 @router.callback_query(F.data == "close_menu")
 async def on_close_menu(cb: CallbackQuery):
@@ -393,16 +687,38 @@ async def on_any_callback(cb: CallbackQuery):
 @router.message(F.voice)
 async def on_voice(message: Message):
     uid = message.from_user.id
-    ui_lang = user_ui_lang[uid]
-    recent_voice_meta[uid]["last_ts"] = time.time()
-    text = anti_echo_reply(ui_lang)
-    ik = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text={"ru": "Показать расшифровку", "en": "Show transcript", "he": "הצג תמליל"}[ui_lang],
-                              callback_data="asr")],
-        [InlineKeyboardButton(text={"ru": "Скрыть", "en": "Close", "he": "סגור"}[ui_lang],
-                              callback_data="close_menu")],
-    ])
-    await send_clean(message, text, reply_markup=ik)
+    st = await user_state.get(uid)
+    ui_lang = st.ui_lang
+    st.voice_meta["last_ts"] = time.time()
+    if voice_pipeline is None:
+        user_state.mark_dirty(uid, st, "voice_meta")
+        return await send_clean(message, anti_echo_reply(ui_lang), reply_markup=keyboards.voice_menu(ui_lang))
+    voice = message.voice
+    st.voice_meta["last_file"] = voice.file_unique_id
+    user_state.mark_dirty(uid, st, "voice_meta")
+    # квота — до платного распознавания; без расшифровки вопрос возвращается
+    if not await consume_question(message, uid):
+        return None
+    # ответ — на само голосовое: по reply_to_message кнопка найдёт файл, даже если кэш уже пуст
+    text = ""
+    try:
+        await send_clean(message, anti_echo_reply(ui_lang), reply_to_message_id=message.message_id,
+                         reply_markup=keyboards.voice_menu(ui_lang, voice.file_unique_id))
+        async with ChatAction(lambda: bot.send_chat_action(message.chat.id, "typing"), TYPING_INTERVAL):
+            text = await voice_pipeline.transcribe(voice.file_id, voice.file_unique_id)
+    except VoiceError as e:
+        if e.reason == "error":
+            logger.warning("voice: transcription failed (%s)", e)
+        return await send_clean(message, t(f"voice_{e.reason}", ui_lang))
+    except Exception:
+        logger.exception("voice: transcription failed")
+        return await send_clean(message, t("voice_error", ui_lang))
+    finally:
+        if not text:
+            await refund_question(uid)
+    if not text:
+        return await send_clean(message, t("voice_empty", ui_lang))
+    return await answer_charged(message, uid, text)
 
 @router.message(F.photo)
 async def on_photo(message: Message):
@@ -413,52 +729,58 @@ async def on_photo(message: Message):
 # =========================
 @router.message()
 async def on_text(message: Message):
-    uid = message.from_user.id
-    ui = user_ui_lang[uid]
-    text = (message.text or "").strip()
-    content_lang = choose_content_lang(uid, text)
-
-    # 1) СТОРИС — явная просьба
-    if STORY_TRIG.match(text):
-        topic = extract_topic_after_keyword(text, ["сторис", "story", "инста-сторис", "инста сторис"])
-        sys = ("You are a world‑class creative writer crafting cinematic, sensory Instagram‑style stories. "
-               f"Answer strictly in { 'Russian' if content_lang=='ru' else ('Hebrew' if content_lang=='he' else 'English') }. "
-               "No Markdown/asterisks/lists/headings.")
-        prompt = (f"Тема сторис: {topic}\n"
-                  f"Напиши 6–8 кинематографичных кадров (1–2 насыщенные фразы на кадр) со звуками/запахами/тактильностью, "
-                  f"точными наблюдениями и сильной концовкой. Пиши на ({content_lang}). Без вступительных фраз и инструкций.")
-        ans = await ask_openai(prompt, system=sys, temperature=0.9, model="gpt-4o")
-        return await send_clean(message, ans)
-
-    # 2) Рассказ/эссе — явная просьба
-    if NARR_TRIG.match(text):
-        topic = extract_topic_after_keyword(text, ["рассказ", "эссе", "сочинение", "повесть", "short story", "essay"])
-        sys = ("You are a literary writer. Produce a vivid short narrative. "
-               f"Answer strictly in { 'Russian' if content_lang=='ru' else ('Hebrew' if content_lang=='he' else 'English') }. "
-               "No Markdown/asterisks/lists/headings.")
-        prompt = (f"Тема рассказа: {topic}\n"
-                  f"Напиши короткий рассказ 350–600 слов на ({content_lang}), с образностью, ритмом, сценами, диалогами по необходимости. "
-                  f"Без клише и без объяснений формата.")
-        ans = await ask_openai(prompt, system=sys, temperature=0.8, model="gpt-4o")
-        return await send_clean(message, ans)
-
-    # 3) Копирайт (приветствие/био/описание)
-    if COPY_TRIG.search(text):
-        m = re.search(r'меня зовут\s+([A-Za-zА-Яа-яЁё\-]+)', text, re.IGNORECASE)
+    return await answer_metered(message, message.from_user.id, (message.text or "").strip())
+
+async def answer_metered(message: Message, uid: int, text: str):
+    # вопрос списывается с квоты, только если ответ ушёл
+    if not await consume_question(message, uid):
+        return None
+    return await answer_charged(message, uid, text)
+
+async def consume_question(message: Message, uid: int) -> bool:
+    """Списать вопрос до платной работы; False — нельзя (пользователю уже ответили)."""
+    if not METERING:
+        return True
+    try:
+        if await meter.try_consume(uid):
+            return True
+        await on_quota_exhausted(message)
+    except MeterUnavailable:
+        await send_clean(message, t("meter_unavailable", await get_ui_lang(uid)))
+    return False
+
+async def refund_question(uid: int):
+    if METERING:
+        await meter.refund(uid)
+
+async def answer_charged(message: Message, uid: int, text: str):
+    # вопрос уже списан (consume_question): без ответа он возвращается
+    _llm_failed.set(False)
+    try:
+        res = await answer_text(message, uid, text)
+    except BaseException:
+        # ответа не было (ошибка/Telegram закрыл соединение) — вопрос не списываем
+        await refund_question(uid)
+        raise
+    if _llm_failed.get():
+        await refund_question(uid)  # вместо ответа — текст ошибки/таймаута модели
+    return res
+
+async def on_quota_exhausted(message: Message):
+    ui = await get_ui_lang(message.from_user.id)
+    await send_clean(message, t("quota_exhausted", ui), reply_markup=keyboards.pay_button(ui))
+
+async def answer_text(message: Message, uid: int, text: str):
+    with tracing.span("lang"):
+        content_lang = await choose_content_lang(uid, text)
+    with tracing.span("route"):
+        routed = intent_router.route(text)
+        intent = routed.intent
         tg_name = (message.from_user.first_name or "").strip() if message.from_user else ""
-        name = m.group(1) if m else tg_name
-        sys = copy_system_prompt_for(content_lang)
-        prompt = (f"Напиши пост-приветствие в первом лице на ({content_lang}). "
-                  f"Если имя доступно, используй его: {name if name else 'имя не указано'}. "
-                  f"Суть из запроса: {text}. Избегай клише и шаблонов, не используй списки и заголовки.")
-        ans = await ask_openai(prompt, system=sys, temperature=0.65)
-        return await send_clean(message, ans)
-
-    # 4) По умолчанию — универсальный ответ
-    sys = system_prompt_for(content_lang)
-    prompt = build_user_prompt(content_lang, text)
-    ans = await ask_openai(prompt, system=sys, temperature=0.55)
-    return await send_clean(message, ans)
+        sys, prompt = intent.render(content_lang, text, topic=routed.topic, name=routed.name or tg_name)
+    return await reply_llm(message, prompt, system=sys, temperature=intent.temperature, model=intent.model,
+                           cache=intent.cache, remember=text if intent.history else None, deadline=intent.deadline,
+                           intent=intent.name)
 
 # =========================
 # FastAPI routes
@@ -467,22 +789,185 @@ async def on_text(message: Message):
 async def version():
     return "UNIVERSAL GPT‑4o — HOTFIX#7b‑U10"
 
+update_filter = UpdateFilter(TELEGRAM_ALLOWED_UPDATES, MAX_TELEGRAM_PAYLOAD_BYTES)
+dedup = make_dedup(UPDATE_DEDUP_BACKEND, REDIS_URL, UPDATE_DEDUP_WINDOW, UPDATE_DEDUP_TTL) if UPDATE_DEDUP else None
+_OK_BODY = b'{"ok":true}'
+
+def _ok() -> Response:
+    return Response(_OK_BODY, media_type="application/json")
+
 @app.post(WEBHOOK_PATH)
 async def tg_webhook(request: Request):
     secret = request.headers.get("X-Telegram-Bot-Api-Secret-Token")
     if secret != WEBHOOK_SECRET:
         raise HTTPException(status_code=403, detail="Invalid secret")
-    data = await request.json()
-    update = Update.model_validate(data)
-    await dp.feed_update(bot, update)
-    return JSONResponse({"ok": True})
+    with tracing.root("webhook"):
+        return await _handle_update(request)
+
+async def _handle_update(request: Request):
+    if update_filter.too_large(request.headers.get("content-length")):
+        return JSONResponse({"ok": False, "error": "payload too large"}, status_code=413)
+    with tracing.span("receive"):
+        body = await request.body()
+    with tracing.span("parse"):
+        verdict, data = update_filter.parse(body)
+    if verdict != ACCEPT:
+        if verdict == IGNORE:
+            return _ok()  # тип не нужен обработчикам — подтверждаем, чтобы Telegram не повторял
+        if verdict == TOO_LARGE:
+            return JSONResponse({"ok": False, "error": "payload too large"}, status_code=413)
+        return JSONResponse({"ok": False, "error": "invalid update"}, status_code=400)
+    if dedup is not None:
+        with tracing.span("dedup"):
+            fresh = await dedup.claim(data["update_id"])
+        if not fresh:
+            return _ok()  # повтор: первая доставка уже в работе или обработана
+    if UPDATE_MODE == "queue":
+        if not update_queue.put_nowait(data):
+            if dedup is not None:
+                await dedup.release(data["update_id"])
+            return JSONResponse({"ok": False, "error": "update queue is full"}, status_code=503)
+        return _ok()
+    # с отсевом повторов обработку не отменяем: повтор Telegram будет отсечён, ответ даст первая
+    await _run_until_disconnect(request, await schedule_update(data), cancel=dedup is None)
+    return _ok()
+
+async def schedule_update(data: dict) -> asyncio.Future:
+    # один чат — по порядку (история языков, порядок ответов), разные чаты — параллельно
+    key = update_key(data)
+    if key is None:
+        key = ("update", data.get("update_id"))
+    trace = tracing.current()
+    async def job():
+        # полная валидация — только здесь, для апдейта, который реально пойдёт в обработчики
+        tracing.resume(trace)  # задача очереди ключа создана в контексте первого апдейта чата
+        try:
+            return await feed_update(data)
+        except Exception:
+            if dedup is not None:
+                await dedup.release(data["update_id"])  # повторная доставка обработается заново
+            raise
+    try:
+        return await scheduler.submit(key, job)
+    except LaneFull:
+        # чат шлёт быстрее, чем отвечаем: лишнее подтверждаем и отбрасываем, а не держим воркеры
+        logger.warning("update %s dropped: backlog of %s is full", data.get("update_id"), key)
+        fut = asyncio.get_running_loop().create_future()
+        fut.set_result(None)
+        return fut
+
+@metrics.timed(feed_seconds, label=lambda data: update_type(data) or "unknown")
+async def feed_update(data: dict):
+    with tracing.root("update"):  # в режиме queue трасса начинается здесь
+        with tracing.span("validate"):
+            update = Update.model_validate(data)
+        with tracing.span("dispatch"):
+            return await dp.feed_update(bot, update)
+
+async def _process_raw_update(data: dict):
+    # воркер очереди ждёт сам апдейт, а не только слот планировщика: иначе stop() очереди
+    # не дожидается обработчиков, а processed/failed очереди считают постановку в план
+    await (await schedule_update(data))
+
+scheduler = KeyedScheduler(limit=UPDATE_MAX_INFLIGHT, max_pending=UPDATE_MAX_PER_CHAT)
+update_queue = UpdateQueue(_process_raw_update, maxsize=UPDATE_QUEUE_SIZE, workers=UPDATE_WORKERS)
+
+async def _run_until_disconnect(request: Request, coro, poll: float = 1.0, cancel: bool = True):
+    # Telegram перестал ждать ответа — отменяем обработку (и запрос к OpenAI вместе с ней)
+    # или (cancel=False) перестаём ждать, а обработка доходит до конца в фоне
+    task = asyncio.ensure_future(coro)
+    while not task.done():
+        await asyncio.wait({task}, timeout=poll)
+        if not task.done() and await request.is_disconnected():
+            if not cancel:
+                task.add_done_callback(lambda t: t.cancelled() or t.exception())  # ошибку уже учёл scheduler
+                return None
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+            return None
+    return task.result()
 
 @app.get("/healthz", response_class=PlainTextResponse)
 async def healthz():
     return "ok"
 
+def _require_metrics(request: Request):
+    # /stats и /metrics отдают одно и то же — и закрыты одинаково
+    if METRICS_TOKEN and request.headers.get("Authorization") != f"Bearer {METRICS_TOKEN}":
+        raise HTTPException(status_code=403, detail="Invalid token")
+
+@app.get("/stats")
+async def stats(request: Request):
+    _require_metrics(request)
+    return JSONResponse(metrics.snapshot())
+
+metrics_collector = metrics.MultiProcessCollector(METRICS_MULTIPROC_DIR) if METRICS_MULTIPROC_DIR else None
+
+@app.get("/metrics")
+async def metrics_endpoint(request: Request):
+    _require_metrics(request)
+    text = metrics.render(await metrics_collector.collect_async() if metrics_collector else None)
+    return Response(text, media_type="text/plain; version=0.0.4; charset=utf-8")
+
+def _require_admin(request: Request):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if request.headers.get("Authorization") != f"Bearer {ADMIN_TOKEN}":
+        raise HTTPException(status_code=403, detail="Invalid token")
+
+@app.get("/admin/traces")
+async def admin_traces(request: Request, limit: int = 50, min_ms: float = 0.0):
+    _require_admin(request)
+    return JSONResponse({"sample_rate": tracing.tracer.sample_rate,
+                         "traces": tracing.tracer.snapshot(limit=limit, min_ms=min_ms)})
+
+@app.post("/admin/traces")
+async def admin_trace_rate(request: Request, sample_rate: float):
+    # включить/выключить трассировку без рестарта (только этот воркер)
+    _require_admin(request)
+    tracing.tracer.configure(sample_rate=sample_rate)
+    return JSONResponse({"sample_rate": tracing.tracer.sample_rate})
+
+@app.post("/admin/profile/start")
+async def admin_profile_start(request: Request, seconds: float = 30.0, interval_ms: float = 5.0,
+                              all_threads: bool = False):
+    _require_admin(request)
+    started = tracing.profiler.start(min(seconds, PROFILE_MAX_SECONDS), interval=max(interval_ms, 1.0) / 1000,
+                                     all_threads=all_threads)
+    if not started:
+        return JSONResponse({"ok": False, "error": "profiler is already running"}, status_code=409)
+    return JSONResponse({"ok": True, "pid": os.getpid()})
+
+@app.post("/admin/profile/stop", response_class=PlainTextResponse)
+async def admin_profile_stop(request: Request):
+    # свёрнутые стеки: flamegraph.pl profile.txt > profile.svg (или speedscope)
+    _require_admin(request)
+    return await asyncio.to_thread(tracing.profiler.stop)
+
+@app.get("/admin/profile", response_class=PlainTextResponse)
+async def admin_profile(request: Request, seconds: float = 10.0, interval_ms: float = 5.0,
+                        all_threads: bool = False):
+    _require_admin(request)
+    seconds = min(seconds, PROFILE_MAX_SECONDS)
+    if not tracing.profiler.start(seconds, interval=max(interval_ms, 1.0) / 1000, all_threads=all_threads):
+        raise HTTPException(status_code=409, detail="profiler is already running")
+    await asyncio.sleep(seconds)
+    return await asyncio.to_thread(tracing.profiler.stop)
+
 @app.on_event("startup")
 async def on_startup():
+    if metrics_collector is not None:
+        metrics_collector.start()
+    get_openai_client()  # импорт openai/httpx и пул — до первого апдейта, а не на нём
+    if UPDATE_MODE == "queue":
+        update_queue.start()
+    if payments is not None:
+        payments.start()
+    if METERING:
+        meter.start()
     try:
         await bot.delete_webhook(drop_pending_updates=True)
     except Exception:
@@ -490,8 +975,31 @@ async def on_startup():
     await set_commands()
     if BASE_URL and TELEGRAM_BOT_TOKEN:
         try:
-            await bot.set_webhook(url=BASE_URL + WEBHOOK_PATH, secret_token=WEBHOOK_SECRET, drop_pending_updates=True)
+            await bot.set_webhook(url=BASE_URL + WEBHOOK_PATH, secret_token=WEBHOOK_SECRET, drop_pending_updates=True,
+                                  allowed_updates=sorted(TELEGRAM_ALLOWED_UPDATES) if TELEGRAM_ALLOWED_UPDATES else None)
         except Exception:
             pass
 
+@app.on_event("shutdown")
+async def on_shutdown():
+    await update_queue.stop(timeout=UPDATE_DRAIN_TIMEOUT)
+    await scheduler.drain(timeout=UPDATE_DRAIN_TIMEOUT)  # sync: апдейты, которые дорабатывают в фоне
+    if payments is not None:
+        await payments.stop(timeout=UPDATE_DRAIN_TIMEOUT)
+    await meter.close()  # последняя сверка списаний с БД
+    await history.close()
+    if db_engine is not None:
+        await db_engine.dispose()
+    if _openai_client is not None:
+        await _openai_client.aclose()
+    await user_state.close()
+    await response_cache.close()
+    if dedup is not None:
+        await dedup.close()
+    if metrics_collector is not None:
+        await metrics_collector.stop()
+    if voice_pipeline is not None:
+        voice_pipeline.close()
+    await bot.session.close()
+
 # Start: uvicorn bot:app --host 0.0.0.0 --port 8080
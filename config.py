@@ -23,6 +23,16 @@ class Settings(BaseSettings):
     api_host: str = "0.0.0.0"
     api_port: int = 8000
     
+    # PayPal
+    paypal_client_id: str = ""
+    paypal_secret: str = ""
+    paypal_mode: str = "sandbox"
+    paypal_base: str = ""  # явный адрес API (например, mock из bench/fake_paypal.py)
+    base_url: str = ""  # публичный адрес сервиса для return/cancel URL
+    
+    # Рассылка: файл с прогрессом для продолжения после перезапуска
+    broadcast_checkpoint: str = "broadcast_progress.json"
+    
     # Логирование
     log_level: str = "INFO"
     
@@ -0,0 +1,107 @@
+# dedup.py — отсев повторных доставок вебхука по update_id до диспетчера
+# Telegram повторяет апдейт, если вебхук не ответил вовремя; без отсева повтор — второй
+# платный запрос к GPT и второй ответ. update_id растут подряд, поэтому хватает скользящего
+# окна: битовая карта на последние `size` id (size/8 байт), проверка и отметка — O(1).
+# Несколько воркеров — общий Redis (SET NX EX на id), локальное окно отсекает повторы
+# без похода в Redis.
+
+import logging
+from typing import Optional
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+duplicates_total = metrics.counter("updates_duplicate_total", "Повторные доставки апдейтов, отсечены")
+stale_total = metrics.counter("updates_stale_total", "update_id старше окна, отсечены как повтор")
+errors_total = metrics.counter("updates_dedup_errors_total", "Ошибки Redis при отсеве (апдейт пропущен дальше)")
+
+
+class UpdateWindow:
+    """Битовая карта последних size update_id (кольцо по uid % size)."""
+
+    def __init__(self, size: int = 1 << 16):
+        self.size = size
+        self._bits = bytearray((size + 7) // 8)
+        self.high = -1  # наибольший виденный id
+
+    def _slot(self, uid: int):
+        i = uid % self.size
+        return i >> 3, 1 << (i & 7)
+
+    def add(self, uid: int) -> bool:
+        """True — id новый (отмечен), False — уже был или старше окна."""
+        if uid > self.high:
+            if self.high < 0 or uid - self.high >= self.size:
+                # первый апдейт или большой скачок (бот долго молчал) — окно с нуля
+                self._bits = bytearray(len(self._bits))
+            else:
+                # слоты (high, uid] переходят к новым id, включая слот самого uid: в нём
+                # ещё бит id на size меньше; обычно это один слот
+                for old in range(self.high + 1, uid + 1):
+                    byte, bit = self._slot(old)
+                    self._bits[byte] &= ~bit
+            self.high = uid
+        elif uid <= self.high - self.size:
+            stale_total.inc()
+            return False
+        byte, bit = self._slot(uid)
+        if self._bits[byte] & bit:
+            return False
+        self._bits[byte] |= bit
+        return True
+
+    def discard(self, uid: int):
+        if self.high - self.size < uid <= self.high:
+            byte, bit = self._slot(uid)
+            self._bits[byte] &= ~bit
+
+
+class UpdateDedup:
+    def __init__(self, window: int = 1 << 16, client=None, prefix: str = "tg:update:", ttl: int = 3600):
+        self.window = UpdateWindow(window)
+        self.client = client  # redis.asyncio.Redis или None — только этот процесс
+        self.prefix = prefix
+        self.ttl = ttl
+
+    async def claim(self, uid: int) -> bool:
+        """True — апдейт обрабатываем; False — повтор (посчитан в updates_duplicate_total)."""
+        if not self.window.add(uid):
+            duplicates_total.inc()
+            return False
+        if self.client is None:
+            return True
+        try:
+            if await self.client.set(self.prefix + str(uid), "1", nx=True, ex=self.ttl):
+                return True
+        except Exception as e:
+            # недоступность Redis не должна останавливать бота — обрабатываем
+            errors_total.inc()
+            logger.warning("dedup: redis claim of update %s failed (%s)", uid, e)
+            return True
+        duplicates_total.inc()  # принял другой воркер
+        return False
+
+    async def release(self, uid: int):
+        # обработка не удалась — повторная доставка Telegram обработается заново
+        self.window.discard(uid)
+        if self.client is not None:
+            try:
+                await self.client.delete(self.prefix + str(uid))
+            except Exception as e:
+                errors_total.inc()
+                logger.warning("dedup: redis release of update %s failed (%s)", uid, e)
+
+    async def close(self):
+        if self.client is not None:
+            await self.client.aclose()
+
+
+def make_dedup(kind: str, redis_url: str, window: int = 1 << 16, ttl: int = 3600) -> UpdateDedup:
+    if kind == "redis":
+        try:
+            import redis.asyncio as aioredis
+            return UpdateDedup(window, aioredis.from_url(redis_url, decode_responses=True), ttl=ttl)
+        except Exception as e:
+            logger.warning("dedup: redis unavailable (%s), using per-process window", e)
+    return UpdateDedup(window)
@@ -32,6 +32,14 @@ else
 fi
 echo "[entrypoint] Using APP_MODULE=${APP_MODULE}"
 
+# снимки метрик прошлого запуска (pid могли переиспользоваться) — в сумму не берём
+# каталог — как в bot.py: METRICS_MULTIPROC_DIR, иначе PROMETHEUS_MULTIPROC_DIR
+MULTIPROC_DIR="${METRICS_MULTIPROC_DIR:-${PROMETHEUS_MULTIPROC_DIR:-}}"
+if [ -n "${MULTIPROC_DIR}" ]; then
+  rm -rf "${MULTIPROC_DIR}" && mkdir -p "${MULTIPROC_DIR}"
+  echo "[entrypoint] metrics multiproc dir ${MULTIPROC_DIR} (cleared)"
+fi
+
 GUNICORN_CMD="gunicorn \
   --bind 0.0.0.0:${PORT} \
   --workers ${WORKERS} \
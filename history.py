@@ -0,0 +1,254 @@
+# history.py — память диалога по чату: последние реплики в пределах бюджета токенов
+# В памяти — кольцо последних сообщений (не больше max_messages и budget токенов),
+# вытесненное сворачивается в краткое содержание (summarize, в фоне).
+# Таблица messages — лениво: реплики пишутся пачкой в фоне, читаются только при первом
+# обращении к чату после рестарта.
+
+import asyncio
+import logging
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, List, NamedTuple, Optional, Set
+
+import metrics
+from ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+loads_total = metrics.counter("history_loads_total", "История чата загружена из БД")
+summaries_total = metrics.counter("history_summaries_total", "Свёрток старой части диалога")
+persist_errors = metrics.counter("history_persist_errors_total", "Ошибки записи/чтения messages")
+context_tokens = metrics.histogram("history_context_tokens", "Оценка токенов истории в запросе",
+                                   buckets=(50, 100, 250, 500, 1000, 2000, 4000))
+
+Summarize = Callable[[str, List[dict]], Awaitable[str]]  # (прежнее содержание, вытесненные реплики)
+
+USER, ASSISTANT = "user", "assistant"
+_MESSAGE_TYPES = {USER: "text", ASSISTANT: "assistant"}  # роль -> messages.message_type
+MESSAGE_OVERHEAD = 4  # служебные токены на сообщение в chat-формате
+
+
+def estimate_tokens(text: str) -> int:
+    """Грубая оценка без токенизатора: ~4 байта UTF-8 на токен
+    (латиница ≈ 4 символа, кириллица/иврит ≈ 2 символа на токен)."""
+    return (len(text.encode("utf-8")) + 3) // 4 + MESSAGE_OVERHEAD
+
+
+def trim_to_tokens(text: str, budget: int) -> str:
+    """Обрезать text так, чтобы estimate_tokens(text) <= budget (по той же оценке — режем байты)"""
+    limit = max(0, (budget - MESSAGE_OVERHEAD) * 4)
+    raw = text.encode("utf-8")
+    return text if len(raw) <= limit else raw[:limit].decode("utf-8", "ignore")
+
+
+class Turn(NamedTuple):
+    role: str
+    content: str
+    tokens: int
+
+
+SUMMARY_PREFIX = "Краткое содержание предыдущего разговора: "
+
+
+class ChatHistory:
+    __slots__ = ("turns", "tokens", "summary", "summary_tokens", "dropped", "dropped_tokens")
+
+    def __init__(self):
+        self.turns: Deque[Turn] = deque()
+        self.tokens = 0  # реплики окна
+        self.summary = ""
+        self.summary_tokens = 0  # системное сообщение с содержанием — тоже в бюджете
+        self.dropped: List[Turn] = []  # вытеснено, ещё не свёрнуто в summary
+        self.dropped_tokens = 0
+
+    def add(self, role: str, content: str, max_messages: int, budget: int):
+        turn = Turn(role, content, estimate_tokens(content))
+        self.turns.append(turn)
+        self.tokens += turn.tokens
+        self.fit(max_messages, budget)
+
+    def fit(self, max_messages: int, budget: int):
+        # самые старые реплики уходят, пока окно вместе с содержанием не влезет в лимиты
+        # (последняя остаётся всегда)
+        while len(self.turns) > 1 and (len(self.turns) > max_messages
+                                       or self.tokens + self.summary_tokens > budget):
+            old = self.turns.popleft()
+            self.tokens -= old.tokens
+            self.dropped.append(old)
+            self.dropped_tokens += old.tokens
+
+    def set_summary(self, summary: str, max_tokens: int, max_messages: int, budget: int):
+        prefix_tokens = estimate_tokens(SUMMARY_PREFIX) - MESSAGE_OVERHEAD
+        self.summary = trim_to_tokens(summary, max_tokens - prefix_tokens)
+        self.summary_tokens = estimate_tokens(SUMMARY_PREFIX + self.summary) if self.summary else 0
+        self.fit(max_messages, budget)
+
+    def messages(self) -> List[dict]:
+        msgs = [{"role": t.role, "content": t.content} for t in self.turns]
+        if self.summary:
+            msgs.insert(0, {"role": "system", "content": SUMMARY_PREFIX + self.summary})
+        return msgs
+
+
+def _messages_table():
+    from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, Text, func
+    # те же колонки, что в app/models/message.py
+    return Table("messages", MetaData(),
+                 Column("id", Integer, primary_key=True),
+                 Column("telegram_message_id", Integer, nullable=False),
+                 Column("user_id", Integer, nullable=False),
+                 Column("text", Text),
+                 Column("message_type", String(20)),
+                 Column("created_at", DateTime, default=func.now()),
+                 Column("chat_id", Integer, nullable=False))
+
+
+def _users_table():
+    from sqlalchemy import Column, Integer, MetaData, Table
+    # messages.user_id -> users.telegram_id: нужна только колонка ключа
+    return Table("users", MetaData(),
+                 Column("id", Integer, primary_key=True),
+                 Column("telegram_id", Integer, unique=True, nullable=False))
+
+
+class HistoryStore:
+    def __init__(self, max_messages: int = 8, budget: int = 1500, engine=None,
+                 summarize: Optional[Summarize] = None, summarize_after: int = 400,
+                 summary_budget: Optional[int] = None, max_chats: int = 10_000, ttl: float = 6 * 3600, flush_interval: float = 2.0):
+        self.max_messages = max_messages
+        self.budget = budget
+        self.engine = engine  # AsyncEngine или None — только память
+        self.summarize = summarize
+        self.summarize_after = summarize_after  # токенов вытеснено -> пора сворачивать
+        self.summary_budget = summary_budget or budget // 4  # потолок токенов содержания
+        self.flush_interval = flush_interval
+        self._chats: TTLCache[ChatHistory] = TTLCache(maxsize=max_chats, ttl=ttl)
+        self._loading: Dict[int, asyncio.Future] = {}
+        self._summarizing: Dict[int, asyncio.Task] = {}
+        self._rows: List[dict] = []
+        self._flusher: Optional[asyncio.Task] = None
+        self._messages = _messages_table() if engine is not None else None
+        self._users = _users_table() if engine is not None else None
+        self._known_users: TTLCache[bool] = TTLCache(maxsize=max_chats, ttl=ttl)  # строка в users есть
+
+    async def _get(self, chat_id: int) -> ChatHistory:
+        h = self._chats.get(chat_id)
+        if h is not None:
+            return h
+        fut = self._loading.get(chat_id)
+        if fut is None:
+            fut = self._loading[chat_id] = asyncio.ensure_future(self._load(chat_id))
+            fut.add_done_callback(lambda _: self._loading.pop(chat_id, None))
+        return await asyncio.shield(fut)
+
+    async def _load(self, chat_id: int) -> ChatHistory:
+        h = ChatHistory()
+        if self.engine is not None:
+            from sqlalchemy import select
+            m = self._messages
+            try:
+                async with self.engine.connect() as conn:
+                    rows = (await conn.execute(
+                        select(m.c.message_type, m.c.text)
+                        .where(m.c.chat_id == chat_id, m.c.message_type.in_(_MESSAGE_TYPES.values()))
+                        .order_by(m.c.id.desc()).limit(self.max_messages)
+                    )).all()
+                loads_total.inc()
+            except Exception as e:
+                persist_errors.inc()
+                logger.warning("history: load of chat %s failed (%s)", chat_id, e)
+                rows = []
+            for message_type, text in reversed(rows):
+                if text:
+                    h.add(ASSISTANT if message_type == "assistant" else USER, text, self.max_messages, self.budget)
+            h.dropped, h.dropped_tokens = [], 0  # старше окна — не сворачиваем заново
+        self._chats.set(chat_id, h)
+        return h
+
+    async def window(self, chat_id: int) -> List[dict]:
+        """Сообщения для запроса к модели: [краткое содержание] + последние реплики."""
+        h = await self._get(chat_id)
+        context_tokens.observe(h.tokens + h.summary_tokens)
+        return h.messages()
+
+    async def add(self, chat_id: int, user_id: int, role: str, content: str, message_id: int = 0):
+        h = await self._get(chat_id)
+        h.add(role, content, self.max_messages, self.budget)
+        self._chats.set(chat_id, h)  # продлеваем жизнь в кэше
+        if self.engine is not None:
+            self._rows.append({"telegram_message_id": message_id, "user_id": user_id, "text": content,
+                               "message_type": _MESSAGE_TYPES[role], "chat_id": chat_id})
+            if self._flusher is None or self._flusher.done():
+                self._flusher = asyncio.ensure_future(self._flush_later())
+        if not self.summarize:
+            h.dropped, h.dropped_tokens = [], 0
+        elif h.dropped_tokens >= self.summarize_after and chat_id not in self._summarizing:
+            task = asyncio.ensure_future(self._summarize(h))
+            self._summarizing[chat_id] = task
+            task.add_done_callback(lambda _: self._summarizing.pop(chat_id, None))
+
+    async def _summarize(self, h: ChatHistory):
+        batch, h.dropped, h.dropped_tokens = h.dropped, [], 0
+        try:
+            summary = await self.summarize(h.summary, [{"role": t.role, "content": t.content} for t in batch])
+        except Exception as e:
+            logger.warning("history: summarize failed (%s)", e)
+            return
+        if summary:
+            # содержание уходит в каждый запрос: режем по токенам и освобождаем под него место в окне
+            h.set_summary(summary, self.summary_budget, self.max_messages, self.budget)
+            summaries_total.inc()
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.flush_interval)
+        await self.flush()
+
+    async def flush(self):
+        if not self._rows or self.engine is None:
+            return
+        from sqlalchemy import insert
+        rows, self._rows = self._rows, []
+        try:
+            await self._ensure_users({r["user_id"] for r in rows})
+            async with self.engine.begin() as conn:
+                await conn.execute(insert(self._messages), rows)
+            return
+        except Exception as e:
+            logger.warning("history: write of %d messages failed (%s), retrying per chat", len(rows), e)
+        # одна битая реплика не должна стоить истории всем чатам пачки
+        by_chat: Dict[int, List[dict]] = {}
+        for row in rows:
+            by_chat.setdefault(row["chat_id"], []).append(row)
+        for chat_id, chat_rows in by_chat.items():
+            try:
+                async with self.engine.begin() as conn:
+                    await conn.execute(insert(self._messages), chat_rows)
+            except Exception as e:
+                persist_errors.inc()
+                logger.warning("history: write of %d messages of chat %s failed (%s)", len(chat_rows), chat_id, e)
+
+    async def _ensure_users(self, user_ids: Set[int]):
+        """Создать недостающие строки users (внешний ключ messages.user_id): без METERING
+        пользователя в таблице может ещё не быть"""
+        from sqlalchemy import insert, select
+        from sqlalchemy.exc import IntegrityError
+        u = self._users
+        missing = {uid for uid in user_ids if self._known_users.get(uid) is None}
+        if not missing:
+            return
+        async with self.engine.connect() as conn:
+            known = set((await conn.execute(select(u.c.telegram_id).where(u.c.telegram_id.in_(missing)))).scalars())
+        for uid in missing - known:
+            try:
+                async with self.engine.begin() as conn:
+                    await conn.execute(insert(u).values(telegram_id=uid))
+            except IntegrityError:
+                pass  # успел создать другой воркер
+        for uid in missing:
+            self._known_users.set(uid, True)
+
+    async def close(self):
+        if self._flusher is not None and not self._flusher.done():
+            self._flusher.cancel()
+        for task in list(self._summarizing.values()):
+            task.cancel()
+        await self.flush()
@@ -0,0 +1,84 @@
+# i18n.py — строки интерфейса на ru/en/he в одном каталоге (загружается один раз при импорте)
+# t(key, lang) — строка для языка; нет перевода -> русский вариант.
+# Свои переводы/исправления — JSON {key: {lang: text}} в I18N_FILE (поверх встроенных).
+
+import json
+import os
+from typing import Dict, Optional
+
+LANGS = ("ru", "en", "he")
+FALLBACK = "ru"
+
+STRINGS: Dict[str, Dict[str, str]] = {
+    # reply-клавиатура
+    "menu_button": {"ru": "Меню", "en": "Menu", "he": "תפריט"},
+    "input_placeholder": {"ru": "Напишите сообщение…", "en": "Type a message…", "he": "הקלד/י הודעה…"},
+    # inline-меню
+    "btn_help": {"ru": "Помощь", "en": "Help", "he": "עזרה"},
+    "btn_pay": {"ru": "Оплатить", "en": "Pay", "he": "תשלום"},
+    "btn_refs": {"ru": "Рефералы", "en": "Referrals", "he": "הפניות"},
+    "btn_profile": {"ru": "Профиль", "en": "Profile", "he": "פרופיל"},
+    "btn_lang": {"ru": "Сменить язык", "en": "Change language", "he": "שנה שפה"},
+    "btn_mode": {"ru": "Режим ответа", "en": "Reply mode", "he": "מצב תגובה"},
+    "btn_tts": {"ru": "Озвучить (TTS)", "en": "Speak (TTS)", "he": "המרה לדיבור"},
+    "btn_asr": {"ru": "Показать расшифровку", "en": "Show transcript", "he": "הצג תמליל"},
+    "btn_close": {"ru": "Скрыть", "en": "Close", "he": "סגור"},
+    # сообщения
+    "start": {"ru": "Привет! Я SmartPro 24/7. Нажмите «Меню», когда нужно открыть действия.",
+              "en": "Hi! I’m SmartPro 24/7. Tap “Menu” when you want actions.",
+              "he": "היי! אני SmartPro 24/7. לחצו \"תפריט\" כדי לפתוח פעולות."},
+    "help": {"ru": "Я универсальный помощник. Просто задайте вопрос. Сторис/рассказ — по явной просьбе. Без Markdown/звёздочек/списков.",
+             "en": "Universal assistant. Ask anything. Stories/narratives on explicit request. No markdown/asterisks/lists.",
+             "he": "עוזר אוניברסלי. אפשר לשאול הכל. סטוריז/סיפור רק בבקשה מפורשת. בלי Markdown/כוכביות/רשימות."},
+    "quota_exhausted": {"ru": "Бесплатные вопросы закончились. Выберите тариф, чтобы продолжить.",
+                        "en": "You've used all free questions. Choose a plan to continue.",
+                        "he": "השאלות החינמיות נגמרו. בחר/י מסלול כדי להמשיך."},
+    "meter_unavailable": {"ru": "Сервис временно недоступен. Попробуйте ещё раз через минуту.",
+                          "en": "The service is temporarily unavailable. Please try again in a minute.",
+                          "he": "השירות אינו זמין זמנית. נסו שוב בעוד דקה."},
+    # заголовки ответа на голосовое (anti-echo)
+    "voice_brief": {"ru": "Кратко", "en": "Brief", "he": "תמצית"},
+    "voice_details": {"ru": "Детали", "en": "Details", "he": "פרטים"},
+    "voice_checklist": {"ru": "Чек‑лист", "en": "Checklist", "he": "צ׳ק‑ליסט"},
+    # распознавание голосовых (voice.py)
+    "voice_busy": {"ru": "Сейчас много голосовых — не успеваю распознать. Пришлите ещё раз через минуту "
+                         "или напишите текстом.",
+                   "en": "Too many voice messages right now. Please resend in a minute or type your question.",
+                   "he": "יש כרגע יותר מדי הודעות קוליות. שלחו שוב בעוד דקה או כתבו בטקסט."},
+    "voice_too_large": {"ru": "Голосовое слишком длинное — запишите покороче или напишите текстом.",
+                        "en": "This voice message is too long. Please record a shorter one or type it.",
+                        "he": "ההודעה הקולית ארוכה מדי. הקליטו הודעה קצרה יותר או כתבו בטקסט."},
+    "voice_error": {"ru": "Не получилось распознать голосовое. Попробуйте ещё раз или напишите текстом.",
+                    "en": "Could not transcribe the voice message. Please try again or type it.",
+                    "he": "לא הצלחתי לתמלל את ההודעה הקולית. נסו שוב או כתבו בטקסט."},
+    "voice_empty": {"ru": "В голосовом не слышно речи.", "en": "I could not hear any speech in the voice message.",
+                    "he": "לא נשמע דיבור בהודעה הקולית."},
+    "transcript_title": {"ru": "Расшифровка", "en": "Transcript", "he": "תמליל"},
+    "asr_no_voice": {"ru": "Пришлите голосовое — расшифровка появится по этой кнопке.",
+                     "en": "Send a voice message and its transcript will be available here.",
+                     "he": "שלחו הודעה קולית והתמליל יופיע כאן."},
+    "asr_unavailable": {"ru": "Расшифровка будет доступна после подключения ASR (Whisper/gpt‑4o‑mini‑transcribe).",
+                        "en": "Transcripts will be available once speech recognition is enabled.",
+                        "he": "התמליל יהיה זמין לאחר הפעלת זיהוי הדיבור."},
+    # описания команд (set_my_commands)
+    "cmd_start": {"ru": "Приветствие", "en": "Greeting", "he": "ברכה"},
+    "cmd_menu": {"ru": "Открыть меню", "en": "Open menu", "he": "פתח תפריט"},
+    "cmd_version": {"ru": "Проверить версию", "en": "Check version", "he": "בדיקת גרסה"},
+}
+
+
+def load_catalog(path: Optional[str]) -> None:
+    """Дополнить/переопределить STRINGS из JSON-файла."""
+    if not path:
+        return
+    with open(path, encoding="utf-8") as f:
+        for key, texts in json.load(f).items():
+            STRINGS.setdefault(key, {}).update(texts)
+
+
+def t(key: str, lang: str) -> str:
+    texts = STRINGS[key]
+    return texts.get(lang) or texts[FALLBACK]
+
+
+load_catalog(os.environ.get("I18N_FILE", ""))
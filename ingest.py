@@ -0,0 +1,84 @@
+# ingest.py — приём вебхуков «ack сразу»: апдейт кладём в ограниченную очередь,
+# пул воркеров разбирает её в фоне. Очередь полна -> вызывающий отвечает 503.
+
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, List, Optional
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+Handler = Callable[[Any], Awaitable[Any]]
+
+
+def _metrics(name: str):
+    # name="update" -> update_queue_depth, updates_enqueued_total, ...
+    return (metrics.gauge(f"{name}_queue_depth", "Элементов в очереди"),
+            metrics.counter(f"{name}s_enqueued_total", "Принято в очередь"),
+            metrics.counter(f"{name}s_rejected_total", "Отклонено (очередь полна), 503"),
+            metrics.counter(f"{name}s_processed_total", "Обработано воркерами"),
+            metrics.counter(f"{name}s_failed_total", "Ошибки обработчика"))
+
+
+class UpdateQueue:
+    def __init__(self, handler: Handler, maxsize: int = 1000, workers: int = 8, name: str = "update"):
+        self.handler = handler
+        self.name = name
+        (self.queue_depth, self.enqueued_total, self.rejected_total,
+         self.processed_total, self.failed_total) = _metrics(name)
+        self.maxsize = maxsize
+        self.workers = workers
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._closing = False
+
+    def start(self):
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue(maxsize=self.maxsize)
+        self._closing = False
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+
+    def put_nowait(self, item: Any) -> bool:
+        if self._queue is None or self._closing:
+            self.rejected_total.inc()
+            return False
+        try:
+            self._queue.put_nowait(item)
+        except asyncio.QueueFull:
+            self.rejected_total.inc()
+            return False
+        self.enqueued_total.inc()
+        self.queue_depth.set(self._queue.qsize())
+        return True
+
+    async def _worker(self, n: int):
+        q = self._queue
+        while True:
+            item = await q.get()
+            self.queue_depth.set(q.qsize())
+            try:
+                await self.handler(item)
+                self.processed_total.inc()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                self.failed_total.inc()
+                logger.exception("%s worker %d: handler failed", self.name, n)
+            finally:
+                q.task_done()
+
+    async def stop(self, timeout: float = 30.0):
+        # перестаём принимать, дорабатываем то, что уже в очереди, затем гасим воркеры
+        if self._queue is None:
+            return
+        self._closing = True
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("%s queue: %d items dropped on shutdown", self.name, self._queue.qsize())
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
@@ -0,0 +1,156 @@
+# intents.py — маршрутизация текстовых сообщений по намерениям (сторис, рассказ, копирайт, ответ)
+# Намерения — данные: триггеры, промпты, модель, температура. Все триггеры собраны в одно
+# регулярное выражение с именованной группой на намерение: один проход по тексту даёт и
+# намерение (сработавшая группа), и начало темы (конец ключевого слова).
+# Новое намерение — запись в INTENTS или JSON-файл в INTENTS_FILE, без правки кода.
+
+import json
+import re
+from typing import Dict, List, NamedTuple, Optional, Sequence, Union
+
+Template = Union[str, Dict[str, str]]  # строка или {язык: строка}, "en" — для остальных языков
+
+LANG_NAMES = {"ru": "Russian", "he": "Hebrew", "en": "English"}
+ABOUT_PAT = re.compile(r'^\s*(про|о|about)\b', re.IGNORECASE)
+NAME_PAT = re.compile(r'меня зовут\s+([A-Za-zА-Яа-яЁё\-]+)', re.IGNORECASE)
+
+INTENTS: List[dict] = [
+    {
+        # явная просьба: «напиши/сделай/сгенерируй … сторис»
+        "name": "story",
+        "prefix": r"напиши|сделай|сгенерируй",
+        "keywords": [r"сторис", r"story", r"инста-?сторис"],
+        "topic": True,
+        "system": ("You are a world‑class creative writer crafting cinematic, sensory Instagram‑style stories. "
+                   "Answer strictly in {lang_name}. No Markdown/asterisks/lists/headings."),
+        "prompt": ("Тема сторис: {topic}\n"
+                   "Напиши 6–8 кинематографичных кадров (1–2 насыщенные фразы на кадр) со звуками/запахами/тактильностью, "
+                   "точными наблюдениями и сильной концовкой. Пиши на ({lang}). Без вступительных фраз и инструкций."),
+        "model": "gpt-4o", "temperature": 0.9, "cache": False, "history": False, "deadline": 40,
+    },
+    {
+        "name": "narrative",
+        "prefix": r"напиши|сделай|сгенерируй",
+        "keywords": [r"рассказ", r"эссе", r"сочинение", r"повесть", r"short\s+story", r"essay"],
+        "topic": True,
+        "system": ("You are a literary writer. Produce a vivid short narrative. "
+                   "Answer strictly in {lang_name}. No Markdown/asterisks/lists/headings."),
+        "prompt": ("Тема рассказа: {topic}\n"
+                   "Напиши короткий рассказ 350–600 слов на ({lang}), с образностью, ритмом, сценами, диалогами по необходимости. "
+                   "Без клише и без объяснений формата."),
+        "model": "gpt-4o", "temperature": 0.8, "cache": False, "history": False, "deadline": 60,
+    },
+    {
+        # копирайт: приветствие/био/описание — ключевое слово в любом месте текста
+        "name": "copy",
+        "keywords": [r"пост\s+приветств", r"приветстви[ея]\b", r"описани[ея]\b", r"био\b", r"bio\b"],
+        "boundary": False,
+        "system": {
+            "ru": "Ты копирайтер. 1‑е лицо, тёплый тон. Без Markdown/звёздочек/списков/заголовков. 2–4 коротких абзаца.",
+            "he": "את/ה קופירייטר/ית. גוף ראשון, טון חם. בלי Markdown/כוכביות/רשימות/כותרות. 2–4 פסקאות קצרות.",
+            "en": "Experienced copywriter. First person, warm tone. No Markdown/asterisks/lists/headings. 2–4 short paragraphs.",
+        },
+        "prompt": ("Напиши пост-приветствие в первом лице на ({lang}). "
+                   "Если имя доступно, используй его: {name}. "
+                   "Суть из запроса: {text}. Избегай клише и шаблонов, не используй списки и заголовки."),
+        "temperature": 0.65,
+    },
+    {
+        # без триггеров — ответ по умолчанию
+        "name": "default",
+        "system": {
+            "ru": "Ты SmartPro 24/7. Отвечай строго на русском. Без Markdown/звёздочек/списков/жира/курсива. Обычный текст. Эмодзи можно.",
+            "he": "את/ה SmartPro 24/7. ענה אך ורק בעברית. בלי Markdown/כוכביות/רשימות/הדגשות. טקסט פשוט. אמוג׳י מותר.",
+            "en": "You are SmartPro 24/7. Answer strictly in English. No Markdown/asterisks/lists/bold/italics. Plain text. Emojis allowed.",
+        },
+        "prompt": {
+            "ru": "Запрос пользователя: {text}\nДай точный, небанальный ответ по теме. Без Markdown/звёздочек/списков.",
+            "he": "בקשת המשתמש: {text}\nענה/עני תשובה מדויקת וישירה בנושא. בלי Markdown/כוכביות/רשימות.",
+            "en": "User request: {text}\nProvide a precise, non‑generic answer. No Markdown/asterisks/lists.",
+        },
+        "temperature": 0.55,
+    },
+]
+
+
+class Intent(NamedTuple):
+    name: str
+    system: Template
+    prompt: Template
+    keywords: Sequence[str] = ()
+    prefix: Optional[str] = None   # regex: текст должен начинаться с него (иначе ключевое слово — где угодно)
+    boundary: bool = True          # \b вокруг ключевых слов
+    topic: bool = False            # тема — текст после ключевого слова
+    model: Optional[str] = None    # None — OPENAI_MODEL
+    temperature: float = 0.7
+    cache: bool = True
+    history: bool = True
+    deadline: float = 25.0         # сек. на ответ model, дальше — запасная модель (supervisor.py)
+
+    def render(self, lang: str, text: str, topic: str = "", name: str = "") -> tuple:
+        """(system, prompt) для языка ответа."""
+        fields = {"lang": lang, "lang_name": LANG_NAMES.get(lang, "English"), "text": text, "topic": topic,
+                  "name": name or "имя не указано"}
+        return _pick(self.system, lang).format(**fields), _pick(self.prompt, lang).format(**fields)
+
+
+class Routed(NamedTuple):
+    intent: Intent
+    topic: str
+    name: Optional[str]  # «меня зовут …», если есть
+
+
+def _pick(template: Template, lang: str) -> str:
+    if isinstance(template, str):
+        return template
+    return template.get(lang) or template["en"]
+
+
+class IntentRouter:
+    def __init__(self, specs: Sequence[dict] = INTENTS):
+        self.intents: Dict[str, Intent] = {}
+        branches = []
+        for spec in specs:
+            intent = Intent(**spec)
+            self.intents[intent.name] = intent
+            if not intent.keywords:
+                self.default = intent
+                continue
+            kw = "|".join(intent.keywords)
+            kw = rf"\b(?P<{intent.name}>{kw})\b" if intent.boundary else rf"(?P<{intent.name}>{kw})"
+            # .*? — первое вхождение ключевого слова: с него и начинается тема
+            branches.append(rf"\s*(?:{intent.prefix})\b.*?{kw}" if intent.prefix else rf".*?{kw}")
+        # ветки пробуются по порядку — порядок в specs задаёт приоритет.
+        # Основной вариант — по тексту в нижнем регистре (IGNORECASE на кириллице заметно медленнее),
+        # поэтому ключевые слова и префиксы пишутся строчными.
+        source = "(?:" + "|".join(branches) + ")"
+        self.pattern = re.compile(source, re.S)
+        self._pattern_i = re.compile(source, re.IGNORECASE | re.S)
+        if not hasattr(self, "default"):
+            raise ValueError("intents: need one intent without keywords (default)")
+
+    def route(self, text: str) -> Routed:
+        low = text.lower()
+        # lower() почти всегда сохраняет длину; если нет (İ и т.п.) — смещения темы не совпадут
+        m = self.pattern.match(low) if len(low) == len(text) else self._pattern_i.match(text)
+        if m is None:
+            return Routed(self.default, "", None)
+        # сработала ровно одна именованная группа (lastgroup ненадёжен, если в ключевых словах есть свои группы)
+        key = next(k for k, v in m.groupdict().items() if v is not None)
+        intent = self.intents[key]
+        topic = ""
+        if intent.topic:
+            topic = ABOUT_PAT.sub("", text[m.end(key):]).strip() or text.strip()
+        name = None
+        if "{name}" in _pick(intent.prompt, "en"):
+            nm = NAME_PAT.search(text)
+            name = nm.group(1) if nm else None
+        return Routed(intent, topic, name)
+
+
+def load_intents(path: Optional[str]) -> List[dict]:
+    """Намерения из JSON-файла (список объектов как в INTENTS) или встроенные."""
+    if not path:
+        return INTENTS
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
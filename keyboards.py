@@ -0,0 +1,104 @@
+# keyboards.py — клавиатуры aiogram: собираются один раз на язык и переиспользуются
+# Построители закэшированы (lru_cache): pydantic-объекты не создаются на каждый /menu,
+# «Меню» и смену языка. Готовые объекты общие для всех запросов — не изменять.
+# PrebuiltMarkupSession отправляет такие клавиатуры готовой JSON-строкой (сериализуется
+# при первой отправке) вместо model_dump + json.dumps разметки на каждый запрос.
+
+from functools import lru_cache
+from typing import Dict, Optional, Sequence
+
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup, KeyboardButton, ReplyKeyboardMarkup
+from aiohttp import FormData
+
+from i18n import t
+from plans import Plan
+
+# id(разметка) -> разметка / её JSON; объекты держит lru_cache, так что id не переиспользуются
+_prebuilt: Dict[int, object] = {}
+_prebuilt_json: Dict[int, str] = {}
+
+
+def _static(markup):
+    _prebuilt[id(markup)] = markup
+    return markup
+
+
+@lru_cache(maxsize=None)
+def reply_menu(lang: str = "ru") -> ReplyKeyboardMarkup:
+    return _static(ReplyKeyboardMarkup(
+        resize_keyboard=True,
+        keyboard=[[KeyboardButton(text=t("menu_button", lang))]],
+        input_field_placeholder=t("input_placeholder", lang),
+        selective=True,
+    ))
+
+
+@lru_cache(maxsize=None)
+def inline_menu(lang: str = "ru") -> InlineKeyboardMarkup:
+    def btn(key, data): return InlineKeyboardButton(text=t("btn_" + key, lang), callback_data=data)
+    return _static(InlineKeyboardMarkup(inline_keyboard=[
+        [btn("help", "help"), btn("pay", "pay")],
+        [btn("refs", "refs"), btn("profile", "profile")],
+        [btn("lang", "lang"), btn("mode", "mode")],
+        [btn("tts", "tts"), btn("asr", "asr")],
+        [btn("close", "close_menu")],
+    ]))
+
+
+@lru_cache(maxsize=None)
+def _voice_menu(lang: str) -> InlineKeyboardMarkup:
+    return _static(InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text=t("btn_asr", lang), callback_data="asr")],
+        [InlineKeyboardButton(text=t("btn_close", lang), callback_data="close_menu")],
+    ]))
+
+
+def voice_menu(lang: str = "ru", file_unique_id: Optional[str] = None) -> InlineKeyboardMarkup:
+    """С file_unique_id — кнопка расшифровки именно этого голосового (asr:<id>): такая клавиатура
+    своя у каждого сообщения и не кэшируется; без него — «последнее голосовое»."""
+    if file_unique_id is None:
+        return _voice_menu(lang)
+    static = _voice_menu(lang).inline_keyboard
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text=static[0][0].text, callback_data=f"asr:{file_unique_id}")],
+        static[1],
+    ])
+
+
+@lru_cache(maxsize=None)
+def pay_button(lang: str = "ru") -> InlineKeyboardMarkup:
+    return _static(InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text=t("btn_pay", lang), callback_data="pay")],
+    ]))
+
+
+@lru_cache(maxsize=8)
+def plans_menu(plans: Sequence[Plan]) -> InlineKeyboardMarkup:
+    # plans — tuple(PLANS.values()): тарифы читаются из env один раз
+    return _static(InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text=f"{p.name} — ${p.price}", callback_data=f"pay:{p.name}")] for p in plans
+    ]))
+
+
+class PrebuiltMarkupSession(AiohttpSession):
+    """AiohttpSession, которая подставляет закэшированный JSON для клавиатур из этого модуля."""
+
+    def build_form_data(self, bot: Bot, method) -> FormData:
+        markup = getattr(method, "reply_markup", None)
+        if markup is None or id(markup) not in _prebuilt:
+            return super().build_form_data(bot, method)
+        raw = _prebuilt_json.get(id(markup))
+        if raw is None:
+            raw = _prebuilt_json[id(markup)] = self.prepare_value(markup, bot=bot, files={})
+        form = FormData(quote_fields=False)
+        files: Dict[str, object] = {}
+        for key, value in method.model_dump(warnings=False, exclude={"reply_markup"}).items():
+            value = self.prepare_value(value, bot=bot, files=files)
+            if value:
+                form.add_field(key, value)
+        form.add_field("reply_markup", raw)
+        for key, value in files.items():
+            form.add_field(key, value.read(bot), filename=value.filename or key)
+        return form
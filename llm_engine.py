@@ -0,0 +1,100 @@
+# llm_engine.py — асинхронный движок OpenAI
+# Один AsyncOpenAI на процесс поверх общего keep-alive пула httpx,
+# лимит одновременных запросов на модель и таймаут на каждый запрос.
+
+import asyncio
+from typing import AsyncIterator, Dict, List, Optional
+
+
+def parse_model_limits(raw: str) -> Dict[str, int]:
+    """'gpt-4o=8,gpt-4o-mini=32' -> {'gpt-4o': 8, 'gpt-4o-mini': 32}"""
+    limits: Dict[str, int] = {}
+    for part in (raw or "").split(","):
+        name, _, value = part.partition("=")
+        if name.strip() and value.strip().isdigit():
+            limits[name.strip()] = int(value.strip())
+    return limits
+
+
+class LLMEngine:
+    def __init__(
+        self,
+        api_key: str,
+        base_url: Optional[str] = None,
+        timeout: float = 60.0,
+        max_connections: int = 100,
+        max_keepalive: int = 20,
+        model_concurrency: int = 16,
+        model_limits: Optional[Dict[str, int]] = None,
+    ):
+        import httpx
+        from openai import AsyncOpenAI
+
+        self.timeout = timeout
+        self.model_concurrency = model_concurrency
+        self.model_limits = model_limits or {}
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        # общий пул: соединения к api.openai.com переиспользуются между апдейтами
+        self._http = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=max_connections,
+                                max_keepalive_connections=max_keepalive,
+                                keepalive_expiry=60.0),
+            timeout=httpx.Timeout(timeout, connect=10.0),
+        )
+        self.client = AsyncOpenAI(api_key=api_key, base_url=base_url or None,
+                                  http_client=self._http, timeout=timeout)
+
+    def _semaphore(self, model: str) -> asyncio.Semaphore:
+        sem = self._semaphores.get(model)
+        if sem is None:
+            sem = asyncio.Semaphore(self.model_limits.get(model, self.model_concurrency))
+            self._semaphores[model] = sem
+        return sem
+
+    async def complete(self, messages: List[dict], model: str, temperature: float = 0.7,
+                       timeout: Optional[float] = None) -> str:
+        # отмена вызывающей задачи (Telegram закрыл соединение) рвёт и HTTP-запрос
+        async with self._semaphore(model):
+            resp = await asyncio.wait_for(
+                self.client.chat.completions.create(model=model, messages=messages, temperature=temperature),
+                timeout or self.timeout,
+            )
+        return (resp.choices[0].message.content or "").strip()
+
+    async def stream(self, messages: List[dict], model: str, temperature: float = 0.7,
+                     timeout: Optional[float] = None) -> AsyncIterator[str]:
+        """Дельты текста по мере генерации; timeout — на весь ответ целиком."""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + (timeout or self.timeout)
+        async with self._semaphore(model):
+            stream = await asyncio.wait_for(
+                self.client.chat.completions.create(model=model, messages=messages,
+                                                    temperature=temperature, stream=True),
+                max(0.0, deadline - loop.time()),
+            )
+            chunks = stream.__aiter__()
+            try:
+                while True:
+                    try:
+                        chunk = await asyncio.wait_for(chunks.__anext__(), max(0.0, deadline - loop.time()))
+                    except StopAsyncIteration:
+                        break
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        yield chunk.choices[0].delta.content
+            finally:
+                await stream.close()
+
+    async def transcribe(self, path: str, model: str, language: Optional[str] = None,
+                         timeout: Optional[float] = None) -> str:
+        """Распознавание аудиофайла; формат OpenAI определяет по расширению имени."""
+        extra = {"language": language} if language else {}
+        async with self._semaphore(model):
+            with open(path, "rb") as f:
+                resp = await asyncio.wait_for(
+                    self.client.audio.transcriptions.create(model=model, file=f, **extra),
+                    timeout or self.timeout,
+                )
+        return (resp.text or "").strip()
+
+    async def aclose(self):
+        await self._http.aclose()
@@ -1,33 +1,167 @@
 # logger_config.py
+# Логи не пишутся в файл/консоль из event loop: логгер кладёт запись в очередь (QueueHandler),
+# фоновый поток (QueueListener) форматирует и пишет. Формат — JSON (одна строка на запись)
+# или текст; INFO и ниже можно прореживать (LOG_SAMPLE_RATE), WARNING+ проходят всегда.
 
+import atexit
+import json
 import logging
-from logging.handlers import RotatingFileHandler
+import os
+import queue
 import sys
+import threading
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Optional, TextIO
+
+import metrics
+from ttl_cache import TTLCache
+
+try:
+    import orjson
+
+    def _dumps(obj) -> str:
+        return orjson.dumps(obj, default=str).decode()
+except ImportError:  # pragma: no cover
+    def _dumps(obj) -> str:
+        return json.dumps(obj, ensure_ascii=False, default=str)
 
 LOG_FORMAT = "%(asctime)s - [%(levelname)s] - %(name)s - (%(filename)s).%(funcName)s(%(lineno)d) - %(message)s"
-LOG_LEVEL = logging.INFO
-LOG_FILE = "logs/bot.log"
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOG_FILE = os.environ.get("LOG_FILE", "logs/bot.log")  # пусто — без файла
+LOG_JSON = os.environ.get("LOG_JSON", "1") == "1"
+LOG_SAMPLE_RATE = float(os.environ.get("LOG_SAMPLE_RATE", "1"))  # доля INFO/DEBUG; 0.1 — каждая 10-я
+LOG_QUEUE_SIZE = int(os.environ.get("LOG_QUEUE_SIZE", "10000"))  # очередь полна — запись теряется
 MAX_BYTES = 1 * 1024 * 1024  # 1MB
 BACKUP_COUNT = 5
 
-def setup_logger(name: str = None) -> logging.Logger:
-    logger = logging.getLogger(name)
-    logger.setLevel(LOG_LEVEL)
+dropped_total = metrics.counter("log_dropped_total", "Записи лога отброшены: очередь полна")
+sampled_out_total = metrics.counter("log_sampled_out_total", "Записи INFO/DEBUG отброшены сэмплированием")
+
+# атрибуты LogRecord; всё остальное в записи — поля из extra={...}
+_RECORD_ATTRS = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+_plain = logging.Formatter()
+_listener: Optional[QueueListener] = None
+_queue_handler: Optional[QueueHandler] = None
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна строка JSON: ts, level, logger, msg, место вызова, exc и поля из extra."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        doc = {
+            "ts": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            "src": f"{record.filename}:{record.lineno}",
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS:
+                doc[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            doc["exc"] = record.exc_text
+        return _dumps(doc)
+
+
+class SamplingFilter(logging.Filter):
+    """INFO и ниже: пропускает каждую N-ю запись одного места вызова (первая проходит всегда)."""
 
-    if not logger.handlers:
-        formatter = logging.Formatter(LOG_FORMAT)
+    def __init__(self, rate: float, maxsize: int = 10_000, ttl: float = 3600.0):
+        super().__init__()
+        self.every = max(1, round(1 / rate)) if rate > 0 else 0
+        # счётчики ограничены и стареют; фильтр зовут из любых потоков (to_thread, слушатель)
+        self._seen: TTLCache[int] = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
 
-        file_handler = RotatingFileHandler(LOG_FILE, maxBytes=MAX_BYTES, backupCount=BACKUP_COUNT)
-        file_handler.setFormatter(formatter)
-        file_handler.setLevel(logging.WARNING)  # файл только WARNING+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.INFO or self.every == 1:
+            return True
+        if self.every == 0:
+            sampled_out_total.inc()
+            return False
+        # место вызова, а не текст: f-строка дала бы новый ключ на каждое сообщение
+        key = (record.pathname, record.lineno)
+        with self._lock:
+            n = self._seen.get(key, 0)
+            self._seen.set(key, n + 1)
+        if n % self.every:
+            sampled_out_total.inc()
+            return False
+        return True
 
-        stream_handler = logging.StreamHandler(sys.stdout)
+
+class _AsyncQueueHandler(QueueHandler):
+    def __init__(self, maxsize: int):
+        super().__init__(queue.SimpleQueue())  # без блокировок Queue; предел — по qsize()
+        self.maxsize = maxsize
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # в вызывающем потоке — только подстановка аргументов (они могут измениться после вызова)
+        # и текст исключения; форматирование (JSON/текст) — в потоке слушателя.
+        # Запись не копируем: обработчик у логгера один (propagate=False)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = _plain.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        if self.queue.qsize() >= self.maxsize:
+            dropped_total.inc()  # слушатель не успевает (медленный диск/stdout) — не ждём его
+            return
+        self.queue.put_nowait(record)
+
+
+def setup_logger(name: str = None, level: Optional[str] = None, log_file: Optional[str] = None,
+                 stream: Optional[TextIO] = None, json_format: Optional[bool] = None,
+                 sample_rate: Optional[float] = None) -> logging.Logger:
+    """Логгер (по умолчанию корневой) с неблокирующей записью; слушатель — один на процесс."""
+    global _listener, _queue_handler
+    logger = logging.getLogger(name)
+    logger.setLevel(level or LOG_LEVEL)
+
+    if _queue_handler is None:
+        # pid/имя процесса не выводятся ни одним форматом — не собираем их в каждой записи
+        logging.logProcesses = logging.logMultiprocessing = False
+        formatter = JsonFormatter() if (LOG_JSON if json_format is None else json_format) \
+            else logging.Formatter(LOG_FORMAT)
+        handlers = []
+        log_file = LOG_FILE if log_file is None else log_file
+        if log_file:
+            os.makedirs(os.path.dirname(log_file) or ".", exist_ok=True)
+            file_handler = RotatingFileHandler(log_file, maxBytes=MAX_BYTES, backupCount=BACKUP_COUNT)
+            file_handler.setFormatter(formatter)
+            file_handler.setLevel(logging.WARNING)  # файл только WARNING+
+            handlers.append(file_handler)
+
+        stream_handler = logging.StreamHandler(stream or sys.stdout)
         stream_handler.setFormatter(formatter)
-        stream_handler.setLevel(logging.INFO)  # консоль INFO+
+        stream_handler.setLevel(logging.DEBUG)  # консоль — всё, что пропустил уровень логгера
+        handlers.append(stream_handler)
 
-        logger.addHandler(file_handler)
-        logger.addHandler(stream_handler)
+        _queue_handler = _AsyncQueueHandler(LOG_QUEUE_SIZE)
+        _queue_handler.addFilter(SamplingFilter(LOG_SAMPLE_RATE if sample_rate is None else sample_rate))
+        _listener = QueueListener(_queue_handler.queue, *handlers, respect_handler_level=True)
+        _listener.start()
+        atexit.register(shutdown_logging)
 
+    if _queue_handler not in logger.handlers:
+        logger.addHandler(_queue_handler)
         logger.propagate = False  # отключаем повторную отправку наверх
 
     return logger
+
+
+def shutdown_logging():
+    """Дописать очередь и остановить поток слушателя."""
+    global _listener, _queue_handler
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+        _queue_handler = None
@@ -0,0 +1,285 @@
+# metering.py — квоты вопросов к GPT: бесплатный лимит, пакеты (starter/pro), безлимит на срок
+# Проверка и списание — атомарно в быстром уровне (память процесса или Redis-хэш + Lua),
+# без обращения к БД на каждый вопрос. Списания копятся дельтами и раз в N секунд уходят
+# в таблицу users одним пакетным UPDATE ... SET questions_used = questions_used + :d —
+# инкременты разных воркеров складываются, а не затирают друг друга.
+# Начисления (оплата) пишутся в БД сразу.
+# Память процесса — только для одного воркера: у каждого процесса был бы свой бесплатный лимит
+# и свои копии строк users, начисление дошло бы лишь до одного из них. WORKERS>1 — только Redis.
+# Redis/БД недоступны — вопрос не разрешается (MeterUnavailable), если не задан fail_open.
+
+import asyncio
+import logging
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Dict, Optional, Tuple
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+allowed_total = metrics.counter("meter_allowed_total", "Вопрос разрешён квотой")
+denied_total = metrics.counter("meter_denied_total", "Вопрос отклонён: квота исчерпана")
+reconciled_total = metrics.counter("meter_reconciled_rows_total", "Строк users обновлено сверкой")
+errors_total = metrics.counter("meter_errors_total", "Ошибки БД/Redis в метеринге")
+
+MONTH = 30 * 86400
+UNKNOWN, DENIED, ALLOWED = -1, 0, 1
+
+# used/quota/unlim — в одном хэше; -1: пользователя нет в быстром уровне, нужно загрузить из БД
+_CONSUME_LUA = """
+local h = redis.call('HMGET', KEYS[1], 'used', 'quota', 'unlim')
+if not h[1] then return -1 end
+if tonumber(h[3]) > tonumber(ARGV[1]) then redis.call('HINCRBY', KEYS[1], 'used', 1) return 1 end
+if tonumber(h[1]) < tonumber(h[2]) then redis.call('HINCRBY', KEYS[1], 'used', 1) return 1 end
+return 0
+"""
+_INIT_LUA = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+  redis.call('HSET', KEYS[1], 'used', ARGV[1], 'quota', ARGV[2], 'unlim', ARGV[3])
+end
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+"""
+_REFUND_LUA = """
+if tonumber(redis.call('HGET', KEYS[1], 'used') or '0') > 0 then redis.call('HINCRBY', KEYS[1], 'used', -1) end
+"""
+_CREDIT_LUA = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+  redis.call('HINCRBY', KEYS[1], 'quota', ARGV[1])
+  if tonumber(ARGV[2]) > tonumber(redis.call('HGET', KEYS[1], 'unlim')) then
+    redis.call('HSET', KEYS[1], 'unlim', ARGV[2])
+  end
+end
+"""
+
+
+class MeterUnavailable(Exception):
+    """Быстрый уровень или БД недоступны — квоту проверить нельзя."""
+
+
+class MemoryMeterBackend:
+    """Один процесс: счётчики в dict (операции атомарны в пределах event loop)."""
+
+    def __init__(self):
+        self._data: Dict[int, list] = {}
+
+    async def consume(self, uid: int, now: float) -> int:
+        rec = self._data.get(uid)
+        if rec is None:
+            return UNKNOWN
+        used, quota, unlim = rec
+        if unlim > now or used < quota:
+            rec[0] += 1
+            return ALLOWED
+        return DENIED
+
+    async def init(self, uid: int, used: int, quota: int, unlim: float):
+        self._data.setdefault(uid, [used, quota, unlim])
+
+    async def refund(self, uid: int):
+        rec = self._data.get(uid)
+        if rec is not None and rec[0] > 0:
+            rec[0] -= 1
+
+    async def credit(self, uid: int, quota: int, unlim: float):
+        rec = self._data.get(uid)
+        if rec is not None:
+            rec[1] += quota
+            rec[2] = max(rec[2], unlim)
+
+    async def close(self):
+        pass
+
+
+class RedisMeterBackend:
+    """Общие для всех воркеров счётчики: хэш meter:<uid>, проверка+списание одним Lua-скриптом."""
+
+    def __init__(self, client, prefix: str = "meter:", ttl: int = 7 * 86400):
+        self.client = client
+        self.prefix = prefix
+        self.ttl = ttl
+        self._consume = client.register_script(_CONSUME_LUA)
+        self._init = client.register_script(_INIT_LUA)
+        self._refund = client.register_script(_REFUND_LUA)
+        self._credit = client.register_script(_CREDIT_LUA)
+
+    async def consume(self, uid: int, now: float) -> int:
+        return int(await self._consume(keys=[self.prefix + str(uid)], args=[now]))
+
+    async def init(self, uid: int, used: int, quota: int, unlim: float):
+        await self._init(keys=[self.prefix + str(uid)], args=[used, quota, unlim, self.ttl])
+
+    async def refund(self, uid: int):
+        await self._refund(keys=[self.prefix + str(uid)])
+
+    async def credit(self, uid: int, quota: int, unlim: float):
+        await self._credit(keys=[self.prefix + str(uid)], args=[quota, unlim])
+
+    async def close(self):
+        await self.client.aclose()
+
+
+def make_meter_backend(kind: str, redis_url: str, workers: int = 1):
+    if kind == "redis":
+        try:
+            import redis.asyncio as aioredis
+            return RedisMeterBackend(aioredis.from_url(redis_url, decode_responses=True))
+        except Exception as e:
+            if workers > 1:
+                raise RuntimeError(f"meter: redis unavailable ({e}), memory backend is unsafe with {workers} workers")
+            logger.warning("meter: redis unavailable (%s), using memory backend", e)
+    elif workers > 1:
+        raise RuntimeError(f"meter: METER_BACKEND={kind} keeps quotas per process; use redis with {workers} workers")
+    return MemoryMeterBackend()
+
+
+def _users_table():
+    from sqlalchemy import Column, DateTime, Integer, MetaData, Table
+    # те же колонки, что в app/models/user.py (таблица общая)
+    return Table("users", MetaData(),
+                 Column("id", Integer, primary_key=True),
+                 Column("telegram_id", Integer, unique=True, nullable=False),
+                 Column("questions_used", Integer, default=0),
+                 Column("questions_quota", Integer, default=0),
+                 Column("unlimited_until", DateTime, nullable=True))
+
+
+def _ts(dt: Optional[datetime]) -> float:
+    if dt is None:
+        return 0.0
+    return (dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)).timestamp()
+
+
+class Meter:
+    def __init__(self, backend, free_quota: int = 5, engine=None, reconcile_interval: float = 10.0,
+                 fail_open: bool = False):
+        self.backend = backend
+        self.free_quota = free_quota
+        self.fail_open = fail_open  # True — при недоступности Redis/БД вопросы разрешаются без учёта
+        self.engine = engine  # AsyncEngine или None — без БД (только быстрый уровень)
+        self.reconcile_interval = reconcile_interval
+        self._users = _users_table() if engine is not None else None
+        self._deltas: Dict[int, int] = defaultdict(int)  # uid -> списано с последней сверки
+        self._loading: Dict[int, asyncio.Future] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self.engine is not None and self._task is None:
+            self._task = asyncio.ensure_future(self._reconcile_loop())
+
+    async def try_consume(self, uid: int) -> bool:
+        """Списать один вопрос; False — квота исчерпана, MeterUnavailable — проверить нельзя."""
+        now = time.time()
+        try:
+            res = await self.backend.consume(uid, now)
+            if res == UNKNOWN:
+                await self._load(uid)
+                res = await self.backend.consume(uid, now)
+        except Exception as e:
+            errors_total.inc()
+            if not self.fail_open:
+                logger.warning("meter: consume failed for %s (%s), denying", uid, e)
+                raise MeterUnavailable(str(e)) from e
+            logger.warning("meter: consume failed for %s (%s), allowing", uid, e)
+            return True
+        if res == DENIED:
+            denied_total.inc()
+            return False
+        allowed_total.inc()
+        self._deltas[uid] += 1
+        return True
+
+    async def refund(self, uid: int):
+        """Вернуть вопрос (ответ не был получен)."""
+        try:
+            await self.backend.refund(uid)
+            self._deltas[uid] -= 1
+        except Exception as e:
+            errors_total.inc()
+            logger.warning("meter: refund failed for %s (%s)", uid, e)
+
+    async def _load(self, uid: int):
+        # одна загрузка из БД на пользователя, даже при пачке одновременных сообщений
+        fut = self._loading.get(uid)
+        if fut is None:
+            fut = self._loading[uid] = asyncio.ensure_future(self._load_row(uid))
+            fut.add_done_callback(lambda _: self._loading.pop(uid, None))
+        used, quota, unlim = await asyncio.shield(fut)
+        await self.backend.init(uid, used, self.free_quota + quota, unlim)
+
+    async def _load_row(self, uid: int) -> Tuple[int, int, float]:
+        if self.engine is None:
+            return 0, 0, 0.0
+        from sqlalchemy import insert, select
+        from sqlalchemy.exc import IntegrityError
+        u = self._users
+        async with self.engine.begin() as conn:
+            row = (await conn.execute(select(u.c.questions_used, u.c.questions_quota, u.c.unlimited_until)
+                                      .where(u.c.telegram_id == uid))).first()
+        if row is not None:
+            return row[0] or 0, row[1] or 0, _ts(row[2])
+        # строка нужна, чтобы сверка могла делать UPDATE ... + :d
+        try:
+            async with self.engine.begin() as conn:
+                await conn.execute(insert(u).values(telegram_id=uid, questions_used=0, questions_quota=0))
+        except IntegrityError:
+            pass  # параллельно создал другой воркер
+        return 0, 0, 0.0
+
+    async def credit(self, uid: int, questions: int = 0, months: int = 0):
+        """Начислить пакет вопросов и/или безлимит на months месяцев (запись в БД сразу)."""
+        unlim = 0.0
+        if self.engine is not None:
+            from sqlalchemy import func, select, update
+            u = self._users
+            await self._load_row(uid)  # строка могла ещё не существовать
+            async with self.engine.begin() as conn:
+                current = (await conn.execute(select(u.c.unlimited_until).where(u.c.telegram_id == uid))).scalar()
+                values = {"questions_quota": func.coalesce(u.c.questions_quota, 0) + questions}
+                if months:
+                    unlim = max(time.time(), _ts(current)) + months * MONTH
+                    values["unlimited_until"] = datetime.fromtimestamp(unlim, timezone.utc).replace(tzinfo=None)
+                await conn.execute(update(u).where(u.c.telegram_id == uid).values(**values))
+        elif months:
+            unlim = time.time() + months * MONTH
+        await self.backend.credit(uid, questions, unlim)
+
+    async def _reconcile_loop(self):
+        while True:
+            await asyncio.sleep(self.reconcile_interval)
+            await self.reconcile()
+
+    async def reconcile(self):
+        """Пакетно перенести накопленные списания в users.questions_used."""
+        batch = {uid: d for uid, d in self._deltas.items() if d}
+        self._deltas = defaultdict(int)
+        if not batch or self.engine is None:
+            return
+        from sqlalchemy import bindparam, func, update
+        u = self._users
+        stmt = (update(u).where(u.c.telegram_id == bindparam("uid"))
+                .values(questions_used=func.coalesce(u.c.questions_used, 0) + bindparam("d")))
+        try:
+            async with self.engine.begin() as conn:
+                await conn.execute(stmt, [{"uid": uid, "d": d} for uid, d in batch.items()])
+            reconciled_total.inc(len(batch))
+        except BaseException as e:
+            # и при отмене (close посреди сверки): пакет возвращается и уйдёт следующей сверкой
+            for uid, d in batch.items():
+                self._deltas[uid] += d
+            if not isinstance(e, Exception):
+                raise
+            errors_total.inc()
+            logger.warning("meter: reconcile of %d users failed (%s), will retry", len(batch), e)
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.reconcile()
+        await self.backend.close()
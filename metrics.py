@@ -0,0 +1,309 @@
+# metrics.py — простые счётчики процесса (очереди, ошибки, задержки)
+# Метки: counter(name, doc, labels=("model",)).labels("gpt-4o").inc() — дочерняя серия на значение.
+# render() — текстовый формат Prometheus (/metrics). Несколько воркеров gunicorn: каждый раз в
+# секунду сбрасывает снимок в METRICS_MULTIPROC_DIR/<pid>.json, /metrics любого воркера
+# складывает снимки всех (MultiProcessCollector).
+
+import asyncio
+import functools
+import json
+import logging
+import os
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, Optional, Sequence, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+FAST_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1)  # сек., быстрые функции
+
+
+class Counter:
+    type = "counter"
+
+    def __init__(self, name: str, doc: str = ""):
+        self.name = name
+        self.doc = doc
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+    def dump(self):
+        return self.value
+
+
+class Gauge(Counter):
+    type = "gauge"
+
+    def set(self, value: float):
+        self.value = value
+
+    def dec(self, amount: float = 1.0):
+        self.value -= amount
+
+
+class Histogram:
+    type = "histogram"
+
+    def __init__(self, name: str, doc: str = "", buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.doc = doc
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)  # последний — +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    @property
+    def value(self) -> Dict[str, float]:
+        return {"count": self.count, "sum": round(self.sum, 6),
+                "avg": round(self.sum / self.count, 6) if self.count else 0.0}
+
+    def dump(self):
+        return {"counts": list(self.counts), "sum": self.sum, "count": self.count}
+
+
+class Family:
+    """Серии одной метрики по значениям меток; labels(...) — O(1) после первого вызова."""
+
+    def __init__(self, cls, name: str, doc: str, labelnames: Sequence[str], **kwargs):
+        self.cls = cls
+        self.type = cls.type
+        self.name = name
+        self.doc = doc
+        self.labelnames = tuple(labelnames)
+        self.buckets = kwargs.get("buckets")
+        self._kwargs = kwargs
+        self._children: Dict[Tuple[str, ...], Union[Counter, Histogram]] = {}
+
+    def labels(self, *values, **kw):
+        if kw:
+            values = tuple(kw[n] for n in self.labelnames)
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name}: expected labels {self.labelnames}, got {values}")
+            child = self._children[values] = self.cls(self.name, self.doc, **self._kwargs)
+        return child
+
+    @property
+    def value(self) -> Dict[str, object]:
+        return {",".join(map(str, k)): c.value for k, c in sorted(self._children.items())}
+
+
+Metric = Union[Counter, Gauge, Histogram, Family]
+REGISTRY: Dict[str, Metric] = {}
+
+
+def _get(cls, name: str, doc: str, labels: Sequence[str], **kwargs):
+    m = REGISTRY.get(name)
+    if m is None:
+        m = REGISTRY[name] = Family(cls, name, doc, labels, **kwargs) if labels else cls(name, doc, **kwargs)
+    return m
+
+
+def counter(name: str, doc: str = "", labels: Sequence[str] = ()) -> Counter:
+    return _get(Counter, name, doc, labels)
+
+
+def gauge(name: str, doc: str = "", labels: Sequence[str] = ()) -> Gauge:
+    return _get(Gauge, name, doc, labels)
+
+
+def histogram(name: str, doc: str = "", buckets: Sequence[float] = DEFAULT_BUCKETS,
+              labels: Sequence[str] = ()) -> Histogram:
+    return _get(Histogram, name, doc, labels, buckets=tuple(sorted(buckets)))
+
+
+def snapshot() -> Dict[str, object]:
+    return {name: m.value for name, m in sorted(REGISTRY.items())}
+
+
+# ---- декораторы ----
+
+def timed(hist, label: Optional[Callable[..., str]] = None):
+    """Время вызова (sync/async) -> hist; label(*args, **kwargs) — значение метки для Family."""
+    def deco(fn):
+        if label is None:
+            def observe(args, kwargs, value, _observe=hist.observe):
+                _observe(value)
+        else:
+            def observe(args, kwargs, value):
+                hist.labels(label(*args, **kwargs)).observe(value)
+        clock = time.perf_counter
+
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def wrapper(*args, **kwargs):
+                started = clock()
+                try:
+                    return await fn(*args, **kwargs)
+                finally:
+                    observe(args, kwargs, clock() - started)
+        else:
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                started = clock()
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    observe(args, kwargs, clock() - started)
+        return wrapper
+    return deco
+
+
+# ---- экспорт ----
+# collect(): {name: {"type", "doc", "labels", "buckets", "series": [[значения меток, данные], ...]}}
+# — одинаково для своего процесса и для сложенных снимков воркеров.
+
+def collect() -> Dict[str, dict]:
+    out = {}
+    for name, m in REGISTRY.items():
+        if isinstance(m, Family):
+            series = [[list(k), c.dump()] for k, c in m._children.items()]
+            labelnames, buckets = list(m.labelnames), m.buckets
+        else:
+            series = [[[], m.dump()]]
+            labelnames, buckets = [], getattr(m, "buckets", None)
+        out[name] = {"type": m.type, "doc": m.doc, "labels": labelnames,
+                     "buckets": list(buckets) if buckets else None, "series": series}
+    return out
+
+
+def merge(snapshots: Iterable[Tuple[dict, bool]]) -> Dict[str, dict]:
+    """(снимок, воркер жив) -> сумма: счётчики и гистограммы — всех воркеров, gauge — только живых."""
+    out: Dict[str, dict] = {}
+    for snap, alive in snapshots:
+        for name, fam in snap.items():
+            if fam["type"] == "gauge" and not alive:
+                continue
+            acc = out.setdefault(name, {**fam, "series": {}})
+            for values, data in fam["series"]:
+                key = tuple(values)
+                prev = acc["series"].get(key)
+                if prev is None:
+                    acc["series"][key] = dict(data, counts=list(data["counts"])) if isinstance(data, dict) else data
+                elif isinstance(data, dict):
+                    prev["counts"] = [a + b for a, b in zip(prev["counts"], data["counts"])]
+                    prev["sum"] += data["sum"]
+                    prev["count"] += data["count"]
+                else:
+                    acc["series"][key] = prev + data
+    for fam in out.values():
+        fam["series"] = [[list(k), v] for k, v in fam["series"].items()]
+    return out
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _num(v: float) -> str:
+    return repr(float(v)) if v != int(v) else str(int(v))
+
+
+def render(collected: Optional[Dict[str, dict]] = None) -> str:
+    """Текстовый формат Prometheus 0.0.4."""
+    lines = []
+    for name, fam in sorted((collected if collected is not None else collect()).items()):
+        lines.append(f"# HELP {name} {_escape(fam['doc'])}")
+        lines.append(f"# TYPE {name} {fam['type']}")
+        names = fam["labels"]
+        for values, data in fam["series"]:
+            if fam["type"] != "histogram":
+                lines.append(f"{name}{_labels(names, values)} {_num(data)}")
+                continue
+            acc = 0
+            for le, n in zip(list(fam["buckets"]) + ["+Inf"], data["counts"]):
+                acc += n
+                bound = 'le="%s"' % (le if le == "+Inf" else _num(le))
+                lines.append(f"{name}_bucket{_labels(names, values, bound)} {acc}")
+            lines.append(f"{name}_sum{_labels(names, values)} {_num(data['sum'])}")
+            lines.append(f"{name}_count{_labels(names, values)} {data['count']}")
+    return "\n".join(lines) + "\n"
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class MultiProcessCollector:
+    """Снимки метрик воркеров в общем каталоге; каталог чистится перед стартом gunicorn (entrypoint.sh)."""
+
+    def __init__(self, path: str, interval: float = 1.0):
+        self.path = path
+        self.interval = interval
+        self.pid = os.getpid()
+        self._task: Optional[asyncio.Task] = None
+        os.makedirs(path, exist_ok=True)
+
+    def write(self, snap: Optional[Dict[str, dict]] = None):
+        self.pid = os.getpid()  # после fork — свой файл
+        tmp = os.path.join(self.path, f".{self.pid}.tmp")
+        with open(tmp, "w") as f:
+            json.dump(collect() if snap is None else snap, f)
+        os.replace(tmp, os.path.join(self.path, f"{self.pid}.json"))
+
+    async def write_async(self):
+        # снимок — в потоке цикла (метрики меняет только он), запись файла — в потоке
+        await asyncio.to_thread(self.write, collect())
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._loop())
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.write_async()
+            except OSError as e:
+                logger.warning("metrics: snapshot write failed (%s)", e)
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.write_async()  # итоговые счётчики воркера остаются в сумме
+
+    def collect(self) -> Dict[str, dict]:
+        self.write()  # свой снимок — самый свежий
+        return self.read()
+
+    async def collect_async(self) -> Dict[str, dict]:
+        """collect() для event loop: файлы пишутся и читаются в потоке"""
+        await self.write_async()
+        return await asyncio.to_thread(self.read)
+
+    def read(self) -> Dict[str, dict]:
+        snaps = []
+        for fname in os.listdir(self.path):
+            if not fname.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.path, fname)) as f:
+                    snap = json.load(f)
+            except (OSError, ValueError):
+                continue  # файл переписывается прямо сейчас
+            pid = int(fname[:-5]) if fname[:-5].isdigit() else -1
+            snaps.append((snap, _alive(pid)))
+        return merge(snaps)
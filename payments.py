@@ -1,71 +1,151 @@
-import aiohttp
+import asyncio
 import base64
-from config import settings
+import random
+import time
+import uuid
+from typing import Optional
+
+import aiohttp
+
+# токен обновляем заранее, чтобы запрос не ушёл с протухшим
+TOKEN_REFRESH_MARGIN = 60
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+def _setting(name: str, value):
+    # config.Settings читаем только если значение не передано явно (bot.py настраивается своими env)
+    if value is not None:
+        return value
+    from config import settings
+    return getattr(settings, name)
+
+
+class PayPalError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
 
 
 class PayPalClient:
-    def __init__(self):
-        self.client_id = settings.PAYPAL_CLIENT_ID
-        self.client_secret = settings.PAYPAL_SECRET
-        self.base_url = (
-            "https://api-m.sandbox.paypal.com"
-            if settings.PAYPAL_MODE == "sandbox"
-            else "https://api-m.paypal.com"
-        )
+    def __init__(self, base_url: Optional[str] = None, client_id: Optional[str] = None,
+                 client_secret: Optional[str] = None, return_base: Optional[str] = None,
+                 timeout: float = 15.0, retries: int = 3):
+        self.client_id = _setting("paypal_client_id", client_id)
+        self.client_secret = _setting("paypal_secret", client_secret)
+        self.return_base = _setting("base_url", return_base)
+        base_url = base_url or _setting("paypal_base", None)
+        if base_url:
+            self.base_url = base_url.rstrip("/")
+        else:
+            self.base_url = (
+                "https://api-m.sandbox.paypal.com"
+                if _setting("paypal_mode", None) == "sandbox"
+                else "https://api-m.paypal.com"
+            )
+        self.timeout = timeout
+        self.retries = retries
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._token: Optional[str] = None
+        self._token_expires = 0.0
+        self._token_refresh: Optional[asyncio.Future] = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        # одна сессия на процесс: keep-alive пул, TLS-рукопожатие не на каждый платёж
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=50, keepalive_timeout=60),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+        return self._session
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+    async def _request(self, method: str, path: str, what: str, ok=(200, 201), **kwargs) -> dict:
+        """HTTP-запрос с повторами (с джиттером) на сетевые ошибки, 429 и 5xx.
+        Повторять можно только идемпотентные вызовы — POST'ы ниже идут с PayPal-Request-Id."""
+        for attempt in range(self.retries + 1):
+            last = attempt == self.retries
+            try:
+                async with self._get_session().request(method, f"{self.base_url}{path}", **kwargs) as resp:
+                    if resp.status in ok:
+                        return await resp.json()
+                    text = await resp.text()
+                    if resp.status not in RETRY_STATUSES or last:
+                        raise PayPalError(resp.status, f"PayPal {what} error {resp.status}: {text}")
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                if last:
+                    raise
+            await asyncio.sleep(random.uniform(0, 0.2 * 2 ** attempt))
 
     async def get_access_token(self) -> str:
-        """Запрос access_token от PayPal"""
+        """access_token PayPal (из кэша; обновление одним запросом на всех ждущих)"""
+        if self._token and time.monotonic() < self._token_expires - TOKEN_REFRESH_MARGIN:
+            return self._token
+        if self._token_refresh is None or self._token_refresh.done():
+            self._token_refresh = asyncio.ensure_future(self._fetch_token())
+        return await asyncio.shield(self._token_refresh)
+
+    async def _fetch_token(self) -> str:
         auth = base64.b64encode(f"{self.client_id}:{self.client_secret}".encode()).decode()
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                f"{self.base_url}/v1/oauth2/token",
-                headers={"Authorization": f"Basic {auth}"},
-                data={"grant_type": "client_credentials"},
-            ) as resp:
-                if resp.status != 200:
-                    text = await resp.text()
-                    raise Exception(f"PayPal token error {resp.status}: {text}")
-                data = await resp.json()
-                return data["access_token"]
-
-    async def create_order(self, value: str, plan: str):
-        """Создание ордера PayPal"""
-        token = await self.get_access_token()
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                f"{self.base_url}/v2/checkout/orders",
-                headers={
+        data = await self._request(
+            "POST", "/v1/oauth2/token", "token", ok=(200,),
+            headers={"Authorization": f"Basic {auth}"},
+            data={"grant_type": "client_credentials"},
+        )
+        self._token = data["access_token"]
+        self._token_expires = time.monotonic() + int(data.get("expires_in", 0))
+        return self._token
+
+    async def _api(self, path: str, what: str, method: str = "POST", ok=(200, 201), **kwargs) -> dict:
+        request_id = str(uuid.uuid4())  # один на все повторы: PayPal не создаст дубль
+        for attempt in range(2):
+            token = await self.get_access_token()
+            try:
+                return await self._request(method, path, what, ok=ok, headers={
                     "Authorization": f"Bearer {token}",
                     "Content-Type": "application/json",
-                },
-                json={
-                    "intent": "CAPTURE",
-                    "purchase_units": [
-                        {"amount": {"currency_code": "USD", "value": value}}
-                    ],
-                    "application_context": {
-                        "return_url": f"{settings.BASE_URL}/pay/return",
-                        "cancel_url": f"{settings.BASE_URL}/pay/cancel",
-                    },
-                },
-            ) as resp:
-                if resp.status not in (200, 201):
-                    text = await resp.text()
-                    raise Exception(f"PayPal create_order error {resp.status}: {text}")
-                return await resp.json()
+                    "PayPal-Request-Id": request_id,
+                }, **kwargs)
+            except PayPalError as e:
+                # токен отозван раньше expires_in — берём новый и пробуем ещё раз
+                if e.status != 401 or attempt:
+                    raise
+                if self._token == token:
+                    self._token = None
+
+    async def create_order(self, value: str, plan: str, user_id: Optional[int] = None):
+        """Создание ордера PayPal; custom_id "<user_id>:<plan>" вернётся в capture и вебхуках"""
+        unit = {"amount": {"currency_code": "USD", "value": value}}
+        if user_id is not None:
+            unit["custom_id"] = f"{user_id}:{plan}"
+        return await self._api("/v2/checkout/orders", "create_order", json={
+            "intent": "CAPTURE",
+            "purchase_units": [unit],
+            "application_context": {
+                "return_url": f"{self.return_base}/pay/return",
+                "cancel_url": f"{self.return_base}/pay/cancel",
+            },
+        })
 
     async def capture_order(self, order_id: str):
         """Завершение (capture) платежа"""
-        token = await self.get_access_token()
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                f"{self.base_url}/v2/checkout/orders/{order_id}/capture",
-                headers={
-                    "Authorization": f"Bearer {token}",
-                    "Content-Type": "application/json",
-                },
-            ) as resp:
-                if resp.status not in (200, 201):
-                    text = await resp.text()
-                    raise Exception(f"PayPal capture_order error {resp.status}: {text}")
-                return await resp.json()
+        return await self._api(f"/v2/checkout/orders/{order_id}/capture", "capture_order")
+
+    async def get_order(self, order_id: str):
+        """Состояние ордера"""
+        return await self._api(f"/v2/checkout/orders/{order_id}", "get_order", method="GET", ok=(200,))
+
+    async def verify_webhook_signature(self, webhook_id: str, headers, event: dict) -> bool:
+        """Проверка подписи вебхука через PayPal (verify-webhook-signature)"""
+        data = await self._api("/v1/notifications/verify-webhook-signature", "verify_webhook", ok=(200,), json={
+            "auth_algo": headers.get("paypal-auth-algo"),
+            "cert_url": headers.get("paypal-cert-url"),
+            "transmission_id": headers.get("paypal-transmission-id"),
+            "transmission_sig": headers.get("paypal-transmission-sig"),
+            "transmission_time": headers.get("paypal-transmission-time"),
+            "webhook_id": webhook_id,
+            "webhook_event": event,
+        })
+        return data.get("verification_status") == "SUCCESS"
@@ -0,0 +1,284 @@
+# paypal_webhooks.py — входящие платежи PayPal: ack сразу, capture и начисление тарифа в фоне
+# POST /paypal/webhook и GET /pay/return только проверяют дубль и кладут задачу в очередь;
+# воркеры проверяют подпись, делают capture и вызывают credit(user_id, plan, order_id).
+# Без PAYPAL_WEBHOOK_ID вебхуки не принимаются (подпись нечем проверить); тариф начисляется
+# только по ордеру, который PayPal сам отдаёт как COMPLETED, а не по полям события.
+# Идемпотентность: событие — по event id, начисление — по order id (ровно одно на ордер).
+# Вебхук уже подтверждён (200), PayPal его не повторит: сбой capture/credit воркер повторяет
+# сам — с растущей задержкой, не больше retries раз.
+
+import asyncio
+import json
+import logging
+from typing import Awaitable, Callable, Optional, Set, Tuple
+
+from fastapi import APIRouter, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
+
+import metrics
+from ingest import UpdateQueue
+from payments import PayPalClient, PayPalError
+from ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+Credit = Callable[[int, str, str], Awaitable[None]]  # (user_id, plan, order_id)
+
+duplicates_total = metrics.counter("paypal_duplicates_total", "Повторные доставки (отсечены по ключу)")
+credited_total = metrics.counter("paypal_credited_total", "Начислено тарифов")
+invalid_total = metrics.counter("paypal_invalid_total", "Вебхук не прошёл проверку подписи")
+retried_total = metrics.counter("paypal_retried_total", "Повторов после сбоя capture/начисления")
+abandoned_total = metrics.counter("paypal_abandoned_total", "Платёж не обработан после всех повторов")
+
+# ключ занят обработкой / обработан; «processing» живёт недолго — упавший воркер не блокирует повтор
+PROCESSING_TTL = 600
+DONE_TTL = 30 * 86400
+
+
+class IdempotencyStore:
+    """claim(key) — True ровно у одного из конкурирующих; память или Redis (SET NX EX)."""
+
+    def __init__(self, client=None, prefix: str = "paypal:"):
+        self.client = client  # redis.asyncio.Redis или None
+        self.prefix = prefix
+        self._local: TTLCache[str] = TTLCache(maxsize=100_000, ttl=DONE_TTL)
+
+    async def claim(self, key: str) -> bool:
+        if self.client is not None:
+            return bool(await self.client.set(self.prefix + key, "processing", nx=True, ex=PROCESSING_TTL))
+        if key in self._local:
+            return False
+        self._local.set(key, "processing", PROCESSING_TTL)
+        return True
+
+    async def done(self, key: str):
+        if self.client is not None:
+            await self.client.set(self.prefix + key, "done", ex=DONE_TTL)
+        else:
+            self._local.set(key, "done")
+
+    async def release(self, key: str):
+        # обработка не удалась — ключ свободен для повтора (отложенного воркером или нового вызова)
+        if self.client is not None:
+            await self.client.delete(self.prefix + key)
+        else:
+            self._local.pop(key)
+
+    async def close(self):
+        if self.client is not None:
+            await self.client.aclose()
+
+
+def make_store(kind: str, redis_url: str) -> IdempotencyStore:
+    if kind == "redis":
+        try:
+            import redis.asyncio as aioredis
+            return IdempotencyStore(aioredis.from_url(redis_url, decode_responses=True))
+        except Exception as e:
+            logger.warning("paypal: redis unavailable (%s), using memory idempotency store", e)
+    return IdempotencyStore()
+
+
+def parse_custom_id(custom_id: Optional[str]) -> Optional[Tuple[int, str]]:
+    """"<user_id>:<plan>" -> (user_id, plan)"""
+    uid, _, plan = (custom_id or "").partition(":")
+    if not uid.isdigit() or not plan:
+        return None
+    return int(uid), plan
+
+
+def _order_custom_id(order: dict) -> Optional[str]:
+    for unit in order.get("purchase_units") or ():
+        if unit.get("custom_id"):
+            return unit["custom_id"]
+        for cap in (unit.get("payments") or {}).get("captures") or ():
+            if cap.get("custom_id"):
+                return cap["custom_id"]
+    return None
+
+
+class PaymentPipeline:
+    def __init__(self, client: PayPalClient, credit: Credit, store: IdempotencyStore,
+                 webhook_id: str = "", workers: int = 4, maxsize: int = 10_000,
+                 retries: int = 5, retry_delay: float = 30.0):
+        self.client = client
+        self.credit = credit
+        self.store = store
+        self.webhook_id = webhook_id
+        self.retries = retries
+        self.retry_delay = retry_delay  # сек. до первого повтора, дальше вдвое больше
+        self._retry_timers: Set[asyncio.TimerHandle] = set()
+        self.queue = UpdateQueue(self._process, maxsize=maxsize, workers=workers, name="payment")
+        if not webhook_id:
+            logger.warning("paypal: PAYPAL_WEBHOOK_ID is not set, webhooks are ignored "
+                           "(payments are credited via /pay/return only)")
+
+    def start(self):
+        self.queue.start()
+
+    async def stop(self, timeout: float = 30.0):
+        if self._retry_timers:
+            logger.error("paypal: %d payment retries dropped on shutdown", len(self._retry_timers))
+            abandoned_total.inc(len(self._retry_timers))
+        for timer in self._retry_timers:
+            timer.cancel()
+        self._retry_timers.clear()
+        await self.queue.stop(timeout)
+        await self.client.close()
+        await self.store.close()
+
+    # ---- приём (быстрый путь) ----
+
+    async def accept_event(self, event: dict, headers) -> bool:
+        """False — очередь полна (PayPal повторит доставку)."""
+        if not self.webhook_id:
+            invalid_total.inc()
+            return True
+        event_id = event.get("id")
+        if not event_id or not await self.store.claim("event:" + event_id):
+            duplicates_total.inc()
+            return True
+        item = {"kind": "event", "event": event, "headers": {k.lower(): v for k, v in headers.items()
+                                                              if k.lower().startswith("paypal-")}}
+        if not self.queue.put_nowait(item):
+            await self.store.release("event:" + event_id)
+            return False
+        return True
+
+    def accept_order(self, order_id: str) -> bool:
+        return self.queue.put_nowait({"kind": "order", "order_id": order_id})
+
+    # ---- воркер ----
+
+    async def _process(self, item: dict):
+        try:
+            await self._process_once(item)
+        except Exception as e:
+            self._retry_later(item, e)
+            raise
+
+    def _retry_later(self, item: dict, error: Exception):
+        if isinstance(error, PayPalError) and 400 <= error.status < 500 and error.status != 429:
+            abandoned_total.inc()  # отказ PayPal по существу — повтор не поможет
+            return
+        attempt = item.get("attempt", 0) + 1
+        if attempt > self.retries:
+            abandoned_total.inc()
+            logger.error("paypal: %s gave up after %d attempts", _describe(item), attempt)
+            return
+        retried_total.inc()
+        delay = self.retry_delay * 2 ** (attempt - 1)
+        logger.warning("paypal: %s failed (%s), retry %d in %.0fs", _describe(item), error, attempt, delay)
+        retry = {**item, "attempt": attempt}
+
+        def requeue():
+            self._retry_timers.discard(timer)
+            if not self.queue.put_nowait(retry):
+                abandoned_total.inc()
+                logger.error("paypal: %s retry dropped, payment queue is full", _describe(item))
+
+        timer = asyncio.get_running_loop().call_later(delay, requeue)
+        self._retry_timers.add(timer)
+
+    async def _process_once(self, item: dict):
+        if item["kind"] == "order":
+            await self.capture_and_credit(item["order_id"])
+            return
+        event = item["event"]
+        key = "event:" + event["id"]
+        try:
+            if not self.webhook_id or not await self.client.verify_webhook_signature(
+                    self.webhook_id, item["headers"], event):
+                invalid_total.inc()
+                logger.warning("paypal: webhook %s failed signature check", event["id"])
+                await self.store.done(key)
+                return
+            await self._handle_event(event)
+        except Exception:
+            await self.store.release(key)
+            raise
+        await self.store.done(key)
+
+    async def _handle_event(self, event: dict):
+        kind = event.get("event_type")
+        resource = event.get("resource") or {}
+        if kind == "CHECKOUT.ORDER.APPROVED":
+            await self.capture_and_credit(resource["id"], _order_custom_id(resource))
+        elif kind == "PAYMENT.CAPTURE.COMPLETED":
+            order_id = ((resource.get("supplementary_data") or {}).get("related_ids") or {}).get("order_id")
+            if not order_id:
+                logger.warning("paypal: capture %s has no related order, not credited", resource.get("id"))
+                return
+            # состояние и custom_id — из ордера у PayPal, не из события
+            await self.capture_and_credit(order_id, capture=False)
+
+    async def capture_and_credit(self, order_id: str, custom_id: Optional[str] = None, capture: bool = True):
+        key = "order:" + order_id
+        if not await self.store.claim(key):
+            duplicates_total.inc()
+            return
+        try:
+            if not capture:
+                try:
+                    order = await self.client.get_order(order_id)
+                except PayPalError as e:
+                    if e.status != 404:
+                        raise
+                    order = {"status": "NOT_FOUND"}
+            else:
+                try:
+                    order = await self.client.capture_order(order_id)
+                except PayPalError as e:
+                    if e.status != 422:  # 422 ORDER_ALREADY_CAPTURED — смотрим состояние ордера
+                        raise
+                    order = await self.client.get_order(order_id)
+            if order.get("status") != "COMPLETED":
+                logger.warning("paypal: order %s is %s, not credited", order_id, order.get("status"))
+                await self.store.release(key)
+                return
+            await self._credit(order_id, _order_custom_id(order) or custom_id)
+        except Exception:
+            await self.store.release(key)
+            raise
+        await self.store.done(key)
+
+    async def _credit(self, order_id: str, custom_id: Optional[str]):
+        parsed = parse_custom_id(custom_id)
+        if parsed is None:
+            logger.error("paypal: order %s has no valid custom_id (%r), nothing to credit", order_id, custom_id)
+            return
+        await self.credit(parsed[0], parsed[1], order_id)
+        credited_total.inc()
+
+
+def _describe(item: dict) -> str:
+    if item["kind"] == "order":
+        return "order " + item["order_id"]
+    return "event " + item["event"]["id"]
+
+
+def make_router(pipeline: PaymentPipeline) -> APIRouter:
+    router = APIRouter()
+
+    @router.post("/paypal/webhook")
+    async def paypal_webhook(request: Request):
+        try:
+            event = json.loads(await request.body())
+        except ValueError:
+            return JSONResponse({"ok": False, "error": "invalid json"}, status_code=400)
+        if not await pipeline.accept_event(event, request.headers):
+            return JSONResponse({"ok": False, "error": "payment queue is full"}, status_code=503)
+        return JSONResponse({"ok": True})
+
+    @router.get("/pay/return", response_class=PlainTextResponse)
+    async def pay_return(token: str = ""):
+        # PayPal возвращает покупателя с ?token=<order_id>; capture — в фоне
+        if token:
+            pipeline.accept_order(token)
+        return "Спасибо! Оплата обрабатывается, бот пришлёт подтверждение."
+
+    @router.get("/pay/cancel", response_class=PlainTextResponse)
+    async def pay_cancel():
+        return "Оплата отменена."
+
+    return router
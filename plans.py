@@ -0,0 +1,24 @@
+# plans.py — тарифы из env (PLAN_*): цена, квота вопросов, срок безлимита
+
+import os
+from typing import Dict, Mapping, NamedTuple, Optional
+
+
+class Plan(NamedTuple):
+    name: str
+    price: str            # строка для PayPal: "10.00"
+    quota: int = 0        # вопросов в пакете
+    months: int = 0       # срок безлимита, мес.
+
+
+def load_plans(env: Optional[Mapping[str, str]] = None) -> Dict[str, Plan]:
+    env = os.environ if env is None else env
+    plans: Dict[str, Plan] = {}
+    for name in ("starter", "pro", "unlim"):
+        price = env.get(f"PLAN_{name.upper()}_PRICE")
+        if not price:
+            continue
+        plans[name] = Plan(name, f"{float(price):.2f}",
+                           int(env.get(f"PLAN_{name.upper()}_QUOTA", "0")),
+                           int(env.get(f"PLAN_{name.upper()}_MONTHS", "0")))
+    return plans
@@ -0,0 +1,72 @@
+# response_cache.py — кэш ответов модели для повторяющихся запросов
+# Ключ: (модель, system, нормализованный prompt, корзина температуры). LRU+TTL в процессе,
+# по желанию — постоянный уровень (Redis) общий для воркеров и переживающий рестарт.
+
+import hashlib
+import json
+import logging
+from typing import Optional, Sequence
+
+import metrics
+from ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+cache_hits = metrics.counter("response_cache_hits_total", "Ответ взят из кэша")
+cache_misses = metrics.counter("response_cache_misses_total", "Промах кэша ответов")
+cache_errors = metrics.counter("response_cache_errors_total", "Ошибки постоянного уровня кэша")
+
+_TRAILING = "?!.… \t"
+_FIELD = "v"  # бэкенд state_store хранит хэши: ответ — единственное поле записи
+
+
+def normalize_prompt(prompt: str) -> str:
+    return " ".join(prompt.casefold().split()).rstrip(_TRAILING)
+
+
+class ResponseCache:
+    def __init__(self, maxsize: int = 5000, ttl: float = 6 * 3600, backend=None,
+                 temperature_step: float = 0.1, prefix: str = "gptcache:"):
+        self.ttl = ttl
+        self.backend = backend  # mget/mset как в state_store (записи — хэши) или None
+        self.temperature_step = temperature_step
+        self.prefix = prefix
+        self._local: TTLCache[str] = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    def key(self, model: str, system: Optional[str], prompt: str, temperature: float,
+            context: Sequence[dict] = ()) -> str:
+        # context — история диалога: тот же вопрос в другом разговоре — другой ответ
+        bucket = round(temperature / self.temperature_step)
+        raw = json.dumps([model, system or "", normalize_prompt(prompt), bucket,
+                          [[m["role"], m["content"]] for m in context]], ensure_ascii=False)
+        return hashlib.sha1(raw.encode()).hexdigest()
+
+    async def get(self, key: str) -> Optional[str]:
+        value = self._local.get(key)
+        if value is None and self.backend is not None:
+            try:
+                record = (await self.backend.mget([self.prefix + key]))[0]
+                value = record.get(_FIELD) if record else None
+            except Exception as e:
+                cache_errors.inc()
+                logger.warning("response cache: read failed (%s)", e)
+            if value is not None:
+                self._local.set(key, value)
+        if value is None:
+            cache_misses.inc()
+        else:
+            cache_hits.inc()
+        return value
+
+    async def set(self, key: str, value: str):
+        self._local.set(key, value)
+        if self.backend is not None:
+            try:
+                await self.backend.mset({self.prefix + key: {_FIELD: value}}, self.ttl)
+            except Exception as e:
+                cache_errors.inc()
+                logger.warning("response cache: write failed (%s)", e)
+
+    async def close(self):
+        if self.backend is not None:
+            await self.backend.close()
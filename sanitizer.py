@@ -0,0 +1,196 @@
+# sanitizer.py — чистка ответов модели от Markdown/маркеров/мета‑фраз
+# sanitize_output — без цепочки regex по всему тексту: префиксы строк снимаются по индексам,
+# # * _ ` — через str.replace, regex только для редких случаев. Результат побайтно совпадает
+# с прежней реализацией (sanitize_output_regex, оставлена как эталон для бенчмарка).
+# StreamSanitizer — то же самое для ответа, приходящего кусками.
+
+import re
+from typing import List
+
+HEADER_PAT = re.compile(r'^\s*#{1,6}\s*')     # ### заголовки
+BLOCKQUOTE_PAT = re.compile(r'^\s*>\s+')      # цитаты >
+DASH_BULLET_PAT = re.compile(r'^\s*[–—]\s+')  # тире‑буллеты в начале строки
+LIST_BULLET_PAT = re.compile(r'^\s*([\-+\•►▪▫●○◆◇])\s+')
+
+META_PATTERNS = [
+    re.compile(r'^\s*конечно[,.! ]', re.IGNORECASE),
+    re.compile(r'^\s*давайте[,.! ]', re.IGNORECASE),
+    re.compile(r'^\s*с удовольствием[,.! ]', re.IGNORECASE),
+    re.compile(r'^\s*вот как (?:можно|мы)\b', re.IGNORECASE),
+    re.compile(r'^\s*предлагаю\b', re.IGNORECASE),
+]
+
+BOLD_STAR_PAT = re.compile(r'\*\*(.*?)\*\*', re.S)
+BOLD_UNDER_PAT = re.compile(r'__(.*?)__', re.S)
+ITALIC_STAR_PAT = re.compile(r'(?<!\S)\*(.+?)\*(?!\S)', re.S)
+ITALIC_UNDER_PAT = re.compile(r'(?<!\S)_(.+?)_(?!\S)', re.S)
+SPACES_PAT = re.compile(r'[ \t]{2,}')
+BLANK_LINES_PAT = re.compile(r'\n{3,}')
+
+LIST_BULLETS = frozenset("-+•►▪▫●○◆◇")
+DASH_BULLETS = frozenset("–—")
+# символы, с которых может начинаться снимаемый префикс строки (после пробелов)
+PREFIX_START = frozenset(">#`–—") | LIST_BULLETS
+
+
+def strip_markdown_line_start(ln: str) -> str:
+    s = ln.strip()
+    if s.startswith("```"):
+        return ""  # убираем code fence блоки
+    ln = BLOCKQUOTE_PAT.sub("", ln)
+    ln = HEADER_PAT.sub("", ln)
+    # убираем маркеры списков в начале строки: -, +, •, ►, ▪, ▫, ●, ○, ◆, ◇
+    ln = LIST_BULLET_PAT.sub('', ln)
+    # убираем тире‑буллеты — и –
+    ln = DASH_BULLET_PAT.sub("", ln)
+    return ln
+
+
+def sanitize_output_regex(text: str, hard_strip: bool = True) -> str:
+    """Прежняя реализация: построчная чистка + ~8 проходов re.sub по всему тексту."""
+    if not text:
+        return text
+
+    # 1) Построчная чистка
+    lines = [strip_markdown_line_start(ln) for ln in text.splitlines()]
+    text = "\n".join(ln for ln in lines if ln is not None)
+
+    # 2) Жир/курсив Markdown: **..**, __..__, *..*, _.._
+    text = re.sub(r'\*\*(.*?)\*\*', r'\1', text, flags=re.S)
+    text = re.sub(r'__(.*?)__', r'\1', text, flags=re.S)
+    text = re.sub(r'(?<!\S)\*(.+?)\*(?!\S)', r'\1', text, flags=re.S)
+    text = re.sub(r'(?<!\S)_(.+?)_(?!\S)', r'\1', text, flags=re.S)
+
+    # 3) «Страховка»: по желанию — полностью вырезаем # * _ `
+    if hard_strip:
+        text = re.sub(r'[#*_`]+', '', text)
+
+    # 4) Убираем стартовые мета‑фразы
+    text = text.strip()
+    ls = text.splitlines()
+    while ls:
+        head = ls[0].strip()
+        if any(p.match(head) for p in META_PATTERNS):
+            ls.pop(0)
+        else:
+            break
+    text = "\n".join(ls).strip()
+
+    # 5) Сжимаем пустые строки и лишние пробелы
+    text = re.sub(r'\n{3,}', '\n\n', text)
+    text = re.sub(r'[ \t]{2,}', ' ', text)
+    return text
+
+
+def _skip_ws(ln: str, i: int) -> int:
+    n = len(ln)
+    while i < n and ln[i].isspace():
+        i += 1
+    return i
+
+
+def _strip_line_start(ln: str) -> str:
+    """То же, что strip_markdown_line_start, но без regex: индексы вместо подстановок."""
+    i = _skip_ws(ln, 0)
+    if i == len(ln) or ln[i] not in PREFIX_START:
+        return ln  # частый случай: обычная строка
+    if ln.startswith("```", i):
+        return ""
+    # цитата: \s*>\s+
+    if ln[i] == ">":
+        j = _skip_ws(ln, i + 1)
+        if j > i + 1:
+            ln = ln[j:]
+            i = _skip_ws(ln, 0)
+    # заголовок: \s*#{1,6}\s*
+    if i < len(ln) and ln[i] == "#":
+        j = i
+        while j < len(ln) and j - i < 6 and ln[j] == "#":
+            j += 1
+        ln = ln[_skip_ws(ln, j):]
+        i = _skip_ws(ln, 0)
+    # маркер списка, затем тире‑буллет: \s*X\s+
+    for bullets in (LIST_BULLETS, DASH_BULLETS):
+        if i < len(ln) and ln[i] in bullets:
+            j = _skip_ws(ln, i + 1)
+            if j > i + 1:
+                ln = ln[j:]
+                i = _skip_ws(ln, 0)
+    return ln
+
+
+def _clean_lines(lines: List[str]) -> List[str]:
+    # префикс снимаем только у строк, которые начинаются с пробела или маркера
+    return [_strip_line_start(ln) if ln and (ln[0] in PREFIX_START or ln[0].isspace()) else ln
+            for ln in lines]
+
+
+def _strip_emphasis(text: str, hard_strip: bool) -> str:
+    if hard_strip:
+        # все # * _ ` удаляются целиком, так что шаг «жир/курсив» ничего не меняет
+        return text.replace("*", "").replace("_", "").replace("#", "").replace("`", "")
+    for pat in (BOLD_STAR_PAT, BOLD_UNDER_PAT, ITALIC_STAR_PAT, ITALIC_UNDER_PAT):
+        text = pat.sub(r'\1', text)
+    return text
+
+
+def _finish(text: str) -> str:
+    # 4) мета‑фразы в начале ответа
+    text = text.strip()
+    if text:
+        ls = text.split("\n")
+        k = 0
+        while k < len(ls) and any(p.match(ls[k].strip()) for p in META_PATTERNS):
+            k += 1
+        if k:
+            text = "\n".join(ls[k:]).strip()
+    # 5) не больше одной пустой строки подряд, пробелы/табы — в один пробел
+    if "\n\n\n" in text:
+        text = BLANK_LINES_PAT.sub("\n\n", text)
+    if "  " in text or "\t" in text:
+        text = SPACES_PAT.sub(" ", text)
+    return text
+
+
+def sanitize_output(text: str, hard_strip: bool = True) -> str:
+    if not text:
+        return text
+    body = "\n".join(_clean_lines(text.splitlines()))
+    return _finish(_strip_emphasis(body, hard_strip))
+
+
+class StreamSanitizer:
+    """Принимает ответ кусками. text() — чистый вид всех завершённых строк
+    (недописанная строка не показывается), finish() == sanitize_output(весь текст)."""
+
+    def __init__(self, hard_strip: bool = True):
+        self.hard_strip = hard_strip
+        self._lines: List[str] = []  # завершённые строки, префиксы уже сняты
+        self._tail = ""              # недописанная строка
+
+    def feed(self, chunk: str) -> bool:
+        """Добавляет кусок; True — появились новые завершённые строки."""
+        if not chunk:
+            return False
+        parts = (self._tail + chunk).splitlines(keepends=True)
+        last = parts[-1]
+        # "\r" в конце может оказаться половиной "\r\n" — ждём следующий кусок
+        if last.endswith("\r") or last.splitlines()[0] == last:
+            self._tail = parts.pop()
+        else:
+            self._tail = ""
+        if not parts:
+            return False
+        self._lines.extend(_clean_lines("".join(parts).splitlines()))
+        return True
+
+    def text(self) -> str:
+        if not self._lines:
+            return ""
+        return _finish(_strip_emphasis("\n".join(self._lines), self.hard_strip))
+
+    def finish(self) -> str:
+        lines = self._lines + _clean_lines(self._tail.splitlines()) if self._tail else self._lines
+        if not lines:
+            return self._tail
+        return _finish(_strip_emphasis("\n".join(lines), self.hard_strip))
@@ -0,0 +1,120 @@
+# scheduler.py — планировщик апдейтов: в пределах одного ключа (чат/пользователь)
+# строго по порядку, разные ключи — параллельно, не больше `limit` выполняющихся одновременно.
+# Очередь ключа живёт, пока в ней есть работа; опустевшая удаляется сразу. Ждущие в очереди
+# ключа слотов не занимают, а сама очередь ограничена `max_pending`: лишнее отклоняется (LaneFull),
+# иначе один шумный чат забирает все слоты/воркеры, пока его апдейты идут по одному.
+
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, Optional, Set, Tuple
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+Job = Callable[[], Awaitable[Any]]
+
+lanes_active = metrics.gauge("scheduler_lanes", "Ключей с работой")
+jobs_inflight = metrics.gauge("scheduler_inflight", "Апдейтов в работе и в очередях ключей")
+jobs_failed = metrics.counter("scheduler_failed_total", "Ошибки обработчика")
+jobs_rejected = metrics.counter("scheduler_rejected_total", "Отклонено: очередь ключа полна")
+
+
+def update_key(data: dict) -> Optional[int]:
+    """Ключ очерёдности по сырому апдейту: id чата, иначе id пользователя."""
+    for kind in ("message", "edited_message", "channel_post", "edited_channel_post"):
+        msg = data.get(kind)
+        if msg:
+            return (msg.get("chat") or {}).get("id")
+    cb = data.get("callback_query")
+    if cb:
+        chat = ((cb.get("message") or {}).get("chat") or {}).get("id")
+        return chat if chat is not None else (cb.get("from") or {}).get("id")
+    for kind, payload in data.items():
+        if isinstance(payload, dict) and isinstance(payload.get("from"), dict):
+            return payload["from"].get("id")
+    return None
+
+
+class LaneFull(Exception):
+    """У ключа уже max_pending апдейтов (в работе и в очереди)"""
+
+
+class KeyedScheduler:
+    def __init__(self, limit: int = 64, max_pending: int = 8):
+        self.limit = limit  # выполняющихся job по всем ключам
+        self.max_pending = max_pending  # job одного ключа, включая выполняющийся
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._lanes: Dict[Hashable, Deque[Tuple[Job, asyncio.Future]]] = {}
+        self._pending: Dict[Hashable, int] = {}  # job ключа в очереди и в работе
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def submit(self, key: Hashable, job: Job) -> asyncio.Future:
+        """Ставит job в очередь ключа (слот берётся при запуске, не здесь); LaneFull — очередь
+        ключа полна. Возвращает future с результатом; отмена future отменяет job."""
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.limit)
+        if self._pending.get(key, 0) >= self.max_pending:
+            jobs_rejected.inc()
+            raise LaneFull(key)
+        fut = asyncio.get_running_loop().create_future()
+        jobs_inflight.inc()
+        self._pending[key] = self._pending.get(key, 0) + 1
+        lane = self._lanes.get(key)
+        if lane is None:
+            lane = self._lanes[key] = deque()
+            lane.append((job, fut))
+            lanes_active.set(len(self._lanes))
+            task = asyncio.create_task(self._run_lane(key, lane))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        else:
+            lane.append((job, fut))
+        return fut
+
+    async def drain(self, timeout: float = 30.0) -> bool:
+        """Дождаться работы всех ключей (остановка); False — не успели за timeout."""
+        if not self._tasks:
+            return True
+        _, pending = await asyncio.wait(set(self._tasks), timeout=timeout)
+        if pending:
+            logger.warning("scheduler: %d lanes still busy on shutdown", len(pending))
+        return not pending
+
+    async def _run_lane(self, key: Hashable, lane: Deque[Tuple[Job, asyncio.Future]]):
+        try:
+            while lane:
+                job, fut = lane.popleft()
+                try:
+                    async with self._slots:
+                        if not fut.done():  # могли отменить, пока ждали слот
+                            await self._run_job(job, fut)
+                finally:
+                    jobs_inflight.dec()
+                    self._pending[key] -= 1
+        finally:
+            self._lanes.pop(key, None)
+            self._pending.pop(key, None)
+            lanes_active.set(len(self._lanes))
+
+    @staticmethod
+    async def _run_job(job: Job, fut: asyncio.Future):
+        task = asyncio.ensure_future(job())
+        fut.add_done_callback(lambda f: task.cancel() if f.cancelled() else None)
+        try:
+            result = await task
+        except asyncio.CancelledError:
+            fut.cancel()
+            if not task.cancelled():
+                raise
+            return
+        except Exception as e:
+            jobs_failed.inc()
+            logger.exception("scheduler: update handler failed")
+            if not fut.done():
+                fut.set_exception(e)
+                fut.exception()  # ошибку уже залогировали; ждать future не обязательно
+            return
+        if not fut.done():
+            fut.set_result(result)
@@ -0,0 +1,65 @@
+# script_detect.py — определение языка по письменности за один проход:
+# str.translate по заранее собранной таблице (весь BMP -> буква-класс), затем str.count.
+# Новая письменность — одна строка в SCRIPTS.
+
+from typing import Dict, Iterable, Optional, Sequence, Tuple, Union
+
+Range = Union[Tuple[str, str], str]  # ("А", "я") — диапазон, "ёЁ" — отдельные символы
+
+SCRIPTS: Dict[str, Sequence[Range]] = {
+    "he": [("\u0590", "\u05FF")],                   # иврит
+    "ru": [("А", "я"), "ёЁ"],                         # кириллица
+    "en": [("A", "z")],                               # латиница (как раньше: A..z целиком)
+    "uk": ["ґҐєЄіІїЇ"],                               # только украинские буквы
+    "ar": [("\u0600", "\u06FF"), ("\u0750", "\u077F")],
+    "zh": [("\u3400", "\u4DBF"), ("\u4E00", "\u9FFF")],
+    "ja": [("\u3040", "\u30FF")],                   # хирагана + катакана
+    "ko": [("\uAC00", "\uD7AF")],
+}
+
+# уточнения: «uk» выигрывает у «ru», если в тексте есть украинские буквы
+REFINES = {"uk": "ru"}
+
+DEFAULT_LANGS = ("he", "ru", "en")
+
+_OTHER = "\0"
+
+
+def _build_table(scripts: Dict[str, Sequence[Range]]) -> Tuple[str, Dict[str, str]]:
+    marks = {lang: chr(ord("a") + i) for i, lang in enumerate(scripts)}
+    table = [_OTHER] * 0x10000
+    for lang, ranges in scripts.items():
+        for r in ranges:
+            chars = (chr(c) for c in range(ord(r[0]), ord(r[1]) + 1)) if isinstance(r, tuple) else r
+            for ch in chars:
+                table[ord(ch)] = marks[lang]
+    return "".join(table), marks
+
+
+_TABLE, _MARKS = _build_table(SCRIPTS)
+
+
+def script_counts(text: str, langs: Iterable[str] = SCRIPTS) -> Dict[str, int]:
+    """Сколько символов каждой письменности; символы вне BMP не считаются."""
+    classes = text.translate(_TABLE)
+    return {lang: classes.count(_MARKS[lang]) for lang in langs}
+
+
+def detect_script_lang(text: str, langs: Sequence[str] = DEFAULT_LANGS) -> Optional[str]:
+    """Язык, чья письменность строго преобладает над остальными из langs; иначе None."""
+    counts = script_counts(text, langs)
+    refined = {lang: base for lang, base in REFINES.items() if lang in counts}
+    for lang in refined:
+        counts.pop(lang)
+    best, best_n = None, 0
+    for lang, n in counts.items():
+        if n > best_n:
+            best, best_n = lang, n
+        elif n == best_n:
+            best = None  # ничья — как и раньше, не угадываем
+    if best is None:
+        return None
+    for lang, base in refined.items():
+        if base == best and script_counts(text, (lang,))[lang]:
+            return lang
+    return best
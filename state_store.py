@@ -0,0 +1,185 @@
+# state_store.py — состояние пользователя (язык UI, история языков, метаданные голоса)
+# Два уровня: LRU+TTL в процессе -> общий backend (Redis между воркерами gunicorn или память).
+# Чтения промахов за один тик цикла склеиваются в одну пачку, записи уходят пачкой в фоне.
+# Запись — по полям (HSET только изменённых): локальная копия может отставать на local_ttl,
+# и запись целиком затёрла бы поле, изменённое за это время другим воркером.
+
+import asyncio
+import json
+import logging
+from collections import deque
+from typing import Deque, Dict, Iterable, List, Optional, Set, Tuple
+
+import metrics
+from ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+local_hits = metrics.counter("state_local_hits_total", "Состояние найдено в локальном кэше")
+backend_reads = metrics.counter("state_backend_reads_total", "Пачек чтения из backend")
+backend_writes = metrics.counter("state_backend_writes_total", "Пачек записи в backend")
+backend_errors = metrics.counter("state_backend_errors_total", "Ошибки backend")
+
+
+class UserRecord:
+    __slots__ = ("ui_lang", "lang_hist", "voice_meta")
+    FIELDS = {"ui_lang": "ui", "lang_hist": "hist", "voice_meta": "voice"}  # атрибут -> поле хэша
+
+    def __init__(self, ui_lang: str = "ru", lang_hist: Iterable[str] = (), voice_meta: Optional[dict] = None):
+        self.ui_lang = ui_lang
+        self.lang_hist: Deque[str] = deque(lang_hist, maxlen=3)
+        self.voice_meta: Dict[str, object] = voice_meta or {}  # last_ts, last_file (file_unique_id)
+
+    def dump_fields(self, attrs: Iterable[str]) -> Dict[str, str]:
+        values = {"ui_lang": self.ui_lang, "lang_hist": list(self.lang_hist), "voice_meta": self.voice_meta}
+        return {self.FIELDS[a]: json.dumps(values[a]) for a in attrs}
+
+    @classmethod
+    def load_fields(cls, data: Dict[str, str]) -> "UserRecord":
+        values = {name: json.loads(raw) for name, raw in data.items() if raw}
+        return cls(values.get("ui", "ru"), values.get("hist", ()), values.get("voice") or {})
+
+
+class MemoryBackend:
+    """Один процесс: ограниченный LRU вместо бесконечных defaultdict."""
+
+    def __init__(self, maxsize: int = 100_000):
+        self._data: TTLCache[Dict[str, str]] = TTLCache(maxsize=maxsize)
+
+    async def mget(self, keys: List[str]) -> List[Optional[Dict[str, str]]]:
+        return [dict(self._data.get(k) or {}) or None for k in keys]
+
+    async def mset(self, items: Dict[str, Dict[str, str]], ttl: float):
+        for k, fields in items.items():
+            self._data.set(k, {**(self._data.get(k) or {}), **fields}, ttl)
+
+    async def close(self):
+        pass
+
+
+class RedisBackend:
+    """Общий для всех воркеров; client — redis.asyncio.Redis или совместимый (fakeredis)."""
+
+    def __init__(self, client):
+        self.client = client
+
+    async def mget(self, keys: List[str]) -> List[Optional[Dict[str, str]]]:
+        pipe = self.client.pipeline(transaction=False)
+        for k in keys:
+            pipe.hgetall(k)
+        return [data or None for data in await pipe.execute()]
+
+    async def mset(self, items: Dict[str, Dict[str, str]], ttl: float):
+        pipe = self.client.pipeline(transaction=False)
+        for k, fields in items.items():
+            pipe.hset(k, mapping=fields)
+            pipe.expire(k, int(ttl))
+        await pipe.execute()
+
+    async def close(self):
+        await self.client.aclose()
+
+
+def make_backend(kind: str, redis_url: str):
+    if kind == "redis":
+        try:
+            import redis.asyncio as aioredis
+            return RedisBackend(aioredis.from_url(redis_url, decode_responses=True))
+        except Exception as e:
+            logger.warning("state store: redis unavailable (%s), using memory backend", e)
+    return MemoryBackend()
+
+
+class UserStateStore:
+    def __init__(self, backend, local_size: int = 10_000, local_ttl: float = 30.0,
+                 record_ttl: float = 30 * 86400, flush_interval: float = 0.2, prefix: str = "ustate:h:"):
+        self.backend = backend
+        self.record_ttl = record_ttl
+        self.flush_interval = flush_interval
+        self.prefix = prefix
+        self._local: TTLCache[UserRecord] = TTLCache(maxsize=local_size, ttl=local_ttl)
+        self._dirty: Dict[int, Tuple[UserRecord, Set[str]]] = {}  # uid -> (запись, изменённые атрибуты)
+        self._waiting: Dict[int, asyncio.Future] = {}  # промахи, ждущие общего MGET
+        self._flusher: Optional[asyncio.Task] = None
+        self._closed = False
+
+    def _cached(self, uid: int) -> Optional[UserRecord]:
+        dirty = self._dirty.get(uid)
+        return dirty[0] if dirty is not None else self._local.get(uid)
+
+    async def get(self, uid: int) -> UserRecord:
+        rec = self._cached(uid)
+        if rec is not None:
+            local_hits.inc()
+            return rec
+        fut = self._waiting.get(uid)
+        if fut is None:
+            if not self._waiting:
+                asyncio.get_running_loop().call_soon(lambda: asyncio.ensure_future(self._load_batch()))
+            fut = self._waiting[uid] = asyncio.get_running_loop().create_future()
+        return await asyncio.shield(fut)
+
+    async def get_many(self, uids: Iterable[int]) -> Dict[int, UserRecord]:
+        uids = list(uids)
+        records = await asyncio.gather(*(self.get(uid) for uid in uids))
+        return dict(zip(uids, records))
+
+    async def _load_batch(self):
+        batch, self._waiting = self._waiting, {}
+        uids = list(batch)
+        try:
+            raws = await self.backend.mget([self.prefix + str(uid) for uid in uids])
+            backend_reads.inc()
+        except Exception as e:
+            backend_errors.inc()
+            logger.warning("state store: read failed (%s), using defaults", e)
+            raws = [None] * len(uids)
+        for uid, raw in zip(uids, raws):
+            # пока ждали чтения, запись могла появиться локально — она свежее
+            rec = self._cached(uid)
+            if rec is None:
+                rec = UserRecord.load_fields(raw) if raw else UserRecord()
+                self._local.set(uid, rec)
+            if not batch[uid].done():
+                batch[uid].set_result(rec)
+
+    def mark_dirty(self, uid: int, rec: UserRecord, *attrs: str):
+        """Изменённые атрибуты (по умолчанию все) уходят в backend в фоне (write-behind),
+        локально видны сразу."""
+        self._local.set(uid, rec)
+        dirty = self._dirty.get(uid)
+        if dirty is None or dirty[0] is not rec:
+            dirty = self._dirty[uid] = (rec, set())
+        dirty[1].update(attrs or UserRecord.FIELDS)
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.ensure_future(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.flush_interval)
+        await self.flush()
+
+    async def flush(self):
+        if not self._dirty:
+            return
+        batch, self._dirty = self._dirty, {}
+        try:
+            await self.backend.mset({self.prefix + str(uid): rec.dump_fields(attrs)
+                                     for uid, (rec, attrs) in batch.items()}, self.record_ttl)
+            backend_writes.inc()
+        except Exception as e:
+            backend_errors.inc()
+            logger.warning("state store: write of %d records failed (%s)", len(batch), e)
+            for uid, (rec, attrs) in batch.items():
+                if uid in self._dirty:
+                    self._dirty[uid][1].update(attrs)
+                else:
+                    self._dirty[uid] = (rec, attrs)
+            if not self._closed:
+                self._flusher = asyncio.ensure_future(self._flush_later())
+
+    async def close(self):
+        self._closed = True
+        if self._flusher is not None and not self._flusher.done():
+            self._flusher.cancel()
+        await self.flush()
+        await self.backend.close()
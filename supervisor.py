@@ -0,0 +1,149 @@
+# supervisor.py — надзор за генерацией ответа: «печатает…», дедлайн, деградация
+# Пока модель думает, в чат раз в interval сек. уходит sendChatAction(typing) — статус живёт ~5 с.
+# Ответ не уложился в дедлайн намерения -> запрос отменяется (HTTP к OpenAI рвётся вместе с задачей),
+# дальше: готовый ответ из кэша -> быстрая модель (gpt-4o -> gpt-4o-mini) со своим дедлайном.
+# Ошибка основной модели деградирует так же, как таймаут.
+
+import asyncio
+import logging
+from typing import AsyncIterator, Awaitable, Callable, Optional
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+deadline_total = metrics.counter("llm_deadline_exceeded_total", "Генерация не уложилась в дедлайн и отменена")
+fallback_total = metrics.counter("llm_fallback_total", "Ответ дала запасная (быстрая) модель")
+fallback_cached_total = metrics.counter("llm_fallback_cached_total", "Вместо опоздавшей модели — ответ из кэша")
+gave_up_total = metrics.counter("llm_gave_up_total", "Ни основная, ни запасная модель не ответили")
+
+Call = Callable[[str], Awaitable[str]]                # model -> ответ
+Stream = Callable[[str], AsyncIterator[str]]         # model -> дельты ответа
+Lookup = Callable[[str], Awaitable[Optional[str]]]   # model -> ответ из кэша
+
+
+class ChatAction:
+    """send() сразу и каждые interval сек., пока не stop() / выход из async with."""
+
+    def __init__(self, send: Callable[[], Awaitable], interval: float = 4.0):
+        self.send = send
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._loop())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.send()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # статус — украшение: ни флуд-лимит, ни сеть не должны ломать ответ
+                logger.debug("chat action failed (%s)", e)
+            await asyncio.sleep(self.interval)
+
+    async def __aenter__(self):
+        self.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        self.stop()
+
+
+def _never(_: str) -> bool:
+    return False
+
+
+class Supervisor:
+    def __init__(self, fallback_model: Optional[str] = None, fallback_deadline: float = 20.0,
+                 is_error: Callable[[str], bool] = _never):
+        self.fallback_model = fallback_model  # None — без деградации на другую модель
+        self.fallback_deadline = fallback_deadline
+        self.is_error = is_error  # ответ-заглушка об ошибке (ask_openai не бросает исключений)
+
+    def _fallback_for(self, model: str) -> Optional[str]:
+        return self.fallback_model if self.fallback_model and self.fallback_model != model else None
+
+    async def complete(self, call: Call, model: str, deadline: float,
+                       cached: Optional[Lookup] = None) -> Optional[str]:
+        """Ответ основной модели, иначе кэш/запасная модель; None — не ответил никто."""
+        ans = await self._attempt(call, model, deadline)
+        if ans is not None:
+            return ans
+        fallback = self._fallback_for(model)
+        if cached is not None:
+            hit = await cached(fallback or model)
+            if hit:
+                fallback_cached_total.inc()
+                return hit
+        if fallback:
+            ans = await self._attempt(call, fallback, self.fallback_deadline)
+            if ans is not None:
+                fallback_total.inc()
+                return ans
+        gave_up_total.inc()
+        return None
+
+    async def _attempt(self, call: Call, model: str, deadline: float) -> Optional[str]:
+        try:
+            ans = await asyncio.wait_for(call(model), deadline)  # по таймауту задача отменяется
+        except asyncio.TimeoutError:
+            deadline_total.inc()
+            logger.warning("llm: %s missed its %.0fs deadline, request cancelled", model, deadline)
+            return None
+        if self.is_error(ans):
+            logger.warning("llm: %s failed (%s)", model, ans[:200])
+            return None
+        return ans
+
+    async def stream(self, stream: Stream, model: str, deadline: float,
+                     cached: Optional[Lookup] = None) -> AsyncIterator[str]:
+        """Как complete, но дедлайн — на первую дельту: пошёл текст — модель жива, ждём до конца
+        (общий предел — OPENAI_TIMEOUT в LLMEngine)."""
+        chunks = await self._first(stream, model, deadline)
+        if chunks is None:
+            fallback = self._fallback_for(model)
+            hit = await cached(fallback or model) if cached is not None else None
+            if hit:
+                fallback_cached_total.inc()
+                yield hit
+                return
+            if fallback:
+                chunks = await self._first(stream, fallback, self.fallback_deadline)
+                if chunks is not None:
+                    fallback_total.inc()
+            if chunks is None:
+                gave_up_total.inc()
+                return
+        first, rest = chunks
+        yield first
+        try:
+            async for delta in rest:
+                yield delta
+        finally:
+            await rest.aclose()
+
+    async def _first(self, stream: Stream, model: str, deadline: float):
+        rest = stream(model)
+        try:
+            first = await asyncio.wait_for(rest.__anext__(), deadline)
+        except asyncio.TimeoutError:
+            deadline_total.inc()
+            logger.warning("llm: %s sent nothing within %.0fs, stream cancelled", model, deadline)
+            await rest.aclose()
+            return None
+        except StopAsyncIteration:
+            return None
+        if self.is_error(first):
+            logger.warning("llm: %s failed (%s)", model, first[:200])
+            await rest.aclose()
+            return None
+        return first, rest
@@ -0,0 +1,26 @@
+import asyncio
+
+import pytest
+
+from response_cache import ResponseCache
+from state_store import MemoryBackend, RedisBackend
+
+
+def _roundtrip(backend) -> str:
+    async def run():
+        writer = ResponseCache(backend=backend)
+        key = writer.key("gpt-4o-mini", None, "Как выбрать ноутбук?", 0.6)
+        await writer.set(key, "Смотрите на вес и автономность.")
+        # новый экземпляр — локальный уровень пуст, ответ берётся из постоянного
+        return await ResponseCache(backend=backend).get(key)
+    return asyncio.run(run())
+
+
+def test_memory_backend_roundtrip():
+    assert _roundtrip(MemoryBackend()) == "Смотрите на вес и автономность."
+
+
+def test_redis_backend_roundtrip():
+    fakeredis = pytest.importorskip("fakeredis")
+    backend = RedisBackend(fakeredis.FakeAsyncRedis(decode_responses=True))
+    assert _roundtrip(backend) == "Смотрите на вес и автономность."
@@ -0,0 +1,47 @@
+import json
+import os
+
+import pytest
+
+from sanitizer import StreamSanitizer, sanitize_output, sanitize_output_regex
+
+GOLDEN = os.path.join(os.path.dirname(__file__), os.pardir, "bench", "data", "sanitizer_golden.json")
+
+with open(GOLDEN, encoding="utf-8") as f:
+    CASES = json.load(f)
+
+
+def _stream(text: str, size: int) -> str:
+    stream = StreamSanitizer()
+    for i in range(0, len(text), size):
+        stream.feed(text[i:i + size])
+    return stream.finish()
+
+
+@pytest.mark.parametrize("case", CASES, ids=range(len(CASES)))
+def test_golden_single_pass_matches_regex(case):
+    assert sanitize_output(case["input"]) == case["expected"]
+    assert sanitize_output_regex(case["input"]) == case["expected"]
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 64])
+@pytest.mark.parametrize("case", CASES, ids=range(len(CASES)))
+def test_golden_stream_any_chunking(case, size):
+    # границы кусков режут разметку и "\r\n" в разных местах
+    assert _stream(case["input"], size) == case["expected"]
+
+
+def test_stream_crlf_split_across_chunks():
+    stream = StreamSanitizer()
+    assert stream.feed("Первая\r") is False  # "\r" может быть половиной "\r\n"
+    assert stream.feed("\nвторая") is True
+    assert stream.text() == "Первая"
+    assert stream.finish() == sanitize_output("Первая\r\nвторая")
+
+
+def test_stream_hides_unfinished_line():
+    stream = StreamSanitizer()
+    stream.feed("### Заголовок\n**Жир")
+    assert stream.text() == sanitize_output("### Заголовок")
+    stream.feed("ный** текст")
+    assert stream.finish() == sanitize_output("### Заголовок\n**Жирный** текст")
@@ -0,0 +1,241 @@
+# tracing.py — трассировка апдейта по этапам и сэмплирующий профайлер
+# Трасса — на апдейт, доля TRACE_SAMPLE_RATE: root("webhook") в tg_webhook, внутри — span("parse"),
+# span("llm"), span("send"), ... Текущая трасса — в ContextVar, без неё span() возвращает общий
+# пустой объект (одна проверка ContextVar — вся цена выключенной трассировки).
+# Готовые трассы — в кольцевом буфере (/admin/traces), медленные — в лог WARNING.
+# Профайлер: фоновый поток раз в interval снимает стек потока event loop (sys._current_frames)
+# и копит «свёрнутые» стеки: "mod:func;mod:func 42" — вход flamegraph.pl / speedscope.
+
+import logging
+import random
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextvars import ContextVar
+from typing import Deque, Dict, List, Optional
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+traces_total = metrics.counter("traces_total", "Записанные трассы апдейтов")
+traces_slow_total = metrics.counter("traces_slow_total", "Трассы дольше TRACE_SLOW_SECONDS")
+profiler_samples_total = metrics.counter("profiler_samples_total", "Снимки стека профайлера")
+
+_trace: ContextVar[Optional["Trace"]] = ContextVar("trace", default=None)
+_depth: ContextVar[int] = ContextVar("trace_depth", default=0)
+
+
+class Trace:
+    __slots__ = ("name", "started", "wall", "spans", "total", "done")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.started = time.perf_counter()
+        self.wall = time.time()
+        self.spans: List[tuple] = []  # (имя, начало от старта трассы, длительность, глубина, ошибка)
+        self.total = 0.0
+        self.done = False
+
+    def as_dict(self) -> Dict[str, object]:
+        return {
+            "name": self.name,
+            "ts": round(self.wall, 3),
+            "ms": round(self.total * 1000, 3),
+            "spans": [{"name": n, "at_ms": round(at * 1000, 3), "ms": round(d * 1000, 3), "depth": depth,
+                       **({"error": err} if err else {})}
+                      for n, at, d, depth, err in sorted(self.spans, key=lambda s: s[1])],
+        }
+
+
+class _NoSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NO_SPAN = _NoSpan()
+
+
+class _Span:
+    __slots__ = ("trace", "name", "depth", "started", "token")
+
+    def __init__(self, trace: Trace, name: str):
+        self.trace = trace
+        self.name = name
+
+    def __enter__(self):
+        self.depth = _depth.get()
+        self.token = _depth.set(self.depth + 1)
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        ended = time.perf_counter()
+        try:
+            _depth.reset(self.token)
+        except ValueError:  # выход в другом контексте (генератор дожали из другой задачи)
+            _depth.set(self.depth)
+        if not self.trace.done:
+            self.trace.spans.append((self.name, self.started - self.trace.started, ended - self.started,
+                                     self.depth, exc_type.__name__ if exc_type else None))
+        return False
+
+
+class _Root(_Span):
+    __slots__ = ("trace_token",)
+
+    def __enter__(self):
+        self.trace_token = _trace.set(self.trace)
+        return super().__enter__()
+
+    def __exit__(self, exc_type, exc, tb):
+        super().__exit__(exc_type, exc, tb)
+        self.trace.total = time.perf_counter() - self.trace.started
+        self.trace.done = True
+        try:
+            _trace.reset(self.trace_token)
+        except ValueError:
+            _trace.set(None)
+        tracer.finish(self.trace)
+        return False
+
+
+class Tracer:
+    def __init__(self, sample_rate: float = 0.0, slow_seconds: float = 5.0, keep: int = 200):
+        self.sample_rate = sample_rate  # 0 — выключено
+        self.slow_seconds = slow_seconds
+        self.recent: Deque[Trace] = deque(maxlen=keep)
+
+    def configure(self, sample_rate: Optional[float] = None, slow_seconds: Optional[float] = None,
+                  keep: Optional[int] = None):
+        if sample_rate is not None:
+            self.sample_rate = max(0.0, min(1.0, sample_rate))
+        if slow_seconds is not None:
+            self.slow_seconds = slow_seconds
+        if keep is not None and keep != self.recent.maxlen:
+            self.recent = deque(self.recent, maxlen=keep)
+
+    def finish(self, trace: Trace):
+        traces_total.inc()
+        self.recent.append(trace)
+        if trace.total >= self.slow_seconds:
+            traces_slow_total.inc()
+            logger.warning("trace: slow %s %.0fms: %s", trace.name, trace.total * 1000,
+                           ", ".join(f"{'  ' * depth}{n} {d * 1000:.1f}ms"
+                                     for n, _, d, depth, _ in trace.spans[:-1]))
+
+    def snapshot(self, limit: int = 50, min_ms: float = 0.0) -> List[Dict[str, object]]:
+        """Последние трассы, новые первыми."""
+        out = []
+        for trace in reversed(self.recent):
+            if trace.total * 1000 >= min_ms:
+                out.append(trace.as_dict())
+                if len(out) >= limit:
+                    break
+        return out
+
+
+tracer = Tracer()
+
+
+def root(name: str):
+    """Начало трассы апдейта (с вероятностью sample_rate); уже внутри трассы — обычный span."""
+    trace = _trace.get()
+    if trace is not None:
+        return _Span(trace, name)
+    rate = tracer.sample_rate
+    if not rate or (rate < 1.0 and random.random() >= rate):
+        return NO_SPAN
+    return _Root(Trace(name), name)
+
+
+def span(name: str):
+    trace = _trace.get()
+    if trace is None or trace.done:
+        return NO_SPAN
+    return _Span(trace, name)
+
+
+def current() -> Optional[Trace]:
+    return _trace.get()
+
+
+def resume(trace: Optional[Trace]):
+    """Продолжить трассу апдейта в задаче, созданной вне её контекста (очередь ключа в scheduler).
+    Ставится всегда, и None тоже: контекст задачи — копия контекста первого апдейта ключа,
+    и в нём лежит чужая (уже закрытая) трасса."""
+    _trace.set(trace)  # у задачи своя копия контекста — снаружи не видно
+    _depth.set(1 if trace is not None else 0)  # работа задачи — внутри корня трассы
+
+
+# =========================
+# Сэмплирующий профайлер
+# =========================
+def _frame_name(frame) -> str:
+    return f"{frame.f_globals.get('__name__', '?')}:{frame.f_code.co_name}"
+
+
+class SamplingProfiler:
+    def __init__(self):
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, seconds: float, interval: float = 0.005, thread_id: Optional[int] = None,
+              all_threads: bool = False) -> bool:
+        """Профилировать seconds сек. поток thread_id (по умолчанию — вызывающий, т.е. event loop);
+        False — уже идёт."""
+        if self.running:
+            return False
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop.clear()
+        target = None if all_threads else (thread_id or threading.get_ident())
+        self._thread = threading.Thread(target=self._run, args=(seconds, interval, target),
+                                        name="sampling-profiler", daemon=True)
+        self._thread.start()
+        return True
+
+    def _run(self, seconds: float, interval: float, target: Optional[int]):
+        me = threading.get_ident()
+        names = {t.ident: t.name for t in threading.enumerate()}
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline and not self._stop.wait(interval):
+            frames = sys._current_frames()
+            for ident, frame in frames.items():
+                if ident == me or (target is not None and ident != target):
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_name(frame))
+                    frame = frame.f_back
+                if target is None:
+                    stack.append(names.get(ident, str(ident)))
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+        profiler_samples_total.inc(self.samples)
+
+    def stop(self) -> str:
+        """Остановить (если идёт) и вернуть свёрнутые стеки."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        return self.collapsed()
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {n}\n" for stack, n in self.stacks.most_common())
+
+
+profiler = SamplingProfiler()
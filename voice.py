@@ -0,0 +1,239 @@
+# voice.py — голосовые: скачивание -> перекодирование -> распознавание, с кэшем и лимитами
+# Файл качается потоком на диск (bot.download_file, кусками), ffmpeg (imageio-ffmpeg) —
+# в пуле процессов, event loop только ждёт. Перекодирование (OGG/Opus -> WAV 16 кГц моно)
+# нужно, только если движок не берёт исходный формат: OpenAI принимает .oga как есть.
+# Движок распознавания — подключаемый: openai (Whisper / gpt-4o-*-transcribe) или stub (офлайн).
+# Результат — в кэше по file_unique_id (один и тот же файл у всех пользователей и пересылок),
+# повторное нажатие «Показать расшифровку» отвечает из него сразу.
+# Не больше concurrency голосовых одновременно и max_pending в работе вообще: всплеск
+# голосовых занимает ограниченную часть слотов планировщика, текст не ждёт за ними.
+
+import abc
+import asyncio
+import logging
+import multiprocessing
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional, Sequence
+
+import metrics
+import tracing
+from ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+voice_pending = metrics.gauge("voice_pending", "Голосовые в работе, включая ждущие слот")
+voice_active = metrics.gauge("voice_active", "Голосовые, которые сейчас качаются/перекодируются/распознаются")
+voice_rejected_total = metrics.counter("voice_rejected_total", "Голосовые не приняты в работу", labels=("reason",))
+voice_cache_hits_total = metrics.counter("voice_cache_hits_total", "Расшифровка из кэша по file_unique_id")
+voice_errors_total = metrics.counter("voice_errors_total", "Ошибки конвейера голосовых", labels=("stage",))
+voice_stage_seconds = metrics.histogram("voice_stage_seconds", "Этапы конвейера голосовых", labels=("stage",))
+voice_wait_seconds = metrics.histogram("voice_wait_seconds", "Ожидание свободного слота распознавания")
+
+MAX_BOT_API_FILE = 20 * 1024 * 1024  # getFile облачного Bot API отдаёт файлы до 20 МБ
+
+
+class VoiceError(Exception):
+    reason = "error"
+
+
+class VoiceBusy(VoiceError):
+    reason = "busy"
+
+
+class VoiceTooLarge(VoiceError):
+    reason = "too_large"
+
+
+# =========================
+# ffmpeg (в процессе пула)
+# =========================
+def ffmpeg_exe() -> Optional[str]:
+    try:
+        import imageio_ffmpeg
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    except Exception:  # нет пакета или бинарника под платформу — системный ffmpeg
+        return shutil.which("ffmpeg")
+
+
+def transcode(src: str, dst: str, timeout: float = 60.0) -> int:
+    """src -> dst 16 кГц моно (формат — по расширению dst); размер результата в байтах."""
+    exe = ffmpeg_exe()
+    if not exe:
+        raise RuntimeError("ffmpeg not found: pip install imageio-ffmpeg")
+    subprocess.run([exe, "-nostdin", "-hide_banner", "-loglevel", "error", "-y", "-i", src,
+                    "-ac", "1", "-ar", "16000", dst], check=True, capture_output=True, timeout=timeout)
+    return os.path.getsize(dst)
+
+
+# =========================
+# Движки распознавания
+# =========================
+class Transcriber(abc.ABC):
+    formats: Sequence[str] = ("wav",)  # расширения, которые движок принимает без перекодирования
+
+    @abc.abstractmethod
+    async def transcribe(self, path: str, language: Optional[str] = None) -> str:
+        ...
+
+
+class OpenAITranscriber(Transcriber):
+    formats = ("oga", "ogg", "mp3", "wav", "m4a", "webm", "flac")
+
+    def __init__(self, engine: Callable[[], object], model: str = "whisper-1"):
+        self.engine = engine  # get_openai_client: LLMEngine или None
+        self.model = model
+
+    async def transcribe(self, path: str, language: Optional[str] = None) -> str:
+        engine = self.engine()
+        if engine is None:
+            raise VoiceError("OpenAI client is not configured")
+        return await engine.transcribe(path, model=self.model, language=language)
+
+
+class StubTranscriber(Transcriber):
+    """Офлайн-заглушка для бенчмарков: фиксированный текст через delay сек."""
+
+    def __init__(self, text: str = "Тестовая расшифровка голосового сообщения.", delay: float = 0.0):
+        self.text = text
+        self.delay = delay
+
+    async def transcribe(self, path: str, language: Optional[str] = None) -> str:
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        return self.text
+
+
+def make_transcriber(kind: str, engine: Callable[[], object], model: str = "whisper-1") -> Transcriber:
+    if kind == "openai":
+        return OpenAITranscriber(engine, model)
+    if kind == "stub":
+        return StubTranscriber()
+    raise ValueError(f"unknown voice backend: {kind}")
+
+
+# =========================
+# Конвейер
+# =========================
+@contextmanager
+def _stage(name: str):
+    started = time.perf_counter()
+    try:
+        with tracing.span(f"voice.{name}"):
+            yield
+    except Exception:
+        voice_errors_total.labels(name).inc()
+        raise
+    finally:
+        voice_stage_seconds.labels(name).observe(time.perf_counter() - started)
+
+
+class VoicePipeline:
+    def __init__(self, bot, transcriber: Transcriber, concurrency: int = 4, max_pending: int = 16,
+                 max_bytes: int = MAX_BOT_API_FILE, transcode_workers: int = 2, transcode_mode: str = "auto",
+                 cache_size: int = 10000, cache_ttl: float = 86400.0, download_timeout: int = 30):
+        self.bot = bot
+        self.transcriber = transcriber
+        self.concurrency = concurrency
+        self.max_pending = max_pending
+        self.max_bytes = max_bytes
+        self.transcode_workers = transcode_workers
+        self.transcode_mode = transcode_mode  # auto — если движок не берёт формат; always; never
+        self.download_timeout = download_timeout
+        self.cache: TTLCache[str] = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._pending = 0
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def cached(self, file_unique_id: str) -> Optional[str]:
+        text = self.cache.get(file_unique_id)
+        if text is not None:
+            voice_cache_hits_total.inc()
+        return text
+
+    async def wait(self, file_unique_id: str) -> Optional[str]:
+        """Готовая расшифровка или та, что сейчас в работе; None — файла не было."""
+        text = self.cached(file_unique_id)
+        if text is not None:
+            return text
+        fut = self._inflight.get(file_unique_id)
+        return await asyncio.shield(fut) if fut is not None else None
+
+    async def transcribe(self, file_id: str, file_unique_id: str, language: Optional[str] = None) -> str:
+        text = await self.wait(file_unique_id)
+        if text is not None:
+            return text
+        if self._pending >= self.max_pending:
+            voice_rejected_total.labels("busy").inc()
+            raise VoiceBusy()
+        fut = self._inflight[file_unique_id] = asyncio.get_running_loop().create_future()
+        self._pending += 1
+        voice_pending.set(self._pending)
+        try:
+            text = await self._run(file_id, language)
+        except BaseException as e:
+            # ждущие (кнопка «Показать расшифровку») получают ошибку, а не зависают
+            fut.set_exception(e if isinstance(e, VoiceError) else VoiceError(f"{type(e).__name__}: {e}"))
+            fut.exception()
+            raise
+        else:
+            self.cache.set(file_unique_id, text)
+            fut.set_result(text)
+            return text
+        finally:
+            self._pending -= 1
+            voice_pending.set(self._pending)
+            self._inflight.pop(file_unique_id, None)
+
+    async def _run(self, file_id: str, language: Optional[str]) -> str:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.concurrency)
+        queued = time.perf_counter()
+        async with self._slots:
+            voice_wait_seconds.observe(time.perf_counter() - queued)
+            voice_active.inc()
+            try:
+                with tempfile.TemporaryDirectory(prefix="voice-") as tmp:
+                    path = await self._download(file_id, tmp)
+                    if self._needs_transcode(path):
+                        path = await self._transcode(path, os.path.join(tmp, "voice.wav"))
+                    with _stage("asr"):
+                        return (await self.transcriber.transcribe(path, language)).strip()
+            finally:
+                voice_active.dec()
+
+    async def _download(self, file_id: str, tmp: str) -> str:
+        with _stage("download"):
+            file = await self.bot.get_file(file_id)
+            if file.file_size and file.file_size > self.max_bytes:
+                voice_rejected_total.labels("too_large").inc()
+                raise VoiceTooLarge()
+            ext = os.path.splitext(file.file_path or "")[1] or ".oga"
+            dst = os.path.join(tmp, "voice" + ext)
+            await self.bot.download_file(file.file_path, destination=dst, timeout=self.download_timeout)
+            return dst
+
+    def _needs_transcode(self, path: str) -> bool:
+        if self.transcode_mode != "auto":
+            return self.transcode_mode == "always"
+        return os.path.splitext(path)[1].lstrip(".").lower() not in self.transcriber.formats
+
+    async def _transcode(self, src: str, dst: str) -> str:
+        if self._pool is None:
+            # spawn: в дочерних процессах нет потоков/loop родителя (fork из процесса с потоками небезопасен)
+            self._pool = ProcessPoolExecutor(max_workers=self.transcode_workers,
+                                             mp_context=multiprocessing.get_context("spawn"))
+        with _stage("transcode"):
+            await asyncio.get_running_loop().run_in_executor(self._pool, transcode, src, dst)
+        return dst
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
@@ -0,0 +1,81 @@
+# webhook_filter.py — быстрая предобработка вебхука Telegram до aiogram
+# Размер — по Content-Length/длине тела (413 без разбора), JSON — orjson, если установлен.
+# Тип апдейта — по ключу верхнего уровня, без валидации: типы вне allowed (edited_message,
+# channel_post, ...) подтверждаются сразу. Update.model_validate — только для того,
+# что пойдёт в обработчики.
+
+import json
+import logging
+from typing import Iterable, Optional, Tuple
+
+import metrics
+
+try:
+    import orjson
+    loads = orjson.loads
+except ImportError:  # pragma: no cover — без orjson работает и стандартный json
+    loads = json.loads
+
+logger = logging.getLogger(__name__)
+
+ignored_total = metrics.counter("webhook_ignored_total", "Апдейты неподписанных типов, ack без обработки")
+too_large_total = metrics.counter("webhook_too_large_total", "Тело больше MAX_TELEGRAM_PAYLOAD_BYTES, 413")
+invalid_total = metrics.counter("webhook_invalid_total", "Не JSON-объект с update_id, 400")
+updates_total = metrics.counter("webhook_updates_total", "Разобранные апдейты по типу", labels=("type",))
+
+# типы Bot API; прочие ключи считаются как "other" — метка не растёт от мусора в теле
+KNOWN_TYPES = frozenset((
+    "message", "edited_message", "channel_post", "edited_channel_post", "business_connection",
+    "business_message", "edited_business_message", "deleted_business_messages", "message_reaction",
+    "message_reaction_count", "inline_query", "chosen_inline_result", "callback_query", "shipping_query",
+    "pre_checkout_query", "poll", "poll_answer", "my_chat_member", "chat_member", "chat_join_request",
+    "chat_boost", "removed_chat_boost",
+))
+
+ACCEPT, IGNORE, TOO_LARGE, INVALID = "accept", "ignore", "too_large", "invalid"
+
+
+def parse_allowed(value: str) -> Optional[frozenset]:
+    """"message,callback_query" -> frozenset; пусто — все типы."""
+    kinds = frozenset(k.strip() for k in value.split(",") if k.strip())
+    return kinds or None
+
+
+def update_type(data: dict) -> Optional[str]:
+    # в апдейте ровно одно поле кроме update_id
+    for key in data:
+        if key != "update_id":
+            return key
+    return None
+
+
+class UpdateFilter:
+    def __init__(self, allowed: Optional[Iterable[str]] = None, max_bytes: int = 1 << 20):
+        self.allowed = frozenset(allowed) if allowed else None  # None — пропускать всё
+        self.max_bytes = max_bytes
+
+    def too_large(self, content_length: Optional[str]) -> bool:
+        """Проверка до чтения тела."""
+        if content_length and content_length.isdigit() and int(content_length) > self.max_bytes:
+            too_large_total.inc()
+            return True
+        return False
+
+    def parse(self, body: bytes) -> Tuple[str, Optional[dict]]:
+        """(вердикт, апдейт): данные — только при ACCEPT."""
+        if len(body) > self.max_bytes:
+            too_large_total.inc()
+            return TOO_LARGE, None
+        try:
+            data = loads(body)
+        except ValueError:
+            data = None
+        if not isinstance(data, dict) or not isinstance(data.get("update_id"), int):
+            invalid_total.inc()
+            return INVALID, None
+        kind = update_type(data)
+        updates_total.labels(kind if kind in KNOWN_TYPES else "other").inc()
+        if self.allowed is not None and kind not in self.allowed:
+            ignored_total.inc()
+            return IGNORE, None
+        return ACCEPT, data